@@ -1,13 +1,31 @@
 """Main entrypoint."""
 
+import asyncio
+import contextlib
+
 import hydra
 import lightning as L
+import torch
 from hydra.errors import ConfigCompositionException, MissingConfigException
 from lightning import LightningDataModule, LightningModule, Trainer
 from lightning.pytorch.tuner import Tuner
 from omegaconf import DictConfig, OmegaConf
 from typer import Exit, Option, Typer, echo
 
+from src.domains.audio.asr.inference import (
+    ASRInferenceModel,
+    ExportFormat,
+    export_asr_model,
+    load_asr_model,
+)
+from src.domains.audio.asr.quantization import quantize_asr_model
+from src.domains.audio.asr.serving import ASRServer
+from src.domains.audio.asr.transcription import (
+    ChunkedTranscriber,
+    find_audio_files,
+    transcribe_audio_files,
+    transcribe_long_audio_files,
+)
 from src.utils import env
 from src.utils.logger import logger
 from src.utils.train import (
@@ -103,14 +121,255 @@ def train(
 
 
 @app.command()
-def export() -> None:
-    """Export a PyTorch Lightning model to a specific format.
+def export(
+    experiment_name: str = Option(
+        ...,
+        "--experiment",
+        "-e",
+        help=(
+            "Experiment name of the model located in "
+            '"configs/experiments" folder'
+        ),
+    ),
+    checkpoint_path: str = Option(
+        ...,
+        "--checkpoint",
+        "-c",
+        help="Path to the checkpoint of the model",
+    ),
+    export_format: str | None = Option(
+        None,
+        "--format",
+        "-f",
+        help=(
+            "Format to export the model to, one of "
+            f"{[export_format.value for export_format in ExportFormat]}; "
+            "all formats by default"
+        ),
+    ),
+    output_dir: str = Option(
+        "artifacts",
+        "--output-dir",
+        "-o",
+        help="Directory to save the exported model to",
+    ),
+    quantized_engine: str | None = Option(
+        None,
+        "--quantize",
+        help=(
+            "Also export an int8 TorchScript model for the quantized engine, "
+            "e.g. x86 or qnnpack for ARM, calibrated and evaluated on "
+            "the validation data"
+        ),
+    ),
+    num_calibration_batches: int = Option(
+        16,
+        "--calibration-batches",
+        help="Number of validation batches to calibrate the int8 model on",
+    ),
+    num_evaluation_batches: int = Option(
+        16,
+        "--evaluation-batches",
+        help="Number of validation batches to compare int8 and fp32 on",
+    ),
+) -> None:
+    """Export a trained ASR model for inference."""
+    with logger.catch(reraise=True):
+        cfg = _get_cfg(f"experiments/{experiment_name}")
+        asr_model = load_asr_model(cfg, checkpoint_path)
+        transformer = hydra.utils.instantiate(
+            cfg["data"]["dataset"]["transformer"]
+        )
+        export_asr_model(
+            asr_model,
+            transformer,
+            downsize=cfg["data"]["downsize"],
+            output_dir=output_dir,
+            formats=(
+                [ExportFormat(export_format)]
+                if export_format
+                else list(ExportFormat)
+            ),
+        )
+        if quantized_engine is None:
+            return
 
-    Args:
-        model (str): Model name to export.
-        type (str): Export type.
-    """
-    raise NotImplementedError
+        logger.info(f"Instantiating datamodule <{cfg['data']['_target_']}>")
+        datamodule: LightningDataModule = hydra.utils.instantiate(cfg["data"])
+        datamodule.prepare_data()
+        datamodule.setup("validate")
+        quantize_asr_model(
+            ASRInferenceModel.from_asr_model(
+                asr_model, transformer, downsize=cfg["data"]["downsize"]
+            ),
+            asr_model.model,
+            asr_model.tokenizer,
+            datamodule.val_dataloader(),
+            sample_rate=asr_model.hparams["sample_rate"],
+            output_dir=output_dir,
+            num_calibration_batches=num_calibration_batches,
+            num_evaluation_batches=num_evaluation_batches,
+            backend=quantized_engine,
+        )
+
+
+@app.command()
+def transcribe(
+    experiment_name: str = Option(
+        ...,
+        "--experiment",
+        "-e",
+        help=(
+            "Experiment name of the model located in "
+            '"configs/experiments" folder'
+        ),
+    ),
+    checkpoint_path: str = Option(
+        ...,
+        "--checkpoint",
+        "-c",
+        help="Path to the checkpoint of the model",
+    ),
+    source: str = Option(
+        ...,
+        "--input",
+        "-i",
+        help=("Directory with audio files or a manifest with a path per line"),
+    ),
+    output_path: str = Option(
+        "transcriptions.jsonl",
+        "--output",
+        "-o",
+        help="Path to the JSON Lines file to write the transcriptions to",
+    ),
+    batch_max_duration: float = Option(
+        600.0,
+        "--batch-max-duration",
+        help="Maximum padded duration of a batch in seconds",
+    ),
+    batch_size: int | None = Option(
+        None,
+        "--batch-size",
+        help="Maximum number of audio files in a batch",
+    ),
+    num_workers: int = Option(
+        4,
+        "--num-workers",
+        help="Number of processes decoding the audio files",
+    ),
+    device: str = Option(
+        "cuda" if torch.cuda.is_available() else "cpu",
+        "--device",
+        help="Device to run the model on",
+    ),
+    chunk_duration: float | None = Option(
+        None,
+        "--chunk-duration",
+        help=(
+            "Transcribe the files one at a time in chunks of this duration "
+            "in seconds, so that memory does not grow with long files"
+        ),
+    ),
+) -> None:
+    """Transcribe audio files with a trained ASR model."""
+    with logger.catch(reraise=True):
+        cfg = _get_cfg(f"experiments/{experiment_name}")
+        asr_model = load_asr_model(cfg, checkpoint_path)
+        inference_model = ASRInferenceModel.from_asr_model(
+            asr_model,
+            hydra.utils.instantiate(cfg["data"]["dataset"]["transformer"]),
+            downsize=cfg["data"]["downsize"],
+        )
+        audio_paths = find_audio_files(source)
+        if chunk_duration:
+            transcriber = ChunkedTranscriber(
+                inference_model=inference_model,
+                tokenizer=asr_model.tokenizer,
+                sample_rate=asr_model.hparams["sample_rate"],
+                chunk_duration=chunk_duration,
+                device=device,
+            )
+            transcribe_long_audio_files(
+                transcriber, audio_paths, output_path=output_path
+            )
+            return
+
+        transcribe_audio_files(
+            inference_model,
+            asr_model.tokenizer,
+            audio_paths,
+            output_path=output_path,
+            sample_rate=asr_model.hparams["sample_rate"],
+            batch_max_duration=batch_max_duration,
+            batch_size=batch_size,
+            num_workers=num_workers,
+            device=device,
+            decoder=asr_model.decoder,
+        )
+
+
+@app.command()
+def serve(
+    experiment_name: str = Option(
+        ...,
+        "--experiment",
+        "-e",
+        help=(
+            "Experiment name of the model located in "
+            '"configs/experiments" folder'
+        ),
+    ),
+    checkpoint_path: str = Option(
+        ...,
+        "--checkpoint",
+        "-c",
+        help="Path to the checkpoint of the model",
+    ),
+    host: str = Option("127.0.0.1", "--host", help="Host to bind to"),
+    port: int = Option(8000, "--port", help="Port to bind to"),
+    max_batch_size: int = Option(
+        32,
+        "--max-batch-size",
+        help="Maximum number of requests in a batch",
+    ),
+    max_latency: float = Option(
+        0.05,
+        "--max-latency",
+        help=(
+            "Maximum time in seconds a request waits for others to be "
+            "batched with"
+        ),
+    ),
+    num_workers: int = Option(
+        4,
+        "--num-workers",
+        help="Number of threads decoding and transforming the audio",
+    ),
+    device: str = Option(
+        "cuda" if torch.cuda.is_available() else "cpu",
+        "--device",
+        help="Device to run the model on",
+    ),
+) -> None:
+    """Serve a trained ASR model over HTTP with dynamic batching."""
+    with logger.catch(reraise=True):
+        cfg = _get_cfg(f"experiments/{experiment_name}")
+        asr_model = load_asr_model(cfg, checkpoint_path)
+        server = ASRServer(
+            inference_model=ASRInferenceModel.from_asr_model(
+                asr_model,
+                hydra.utils.instantiate(cfg["data"]["dataset"]["transformer"]),
+                downsize=cfg["data"]["downsize"],
+            ),
+            tokenizer=asr_model.tokenizer,
+            sample_rate=asr_model.hparams["sample_rate"],
+            max_batch_size=max_batch_size,
+            max_latency=max_latency,
+            num_workers=num_workers,
+            device=device,
+        )
+        with contextlib.suppress(KeyboardInterrupt):
+            asyncio.run(server.serve(host, port))
 
 
 def _get_cfg(config_name: str) -> DictConfig:
@@ -2,6 +2,7 @@
 
 import math
 
+import torch
 from torch.optim import Optimizer
 from torch.optim.lr_scheduler import LRScheduler
 
@@ -10,6 +11,10 @@ class CosineAnnealingWarmupLRScheduler(LRScheduler):
     """Cosine Annealing with Warmup.
 
     Taken from https://github.com/katsura-jp/pytorch-cosine-annealing-with-warmup.
+
+    The learning rate is computed in closed form from the number of steps
+    by lr_at, so a resumed schedule starts at the right learning rate
+    without replaying the previous steps.
     """
 
     def __init__(
@@ -47,23 +52,12 @@ class CosineAnnealingWarmupLRScheduler(LRScheduler):
         self.first_cycle_steps = first_cycle_steps
         self.cycle_multiplier = cycle_multiplier
         self.base_max_lr = max_lr
-        self.max_lr = max_lr
         self.min_lr = min_lr
         self.warmup_steps = warmup_steps
         self.gamma = gamma
 
-        self.cycle = 0
-        self.cur_cycle_steps = first_cycle_steps
-        self.step_in_cycle = last_epoch
-
         super().__init__(optimizer, last_epoch)
 
-        # Set learning rate min_lr
-        self.base_lrs = []
-        for param_group in self.optimizer.param_groups:
-            param_group["lr"] = min_lr
-            self.base_lrs.append(param_group["lr"])
-
     @staticmethod
     def _check_args(
         first_cycle_steps: int,
@@ -78,6 +72,7 @@ class CosineAnnealingWarmupLRScheduler(LRScheduler):
             raise ValueError(msg)
         if cycle_multiplier <= 0:
             msg = "Cycle multiplier should be greater than 0."
+            raise ValueError(msg)
         if min_lr <= 0:
             msg = "Minimum learning rate should be greater than 0."
             raise ValueError(msg)
@@ -100,84 +95,68 @@ class CosineAnnealingWarmupLRScheduler(LRScheduler):
         Returns:
             List of learning rates for each parameter group.
         """
-        if self.step_in_cycle == -1:
-            return self.base_lrs
-        if self.step_in_cycle < self.warmup_steps:
-            return [
-                (self.max_lr - base_lr)
-                * self.step_in_cycle
-                / self.warmup_steps
-                + base_lr
-                for base_lr in self.base_lrs
-            ]
-        return [
-            base_lr
-            + (self.max_lr - base_lr)
+        lr = self.lr_at(torch.tensor(self.last_epoch)).item()
+        return [lr] * len(self.optimizer.param_groups)
+
+    # Used by step when it is given an epoch
+    _get_closed_form_lr = get_lr
+
+    def lr_at(self, steps: torch.Tensor) -> torch.Tensor:
+        """Compute the learning rate after any numbers of steps.
+
+        The lengths of the cycles are computed one after the other until
+        the last step, or until a length repeats, after which every cycle
+        has that length. Until then lengths change by at least a step, so
+        there are at most about sqrt(2 * steps) of them to compute.
+
+        Args:
+            steps: Numbers of steps from the start of the schedule.
+
+        Returns:
+            Learning rates of the same shape as steps.
+        """
+        steps = torch.as_tensor(steps, dtype=torch.float64)
+        last_step = int(steps.max()) if steps.numel() else 0
+        starts, lengths = [0], [self.first_cycle_steps]
+        while starts[-1] + lengths[-1] <= last_step:
+            length = (
+                int((lengths[-1] - self.warmup_steps) * self.cycle_multiplier)
+                + self.warmup_steps
+            )
+            starts.append(starts[-1] + lengths[-1])
+            lengths.append(length)
+            if length == lengths[-2]:
+                break
+        starts_t = torch.tensor(starts, dtype=torch.float64)
+        lengths_t = torch.tensor(lengths, dtype=torch.float64)
+
+        indices = torch.searchsorted(starts_t, steps, right=True) - 1
+        step_in_cycle = steps - starts_t[indices]
+        cycle_steps = lengths_t[indices]
+        # Cycles past the computed ones have the last length
+        extra_cycles = torch.div(
+            step_in_cycle, cycle_steps, rounding_mode="floor"
+        )
+        cycles = indices.double() + extra_cycles
+        step_in_cycle -= extra_cycles * cycle_steps
+
+        max_lr = self.base_max_lr * self.gamma**cycles
+        warmup_lr = self.min_lr + (max_lr - self.min_lr) * step_in_cycle / max(
+            self.warmup_steps, 1
+        )
+        annealing_lr = (
+            self.min_lr
+            + (max_lr - self.min_lr)
             * (
                 1
-                + math.cos(
+                + torch.cos(
                     math.pi
-                    * (self.step_in_cycle - self.warmup_steps)
-                    / (self.cur_cycle_steps - self.warmup_steps)
+                    * (step_in_cycle - self.warmup_steps)
+                    / (cycle_steps - self.warmup_steps)
                 )
             )
             / 2
-            for base_lr in self.base_lrs
-        ]
-
-    def step(self, epoch: int | None = None) -> None:
-        """Update the learning rate.
-
-        Args:
-            epoch: The index of the epoch.
-        """
-        if epoch is None:
-            epoch = self.last_epoch + 1
-            self.step_in_cycle += 1
-            if self.step_in_cycle >= self.cur_cycle_steps:
-                self.cycle += 1
-                self.step_in_cycle -= self.cur_cycle_steps
-                self.cur_cycle_steps = (
-                    int(
-                        (self.cur_cycle_steps - self.warmup_steps)
-                        * self.cycle_multiplier
-                    )
-                    + self.warmup_steps
-                )
-        elif epoch >= self.first_cycle_steps:
-            if self.cycle_multiplier == 1.0:
-                self.step_in_cycle = epoch % self.first_cycle_steps
-                self.cycle = epoch // self.first_cycle_steps
-            else:
-                n = int(
-                    math.log(
-                        (
-                            epoch
-                            / self.first_cycle_steps
-                            * (self.cycle_multiplier - 1)
-                            + 1
-                        ),
-                        self.cycle_multiplier,
-                    )
-                )
-                self.cycle = n
-                self.step_in_cycle = epoch - int(
-                    self.first_cycle_steps
-                    * (self.cycle_multiplier**n - 1)
-                    / (self.cycle_multiplier - 1)
-                )
-                self.cur_cycle_steps = (
-                    self.first_cycle_steps * self.cycle_multiplier**n
-                )
-        else:
-            self.cur_cycle_steps = self.first_cycle_steps
-            self.step_in_cycle = epoch
-
-        self.max_lr = self.base_max_lr * (self.gamma**self.cycle)
-        self.last_epoch = math.floor(epoch)
-        for param_group, lr in zip(
-            self.optimizer.param_groups,
-            self.get_lr(),
-            strict=True,
-        ):
-            param_group["lr"] = lr
+        )
+        return torch.where(
+            step_in_cycle < self.warmup_steps, warmup_lr, annealing_lr
+        )
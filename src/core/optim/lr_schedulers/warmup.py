@@ -1,11 +1,17 @@
 """Learning rate scheduler with warmup."""
 
+import torch
 from torch.optim import Optimizer
 from torch.optim.lr_scheduler import LRScheduler
 
 
 class WarmupLRScheduler(LRScheduler):
-    """Warmups learning rate until warmup_steps."""
+    """Warmups learning rate until warmup_steps.
+
+    The learning rate is computed in closed form from the number of steps
+    by lr_at, so a resumed schedule starts at the right learning rate
+    without replaying the previous steps.
+    """
 
     def __init__(
         self,
@@ -25,16 +31,12 @@ class WarmupLRScheduler(LRScheduler):
             last_epoch: The index of the last epoch.
         """
         self._check_args(initial_lr, peak_lr, warmup_steps)
-        super().__init__(optimizer, last_epoch)
-
+        # The first step in the constructor of LRScheduler needs them
         self.initial_lr = initial_lr
         self.peak_lr = peak_lr
-        self.lr = initial_lr
-
         self.warmup_steps = warmup_steps
-        self.warmup_rate = (peak_lr - initial_lr) / warmup_steps
 
-        self.step_count = 1
+        super().__init__(optimizer, last_epoch)
 
     @staticmethod
     def _check_args(
@@ -52,20 +54,31 @@ class WarmupLRScheduler(LRScheduler):
             msg = f"Invalid warmup steps: {warmup_steps}"
             raise ValueError(msg)
 
-    def step(self) -> None:
-        """Make a step in learning rate."""
-        if self.step_count <= self.warmup_steps:
-            self.lr = self.initial_lr + self.warmup_rate * self.step_count
-            for g in self.optimizer.param_groups:
-                g["lr"] = self.lr
-        self.step_count += 1
-
     def get_lr(self) -> list[float]:
-        """Get the learning rates from each parameter group.
+        """Get the learning rates for param_groups.
 
         Returns:
             Learning rates for param_groups.
         """
-        return [
-            param_group["lr"] for param_group in self.optimizer.param_groups
-        ]
+        lr = self.lr_at(torch.tensor(self.last_epoch)).item()
+        return [lr] * len(self.optimizer.param_groups)
+
+    # Used by step when it is given an epoch
+    _get_closed_form_lr = get_lr
+
+    def lr_at(self, steps: torch.Tensor) -> torch.Tensor:
+        """Compute the learning rate after any numbers of steps.
+
+        Args:
+            steps: Numbers of steps from the start of the schedule.
+
+        Returns:
+            Learning rates of the same shape as steps.
+        """
+        steps = torch.as_tensor(steps, dtype=torch.float64)
+        return (
+            self.initial_lr
+            + (self.peak_lr - self.initial_lr)
+            * steps.clamp(max=self.warmup_steps)
+            / self.warmup_steps
+        )
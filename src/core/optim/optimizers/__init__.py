@@ -1,5 +1,6 @@
 """Custom optimizers for training models."""
 
 from src.core.optim.optimizers.novograd import Novograd
+from src.core.optim.optimizers.sharded_novograd import ShardedNovograd
 
-__all__ = ["Novograd"]
+__all__ = ["Novograd", "ShardedNovograd"]
@@ -1,6 +1,7 @@
 """Implementation of NovoGrad optimizer."""
 
 import typing as tp
+from collections import defaultdict
 
 import torch
 from torch.optim import Optimizer
@@ -27,6 +28,7 @@ class Novograd(Optimizer):
         *,
         grad_averaging: bool = False,
         amsgrad: bool = False,
+        foreach: bool = False,
     ) -> None:
         """Initialize Novograd optimizer.
 
@@ -40,6 +42,8 @@ class Novograd(Optimizer):
             weight_decay: Weight decay (L2 penalty)
             grad_averaging: Whether to use grad averaging
             amsgrad: Whether to use the AMSGrad variant of this algorithm
+            foreach: Whether to update all parameters of a group at once
+                with multi-tensor operations instead of one at a time
         """
         self._check_args(lr, betas, eps, weight_decay)
         super().__init__(
@@ -51,6 +55,7 @@ class Novograd(Optimizer):
                 "weight_decay": weight_decay,
                 "grad_averaging": grad_averaging,
                 "amsgrad": amsgrad,
+                "foreach": foreach,
             },
         )
 
@@ -58,6 +63,7 @@ class Novograd(Optimizer):
         super().__setstate__(state)
         for group in self.param_groups:
             group.setdefault("amsgrad", False)
+            group.setdefault("foreach", False)
 
     @staticmethod
     def _check_args(
@@ -82,7 +88,7 @@ class Novograd(Optimizer):
             msg = f"Invalid weight_decay value: {weight_decay}"
             raise ValueError(msg)
 
-    def step(  # noqa: PLR0912, C901
+    def step(
         self,
         closure: tp.Callable[[], float] | None = None,
     ) -> float:
@@ -91,82 +97,152 @@ class Novograd(Optimizer):
         Arguments:
             closure: A closure that reevaluates the model and returns the loss
 
-        Raises:
-            RuntimeError: If the optimizer does not support sparse gradients
-
         Returns:
             Loss value
+
+        Raises:
+            RuntimeError: If the optimizer does not support sparse gradients
         """
         loss = None
         if closure is not None:
             loss = closure()
 
         for group in self.param_groups:
-            for p in group["params"]:
-                if p.grad is None:
-                    continue
-                grad = p.grad.data
-                if grad.is_sparse:
-                    msg = (
-                        "NovoGrad does not support sparse gradients, "
-                        "please consider SparseAdam instead"
-                    )
-                    raise RuntimeError(msg)
-
-                # State initialization
-                state = self.state[p]
-                if len(state) == 0:
-                    state["step"] = 0
-
-                    # Exponential moving average of gradient values
-                    state["exp_avg"] = torch.zeros_like(
-                        p.data,
-                        memory_format=torch.preserve_format,
-                    )
-
-                    # Exponential moving average of squared gradient values
-                    state["exp_avg_sq"] = torch.zeros(
-                        [],
-                        device=state["exp_avg"].device,
-                    )
-
-                    if group["amsgrad"]:
-                        # Maintains max of all exp. moving avg. of sq.
-                        # grad. values
-                        state["max_exp_avg_sq"] = torch.zeros(
-                            [],
-                            device=state["exp_avg"].device,
-                        )
-
-                exp_avg, exp_avg_sq = state["exp_avg"], state["exp_avg_sq"]
-                if group["amsgrad"]:
-                    max_exp_avg_sq = state["max_exp_avg_sq"]
+            if any(
+                p.grad is not None and p.grad.is_sparse
+                for p in group["params"]
+            ):
+                msg = (
+                    "NovoGrad does not support sparse gradients, "
+                    "please consider SparseAdam instead"
+                )
+                raise RuntimeError(msg)
+            if group["foreach"]:
+                self._step_group_foreach(group)
+            else:
+                self._step_group(group)
+
+        return loss
 
+    def _step_group(self, group: dict[str, tp.Any]) -> None:
+        for p in group["params"]:
+            if p.grad is None:
+                continue
+            grad = p.grad.data
+
+            # State initialization
+            state = self._init_state(p, group)
+
+            exp_avg, exp_avg_sq = state["exp_avg"], state["exp_avg_sq"]
+            if group["amsgrad"]:
+                max_exp_avg_sq = state["max_exp_avg_sq"]
+
+            state["step"] += 1
+
+            beta1, beta2 = group["betas"]
+            norm = torch.sum(torch.pow(grad, 2))
+            if exp_avg_sq == 0:
+                exp_avg_sq.copy_(norm)
+            else:
+                exp_avg_sq.mul_(beta2).add_(norm, alpha=1 - beta2)
+
+            if group["amsgrad"]:
+                # Maintains the maximum of all 2nd moment running avg.
+                # till now
+                torch.max(max_exp_avg_sq, exp_avg_sq, out=max_exp_avg_sq)
+                # Use the max. for normalizing running avg. of gradient
+                denom = max_exp_avg_sq.sqrt().add_(group["eps"])
+            else:
+                denom = exp_avg_sq.sqrt().add_(group["eps"])
+
+            grad.div_(denom)
+            if group["weight_decay"] != 0:
+                grad.add_(p.data, alpha=group["weight_decay"])
+            if group["grad_averaging"]:
+                grad.mul_(1 - beta1)
+            exp_avg.mul_(beta1).add_(grad)
+
+            p.data.add_(exp_avg, alpha=-group["lr"])
+
+    @torch.no_grad()
+    def _step_group_foreach(self, group: dict[str, tp.Any]) -> None:
+        """Update the parameters of a group with multi-tensor operations.
+
+        The second moments of the parameters on a device are stacked into
+        a vector, so that they are updated by a few operations and the
+        first step is detected without syncing with the host.
+        """
+        params_by_device = defaultdict(list)
+        for p in group["params"]:
+            if p.grad is None:
+                continue
+            params_by_device[p.device].append(p)
+
+        beta1, beta2 = group["betas"]
+        for device, params in params_by_device.items():
+            states = [self._init_state(p, group) for p in params]
+            for state in states:
                 state["step"] += 1
+            grads = [p.grad for p in params]
+            exp_avgs = [state["exp_avg"] for state in states]
+            exp_avg_sqs = [state["exp_avg_sq"] for state in states]
+
+            norms = torch.stack(
+                torch._foreach_norm(grads, 2, dtype=torch.float32)
+            ).square_()
+            exp_avg_sq = torch.stack(exp_avg_sqs)
+            # Zero second moments are initialized with the norms
+            exp_avg_sq = torch.where(
+                exp_avg_sq == 0,
+                norms,
+                exp_avg_sq * beta2 + norms * (1 - beta2),
+            )
+            torch._foreach_copy_(exp_avg_sqs, exp_avg_sq.unbind())
+
+            if group["amsgrad"]:
+                max_exp_avg_sqs = [state["max_exp_avg_sq"] for state in states]
+                exp_avg_sq = torch.maximum(
+                    torch.stack(max_exp_avg_sqs), exp_avg_sq
+                )
+                torch._foreach_copy_(max_exp_avg_sqs, exp_avg_sq.unbind())
+            denoms = exp_avg_sq.sqrt_().add_(group["eps"]).to(device)
+
+            torch._foreach_div_(grads, denoms.unbind())
+            if group["weight_decay"] != 0:
+                torch._foreach_add_(grads, params, alpha=group["weight_decay"])
+            if group["grad_averaging"]:
+                torch._foreach_mul_(grads, 1 - beta1)
+            torch._foreach_mul_(exp_avgs, beta1)
+            torch._foreach_add_(exp_avgs, grads)
+
+            torch._foreach_add_(params, exp_avgs, alpha=-group["lr"])
+
+    def _init_state(
+        self,
+        p: torch.Tensor,
+        group: dict[str, tp.Any],
+    ) -> dict[str, tp.Any]:
+        state = self.state[p]
+        if len(state) == 0:
+            state["step"] = 0
+
+            # Exponential moving average of gradient values
+            state["exp_avg"] = torch.zeros_like(
+                p.data,
+                memory_format=torch.preserve_format,
+            )
 
-                beta1, beta2 = group["betas"]
-                norm = torch.sum(torch.pow(grad, 2))
-                if exp_avg_sq == 0:
-                    exp_avg_sq.copy_(norm)
-                else:
-                    exp_avg_sq.mul_(beta2).add_(norm, alpha=1 - beta2)
-
-                if group["amsgrad"]:
-                    # Maintains the maximum of all 2nd moment running avg.
-                    # till now
-                    torch.max(max_exp_avg_sq, exp_avg_sq, out=max_exp_avg_sq)
-                    # Use the max. for normalizing running avg. of gradient
-                    denom = max_exp_avg_sq.sqrt().add_(group["eps"])
-                else:
-                    denom = exp_avg_sq.sqrt().add_(group["eps"])
-
-                grad.div_(denom)
-                if group["weight_decay"] != 0:
-                    grad.add_(p.data, alpha=group["weight_decay"])
-                if group["grad_averaging"]:
-                    grad.mul_(1 - beta1)
-                exp_avg.mul_(beta1).add_(grad)
-
-                p.data.add_(exp_avg, alpha=-group["lr"])
+            # Exponential moving average of squared gradient values
+            state["exp_avg_sq"] = torch.zeros(
+                [],
+                device=state["exp_avg"].device,
+            )
 
-        return loss
+            if group["amsgrad"]:
+                # Maintains max of all exp. moving avg. of sq.
+                # grad. values
+                state["max_exp_avg_sq"] = torch.zeros(
+                    [],
+                    device=state["exp_avg"].device,
+                )
+        return state
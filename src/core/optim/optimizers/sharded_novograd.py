@@ -0,0 +1,90 @@
+"""Novograd with its state sharded across distributed ranks."""
+
+import typing as tp
+
+import torch.distributed as dist
+from torch.distributed.optim import ZeroRedundancyOptimizer
+from torch.optim.optimizer import ParamsT
+
+from src.core.optim.optimizers.novograd import Novograd
+
+
+class ShardedNovograd(ZeroRedundancyOptimizer):
+    """Novograd whose state is partitioned across ranks (ZeRO stage 1).
+
+    Every parameter is owned by one rank, which keeps its Novograd state
+    and updates it, and the updated parameters are broadcast from their
+    owners after the step. Parameters are partitioned as whole tensors,
+    so the second moment of every layer is computed from its full
+    gradient as with Novograd, and the state per rank is about the full
+    state divided by the world size.
+
+    Gradients must be the same on every rank before the step, as they
+    are after the backward pass of DistributedDataParallel.
+    """
+
+    def __init__(
+        self,
+        params: ParamsT,
+        lr: float = 1e-3,
+        betas: tuple[float, float] = (0.95, 0.98),
+        eps: float = 1e-8,
+        weight_decay: float = 0,
+        *,
+        grad_averaging: bool = False,
+        amsgrad: bool = False,
+        foreach: bool = False,
+        process_group: dist.ProcessGroup | None = None,
+        parameters_as_bucket_view: bool = False,
+    ) -> None:
+        """Initialize sharded Novograd optimizer.
+
+        Args:
+            params: Iterable of parameters to optimize or dicts defining
+                parameter groups
+            lr: Learning rate
+            betas: Coefficients used for computing running averages of gradient
+                and its square
+            eps: Term added to the denominator to improve numerical stability
+            weight_decay: Weight decay (L2 penalty)
+            grad_averaging: Whether to use grad averaging
+            amsgrad: Whether to use the AMSGrad variant of this algorithm
+            foreach: Whether to update the parameters of a rank at once
+                with multi-tensor operations
+            process_group: Process group to shard the state across,
+                the default group if None
+            parameters_as_bucket_view: Whether to pack the parameters into
+                a contiguous bucket per device and rank, so that each rank
+                broadcasts one tensor instead of one per parameter
+
+        Raises:
+            RuntimeError: If the default process group is not initialized.
+        """
+        if not dist.is_initialized():
+            msg = (
+                "ShardedNovograd requires an initialized process group, "
+                "use Novograd without distributed training."
+            )
+            raise RuntimeError(msg)
+        super().__init__(
+            params,
+            optimizer_class=Novograd,
+            process_group=process_group,
+            parameters_as_bucket_view=parameters_as_bucket_view,
+            lr=lr,
+            betas=betas,
+            eps=eps,
+            weight_decay=weight_decay,
+            grad_averaging=grad_averaging,
+            amsgrad=amsgrad,
+            foreach=foreach,
+        )
+
+    @property
+    def local_state(self) -> dict[tp.Any, dict[str, tp.Any]]:
+        """State of the parameters owned by this rank.
+
+        Returns:
+            State of the local Novograd optimizer per parameter.
+        """
+        return self.optim.state
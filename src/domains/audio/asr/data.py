@@ -1,12 +1,20 @@
 """Data module for ASR model."""
 
-import math
 import typing as tp
+from collections.abc import Iterator, Sequence
+from pathlib import Path
 
+import attrs
 import lightning as L
 import torch
+import torchaudio.transforms as T
 from omegaconf import ListConfig
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, Sampler
+
+from src.domains.audio.asr.datasets.streaming import (
+    ASRStreamingDataset,
+    StreamingDataLoader,
+)
 
 if tp.TYPE_CHECKING:
     from src.domains.audio.asr.datasets import ASRDataset
@@ -15,65 +23,263 @@ if tp.TYPE_CHECKING:
 class ASRDataCollator:
     """Collator for ASR data."""
 
-    def __init__(self, downsize: int) -> None:
+    def __init__(self, downsize: int, hop_length: int | None = None) -> None:
         """Constructor.
 
         Args:
             downsize: Downsize factor for the transforms
+            hop_length: Hop length of the audio transformation. Required to
+                compute the lengths of the transforms if the samples have
+                only waveforms and the transformation runs on the device.
         """
         self.downsize = downsize
+        self.hop_length = hop_length
 
     def __call__(
         self,
         batch: list[dict[str, torch.Tensor]],
-    ) -> dict[str, torch.Tensor | list[int] | list[torch.Tensor]]:
+    ) -> dict[str, torch.Tensor | list[torch.Tensor]]:
         """Collate the batch.
 
+        Padded outputs are allocated once and filled in place, so the cost
+        of collation is linear in the batch size. If the samples have no
+        transforms, the waveforms are padded instead and the lengths of the
+        transforms are computed from the hop length, as for centered frames.
+
         Args:
             batch: Batch of data
 
         Returns:
             Collated batch
+
+        Raises:
+            ValueError: If the hop length is required but not set.
         """
-        max_tokens_length = max(x["tokens"].shape[-1] for x in batch)
-        max_transform_length = max(x["transform"].shape[-1] for x in batch)
-
-        tokens = torch.empty(size=(0, max_tokens_length))
-        tokens_lengths = []
-        transform_frequency_length = batch[0]["transform"].shape[1]
-        transforms = torch.empty(
-            size=(0, transform_frequency_length, max_transform_length),
+        tokens_lengths = torch.tensor(
+            [sample["tokens"].shape[-1] for sample in batch],
+            dtype=torch.long,
         )
-        probs_lengths = []
-        waveforms = []
-        for sample in batch:
-            tokens_padded = torch.nn.functional.pad(
-                sample["tokens"],
-                pad=(0, max_tokens_length - sample["tokens"].shape[-1]),
-            )
-            tokens = torch.cat([tokens, tokens_padded], dim=0)
-            tokens_lengths.append(sample["tokens"].shape[-1])
+        tokens = self._pad([sample["tokens"] for sample in batch])
+        collated = {"tokens": tokens, "tokens_lengths": tokens_lengths}
 
-            transforms_padded = torch.nn.functional.pad(
-                sample["transform"],
-                pad=(0, max_transform_length - sample["transform"].shape[-1]),
+        if all("transform" in sample for sample in batch):
+            transforms_lengths = torch.tensor(
+                [sample["transform"].shape[-1] for sample in batch],
+                dtype=torch.long,
             )
-            transforms = torch.cat([transforms, transforms_padded], dim=0)
-
-            probs_length = math.ceil(
-                sample["transform"].shape[-1] / self.downsize
+            collated["transforms"] = self._pad(
+                [sample["transform"] for sample in batch]
+            )
+            # Waveforms are not loaded for the transforms read from the cache
+            if all("waveform" in sample for sample in batch):
+                collated["waveforms"] = [
+                    sample["waveform"] for sample in batch
+                ]
+        else:
+            if self.hop_length is None:
+                msg = "Hop length is required to collate only waveforms."
+                raise ValueError(msg)
+            waveforms_lengths = torch.tensor(
+                [sample["waveform"].shape[-1] for sample in batch],
+                dtype=torch.long,
             )
-            probs_lengths.append(probs_length)
+            transforms_lengths = torch.div(
+                waveforms_lengths,
+                self.hop_length,
+                rounding_mode="floor",
+            ).add_(1)
+            collated["waveforms"] = self._pad(
+                [sample["waveform"] for sample in batch]
+            )
+            collated["waveforms_lengths"] = waveforms_lengths
 
-            waveforms.append(sample["waveform"])
+        collated["transforms_lengths"] = transforms_lengths
+        collated["probs_lengths"] = torch.div(
+            transforms_lengths + self.downsize - 1,
+            self.downsize,
+            rounding_mode="floor",
+        )
+        return collated
+
+    @staticmethod
+    def _pad(tensors: list[torch.Tensor]) -> torch.Tensor:
+        """Pad tensors of shape (1, ..., T) to a tensor of shape (B, ..., T).
+
+        Args:
+            tensors: Tensors with the time dimension last
+
+        Returns:
+            Zero-padded batch of tensors
+        """
+        padded = torch.zeros(
+            size=(
+                len(tensors),
+                *tensors[0].shape[1:-1],
+                max(tensor.shape[-1] for tensor in tensors),
+            ),
+            dtype=tensors[0].dtype,
+        )
+        for i, tensor in enumerate(tensors):
+            padded[i, ..., : tensor.shape[-1]] = tensor[0]
+        return padded
 
-        return {
-            "tokens": tokens,
-            "tokens_lengths": tokens_lengths,
-            "transforms": transforms,
-            "probs_lengths": probs_lengths,
-            "waveforms": waveforms,
-        }
+
+class DurationBatchSampler(Sampler[list[int]]):
+    """Batch sampler that groups samples of similar duration.
+
+    Samples are split into buckets of equal size by duration and batched
+    within a bucket, so that the padded duration of a batch (its size times
+    its longest sample) stays under the budget. Buckets are filled in
+    a random order and batches are shuffled every epoch, which makes the
+    batches deterministic for a given seed and epoch. The epoch is only
+    changed by set_epoch, which Lightning calls before every epoch through
+    the sampler attribute of batch samplers.
+
+    In a distributed setup every rank builds the same batches and takes
+    every num_replicas-th of them, so all ranks get the same number of
+    batches. Lightning's distributed sampler must be disabled with
+    use_distributed_sampler=False in this case.
+    """
+
+    def __init__(
+        self,
+        durations: Sequence[float],
+        max_duration: float,
+        *,
+        num_buckets: int = 10,
+        max_batch_size: int | None = None,
+        shuffle: bool = True,
+        drop_last: bool = False,
+        seed: int = 0,
+        epoch: int = 0,
+        num_replicas: int = 1,
+        rank: int = 0,
+    ) -> None:
+        """Constructor.
+
+        Args:
+            durations: Duration of every sample in the dataset
+            max_duration: Maximum padded duration of a batch in seconds
+            num_buckets: Number of duration buckets
+            max_batch_size: Maximum number of samples in a batch
+            shuffle: Whether to shuffle the samples and batches
+            drop_last: Whether to drop the tail of batches that can't be
+                evenly split across replicas instead of repeating batches
+            seed: Seed for shuffling
+            epoch: Epoch to start from
+            num_replicas: Number of processes in distributed training
+            rank: Rank of the current process
+        """
+        self._check_args(max_duration, num_buckets, num_replicas, rank)
+        self.durations = torch.as_tensor(durations, dtype=torch.float64)
+        self.max_duration = max_duration
+        self.num_buckets = min(num_buckets, max(len(durations), 1))
+        self.max_batch_size = max_batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.seed = seed
+        self.epoch = epoch
+        self.num_replicas = num_replicas
+        self.rank = rank
+
+        sorted_indices = torch.argsort(self.durations, stable=True)
+        self._buckets = torch.empty_like(sorted_indices)
+        self._buckets[sorted_indices] = (
+            torch.arange(len(durations)) * self.num_buckets // len(durations)
+        )
+        self._batches: tuple[int, list[list[int]]] | None = None
+
+    @staticmethod
+    def _check_args(
+        max_duration: float,
+        num_buckets: int,
+        num_replicas: int,
+        rank: int,
+    ) -> None:
+        if max_duration <= 0:
+            msg = f"Invalid max duration: {max_duration}"
+            raise ValueError(msg)
+        if num_buckets <= 0:
+            msg = f"Invalid number of buckets: {num_buckets}"
+            raise ValueError(msg)
+        if not 0 <= rank < num_replicas:
+            msg = f"Invalid rank {rank} for {num_replicas} replicas"
+            raise ValueError(msg)
+
+    @property
+    def sampler(self) -> "DurationBatchSampler":
+        """Sampler whose epoch Lightning sets, the batch sampler itself."""
+        return self
+
+    def set_epoch(self, epoch: int) -> None:
+        """Set the epoch used to seed the shuffling.
+
+        Args:
+            epoch: Epoch number.
+        """
+        self.epoch = epoch
+
+    def __iter__(self) -> Iterator[list[int]]:
+        return iter(self._get_batches())
+
+    def __len__(self) -> int:
+        return len(self._get_batches())
+
+    def _get_batches(self) -> list[list[int]]:
+        if self._batches is not None and self._batches[0] == self.epoch:
+            return self._batches[1]
+
+        if self.shuffle:
+            generator = torch.Generator().manual_seed(self.seed + self.epoch)
+            order = torch.randperm(len(self.durations), generator=generator)
+        else:
+            order = torch.arange(len(self.durations))
+
+        batches = []
+        for bucket in range(self.num_buckets):
+            indices = order[self._buckets[order] == bucket]
+            batches.extend(self._split_bucket(indices))
+
+        if self.shuffle:
+            permutation = torch.randperm(len(batches), generator=generator)
+            batches = [batches[i] for i in permutation.tolist()]
+
+        if len(batches) % self.num_replicas != 0:
+            if self.drop_last:
+                batches = batches[
+                    : len(batches) - len(batches) % self.num_replicas
+                ]
+            else:
+                n_missing = (
+                    self.num_replicas - len(batches) % self.num_replicas
+                )
+                batches += batches[:n_missing]
+        batches = batches[self.rank :: self.num_replicas]
+
+        self._batches = (self.epoch, batches)
+        return batches
+
+    def _split_bucket(self, indices: torch.Tensor) -> list[list[int]]:
+        batches = []
+        batch: list[int] = []
+        batch_duration = 0.0
+        for idx, duration in zip(
+            indices.tolist(),
+            self.durations[indices].tolist(),
+            strict=True,
+        ):
+            padded_duration = (len(batch) + 1) * max(batch_duration, duration)
+            if batch and (
+                padded_duration > self.max_duration
+                or len(batch) == self.max_batch_size
+            ):
+                batches.append(batch)
+                batch, batch_duration = [], 0.0
+            batch.append(idx)
+            batch_duration = max(batch_duration, duration)
+        if batch:
+            batches.append(batch)
+        return batches
 
 
 class ASRData(L.LightningDataModule):
@@ -88,6 +294,13 @@ class ASRData(L.LightningDataModule):
         pin_memory: bool = False,
         persistent_workers: bool = False,
         downsize: int = 2,
+        batch_max_duration: float | None = None,
+        batch_num_buckets: int = 10,
+        seed: int | None = None,
+        shards_dir: str | None = None,
+        shards_max_size: int = 2**28,
+        shards_store_features: bool = False,
+        shuffle_buffer_size: int = 1000,
     ) -> None:
         """Constructor.
 
@@ -98,13 +311,31 @@ class ASRData(L.LightningDataModule):
             pin_memory: Whether to pin memory for the dataloaders
             persistent_workers: Whether to use persistent workers
             downsize: Downsize factor for the transforms
+            batch_max_duration: Maximum padded duration of a batch in seconds.
+                If set, batches are bucketed by duration and batch_size
+                caps the number of samples in a batch.
+            batch_num_buckets: Number of duration buckets
+            seed: Seed for shuffling the duration buckets, 0 if not set
+            shards_dir: Directory to pack the stages of the dataset into
+                tar shards in. If set, the samples are streamed from the
+                shards instead of read from the audio files.
+            shards_max_size: Size in bytes after which a new shard is started
+            shards_store_features: Whether to store the transformed audio in
+                the shards instead of the audio files
+            shuffle_buffer_size: Number of samples to shuffle the streamed
+                samples in
         """
         super().__init__()
         self.save_hyperparameters()
+        self._resume_position: dict[str, int] = {}
 
     def prepare_data(self) -> None:
         """Download and save the datasets to disk with a single process.
 
+        If the dataset has a feature cache directory, the transformed audio
+        of all stages is cached as well. If the shards directory is set,
+        every stage is packed into shards.
+
         Note:
             Downloading and saving data with multiple processes will result in
             corrupted data. Lightning ensures the prepare_data() is called only
@@ -123,6 +354,24 @@ class ASRData(L.LightningDataModule):
         """
         dataset: ASRDataset = self.hparams["dataset"]
         dataset.download()
+        if (
+            dataset.feature_cache_dir is None
+            and self.hparams["shards_dir"] is None
+        ):
+            return
+
+        for stage in ("train", "val", "test"):
+            stage_data = attrs.evolve(dataset).setup(stage)
+            if dataset.feature_cache_dir is not None:
+                stage_data.cache_features(
+                    num_workers=self.hparams["num_workers"],
+                )
+            if self.hparams["shards_dir"] is not None:
+                stage_data.write_shards(
+                    Path(self.hparams["shards_dir"], stage),
+                    shard_max_size=self.hparams["shards_max_size"],
+                    store_features=self.hparams["shards_store_features"],
+                )
 
     def setup(self, stage: tp.Literal["fit", "validate", "test"]) -> None:
         """Setup the datasets on every GPU.
@@ -140,22 +389,59 @@ class ASRData(L.LightningDataModule):
             Setting state here is recommended.
 
         Raises:
-            ValueError: If the stage is invalid.
+            ValueError: If the stage is invalid, or if batches are bucketed
+                by duration while Lightning replaces the samplers.
 
         Args:
             stage: Stage of experiment (fit, validate, test, predict).
         """
-        dataset: ASRDataset = self.hparams["dataset"]
+        if (
+            self.hparams["batch_max_duration"] is not None
+            and self.trainer is not None
+            and self.trainer.world_size > 1
+            and self.trainer._accelerator_connector.use_distributed_sampler
+        ):
+            # DurationBatchSampler shards the batches across ranks itself
+            msg = (
+                "Batching by duration with multiple processes requires "
+                "trainer.use_distributed_sampler=false."
+            )
+            raise ValueError(msg)
+
         match stage:
             case "fit":
-                self._train_data = dataset.setup("train")
-                self._val_data = dataset.setup("val")
+                self._train_data = self._get_dataset("train")
+                self._val_data = self._get_dataset("val")
+            case "validate":
+                self._val_data = self._get_dataset("val")
             case "test":
-                self._test_data = dataset.setup("test")
+                self._test_data = self._get_dataset("test")
             case _:
                 msg = f"Invalid stage: {stage}"
                 raise ValueError(msg)
 
+    def state_dict(self) -> dict[str, tp.Any]:
+        """Save the position of the training in the current epoch.
+
+        Returns:
+            Epoch and number of its batches consumed by the rank.
+        """
+        if self.trainer is None:
+            return {}
+        batch_progress = self.trainer.fit_loop.epoch_loop.batch_progress
+        return {
+            "epoch": self.trainer.current_epoch,
+            "num_batches": batch_progress.current.completed,
+        }
+
+    def load_state_dict(self, state_dict: dict[str, tp.Any]) -> None:
+        """Restore the position of the training to resume streaming from.
+
+        Args:
+            state_dict: State saved by state_dict.
+        """
+        self._resume_position = state_dict
+
     def teardown(self, stage: tp.Literal["fit", "validate", "test"]) -> None:
         """Cleanup the state after the experiment.
 
@@ -170,14 +456,10 @@ class ASRData(L.LightningDataModule):
         Returns:
             DataLoader: Train dataloader.
         """
-        return DataLoader(
-            dataset=self._train_data,
-            batch_size=self.hparams["batch_size"],
+        return self._get_dataloader(
+            self._train_data,
             shuffle=True,
-            num_workers=self.hparams["num_workers"],
-            collate_fn=ASRDataCollator(self.hparams["downsize"]),
-            pin_memory=self.hparams["pin_memory"],
-            persistent_workers=self.hparams["persistent_workers"],
+            resume=True,
         )
 
     def val_dataloader(self) -> DataLoader:
@@ -186,15 +468,7 @@ class ASRData(L.LightningDataModule):
         Returns:
             DataLoader: Validation dataloader.
         """
-        return DataLoader(
-            dataset=self._val_data,
-            batch_size=self.hparams["batch_size"],
-            shuffle=False,
-            num_workers=self.hparams["num_workers"],
-            collate_fn=ASRDataCollator(self.hparams["downsize"]),
-            pin_memory=self.hparams["pin_memory"],
-            persistent_workers=self.hparams["persistent_workers"],
-        )
+        return self._get_dataloader(self._val_data, shuffle=False)
 
     def test_dataloader(self) -> DataLoader:
         """Return the test dataloader.
@@ -202,12 +476,98 @@ class ASRData(L.LightningDataModule):
         Returns:
             DataLoader: Test dataloader.
         """
-        return DataLoader(
-            dataset=self._test_data,
+        return self._get_dataloader(self._test_data, shuffle=False)
+
+    def _get_dataset(
+        self,
+        stage: tp.Literal["train", "val", "test"],
+    ) -> "ASRDataset | ASRStreamingDataset":
+        dataset = attrs.evolve(self.hparams["dataset"]).setup(stage)
+        if self.hparams["shards_dir"] is None:
+            return dataset
+        return ASRStreamingDataset(
+            source=dataset,
+            shards_dir=Path(self.hparams["shards_dir"], stage),
+            shuffle=stage == "train",
+            shuffle_buffer_size=self.hparams["shuffle_buffer_size"],
+            seed=self.hparams["seed"] or 0,
+        )
+
+    def _get_dataloader(
+        self,
+        dataset: "ASRDataset | ASRStreamingDataset",
+        *,
+        shuffle: bool,
+        resume: bool = False,
+    ) -> DataLoader:
+        kwargs = {
+            "num_workers": self.hparams["num_workers"],
+            "collate_fn": self._get_collator(),
+            "pin_memory": self.hparams["pin_memory"],
+            "persistent_workers": self.hparams["persistent_workers"],
+        }
+        if not isinstance(dataset, ASRStreamingDataset):
+            return DataLoader(
+                dataset=dataset,
+                **kwargs,
+                **self._get_batching_kwargs(dataset, shuffle=shuffle),
+            )
+
+        if self.hparams["batch_max_duration"] is not None:
+            msg = "Batching by duration is not supported for streaming."
+            raise ValueError(msg)
+        epoch = self.trainer.current_epoch if self.trainer else 0
+        num_batches = 0
+        if resume and self._resume_position.get("epoch") == epoch:
+            num_batches = self._resume_position["num_batches"]
+        return StreamingDataLoader(
+            dataset,
+            epoch=epoch,
+            num_batches=num_batches,
             batch_size=self.hparams["batch_size"],
-            shuffle=False,
-            num_workers=self.hparams["num_workers"],
-            collate_fn=ASRDataCollator(self.hparams["downsize"]),
-            pin_memory=self.hparams["pin_memory"],
-            persistent_workers=self.hparams["persistent_workers"],
+            **kwargs,
+        )
+
+    def _get_collator(self) -> ASRDataCollator:
+        dataset: ASRDataset = self.hparams["dataset"]
+        if not dataset.transform_on_device:
+            return ASRDataCollator(self.hparams["downsize"])
+
+        spectrogram = next(
+            module
+            for module in dataset.transformer.modules()
+            if isinstance(module, T.Spectrogram)
+        )
+        if not spectrogram.center:
+            msg = "Only centered frames can be transformed on the device."
+            raise ValueError(msg)
+        return ASRDataCollator(
+            self.hparams["downsize"],
+            hop_length=spectrogram.hop_length,
         )
+
+    def _get_batching_kwargs(
+        self,
+        dataset: "ASRDataset",
+        *,
+        shuffle: bool,
+    ) -> dict[str, tp.Any]:
+        if self.hparams["batch_max_duration"] is None:
+            return {
+                "batch_size": self.hparams["batch_size"],
+                "shuffle": shuffle,
+            }
+
+        return {
+            "batch_sampler": DurationBatchSampler(
+                dataset.durations,
+                max_duration=self.hparams["batch_max_duration"],
+                num_buckets=self.hparams["batch_num_buckets"],
+                max_batch_size=self.hparams["batch_size"],
+                shuffle=shuffle,
+                seed=self.hparams["seed"] or 0,
+                epoch=self.trainer.current_epoch if self.trainer else 0,
+                num_replicas=self.trainer.world_size if self.trainer else 1,
+                rank=self.trainer.global_rank if self.trainer else 0,
+            )
+        }
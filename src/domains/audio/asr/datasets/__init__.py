@@ -3,5 +3,11 @@
 from src.domains.audio.asr.datasets.base import ASRDataset
 from src.domains.audio.asr.datasets.libri import LibriSpeechDataset
 from src.domains.audio.asr.datasets.lj import LJSpeechDataset
+from src.domains.audio.asr.datasets.streaming import ASRStreamingDataset
 
-__all__ = ["ASRDataset", "LJSpeechDataset", "LibriSpeechDataset"]
+__all__ = [
+    "ASRDataset",
+    "ASRStreamingDataset",
+    "LJSpeechDataset",
+    "LibriSpeechDataset",
+]
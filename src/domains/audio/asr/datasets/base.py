@@ -1,17 +1,25 @@
 """Base module for ASR datasets."""
 
+import hashlib
 import random
 import typing as tp
 from abc import ABC, abstractmethod
+from pathlib import Path
 
 import pandera.polars as pa
 import polars as pl
+import torch
 import torchaudio.transforms as T
-from attrs import define, field
+from attrs import converters, define, field
 from loguru import logger
 from pandera.typing import Series
 from torch.utils.data import Dataset
 
+from src.domains.audio.asr.datasets.cache import (
+    FeatureCache,
+    hash_transformer,
+)
+from src.domains.audio.asr.datasets.shards import ShardWriter
 from src.domains.audio.dsp.audio import load_waveform
 from src.domains.audio.dsp.augmentation import AudioAugmenter
 from src.domains.common.preprocessing.tokenizers import TextTokenizer
@@ -19,9 +27,6 @@ from src.domains.common.preprocessing.tokenizers import TextTokenizer
 Transformer = T.Spectrogram | T.MelSpectrogram | T.MFCC | T.LFCC
 
 
-# 1. Make streaming dataset?
-#   Huggingface or https://lightning.ai/lightning-ai/studios/convert-parquets-to-lightning-streaming
-# 2. Some processing on GPU?
 class ASRDataSchema(pa.DataFrameModel):
     """Schema for ASR data."""
 
@@ -49,8 +54,20 @@ class ASRDataset(Dataset, ABC):
         transformer (Transformer): Audio transformation.
         text_max_length (int): Maximum length of text.
         audio_max_duration (int): Maximum duration of audio.
+        audio_min_duration (float): Minimum duration of audio.
+        text_min_chars_per_second (float): Minimum ratio of text length to
+            audio duration. Lower ratios usually mean truncated transcripts.
+        text_max_chars_per_second (float): Maximum ratio of text length to
+            audio duration. Higher ratios usually mean truncated audio.
         audio_sample_rate (int): Sample rate in Hz.
         audio_aug_prob (float): Probability of audio augmentation.
+        feature_cache_dir (str, Path): Directory to cache the transformed
+            audio in. If set, the cached features are used for the samples
+            that are not augmented.
+        transform_on_device (bool): Whether to return only the waveforms and
+            leave the audio transformation to the model, which computes it
+            for the whole batch on the accelerator. The feature cache is not
+            used in this case.
     """
 
     tokenizer: TextTokenizer = field(repr=False)
@@ -59,10 +76,23 @@ class ASRDataset(Dataset, ABC):
 
     text_max_length: int | None = field(default=None)
     audio_max_duration: int | None = field(default=None)
+    audio_min_duration: float | None = field(default=None)
+    text_min_chars_per_second: float | None = field(default=None)
+    text_max_chars_per_second: float | None = field(default=None)
     audio_sample_rate: int = field(default=22050)
     audio_aug_prob: float = field(default=0.0)
+    feature_cache_dir: Path | None = field(
+        default=None,
+        converter=converters.optional(Path),
+    )
+    transform_on_device: bool = field(default=False)
 
     _data: pl.DataFrame = field(default=None, init=False, repr=False)
+    _feature_cache: FeatureCache | None = field(
+        default=None,
+        init=False,
+        repr=False,
+    )
 
     @abstractmethod
     def download(self) -> None:
@@ -99,21 +129,68 @@ class ASRDataset(Dataset, ABC):
 
         Returns:
             dict[str, tp.Any]: A dictionary containing the waveform,
-                transformed audio, and encoded text.
+                transformed audio, and encoded text. The waveform is
+                missing if the transformed audio is read from the cache,
+                and the transformed audio is missing if it is computed
+                on the device.
         """
         audio_path, _, text = self._data.row(idx)
+        tokens = self.tokenizer.encode(text)
+        augment = random.random() < self.audio_aug_prob
+
+        feature_cache = self._get_feature_cache()
+        if (
+            feature_cache is not None
+            and not augment
+            and not self.transform_on_device
+        ):
+            transform = feature_cache.get(audio_path)
+            if transform is not None:
+                return {"transform": transform, "tokens": tokens}
+
         waveform = load_waveform(
             audio_path,
             sample_rate=self.audio_sample_rate,
         )
-        if random.random() < self.audio_aug_prob:
+        return self.make_sample(waveform, tokens, augment=augment)
+
+    def make_sample(
+        self,
+        waveform: torch.Tensor,
+        tokens: torch.Tensor,
+        *,
+        augment: bool = False,
+    ) -> dict[str, tp.Any]:
+        """Augment and transform a waveform into a sample of the dataset.
+
+        Args:
+            waveform (torch.Tensor): Digital audio signal.
+            tokens (torch.Tensor): Encoded text.
+            augment (bool): Whether to augment the waveform.
+
+        Returns:
+            dict[str, tp.Any]: A dictionary containing the waveform,
+                transformed audio, and encoded text.
+        """
+        if augment:
             waveform = self.augmenter(waveform)
+        if self.transform_on_device:
+            return {"waveform": waveform, "tokens": tokens}
         return {
             "waveform": waveform,
             "transform": self.transformer(waveform),
-            "tokens": self.tokenizer.encode(text),
+            "tokens": tokens,
         }
 
+    @property
+    def durations(self) -> list[float]:
+        """Durations of the audio in seconds in the order of the dataset.
+
+        Returns:
+            list[float]: Audio durations.
+        """
+        return self._data.get_column("audio_duration").to_list()
+
     def __len__(self) -> int:
         """Get the length of the dataset.
 
@@ -122,58 +199,170 @@ class ASRDataset(Dataset, ABC):
         """
         return len(self._data)
 
+    def cache_features(self, num_workers: int = 0) -> None:
+        """Compute and cache the transformed audio of the dataset.
+
+        Args:
+            num_workers (int): Number of processes decoding the audio.
+
+        Raises:
+            ValueError: If the feature cache directory is not set.
+        """
+        feature_cache = self._get_feature_cache()
+        if feature_cache is None:
+            msg = "Feature cache directory is not set."
+            raise ValueError(msg)
+        feature_cache.build(
+            self._data.get_column("audio_path").to_list(),
+            num_workers=num_workers,
+        )
+
+    def write_shards(
+        self,
+        output_dir: str | Path,
+        *,
+        shard_max_size: int = 2**28,
+        store_features: bool = False,
+    ) -> None:
+        """Pack the samples of the dataset into sequential tar shards.
+
+        Samples are written in a random order, so that a shard is a random
+        subset of the dataset. The shards are not rewritten if they exist
+        for the same samples, stored the same way, i.e. as audio or as
+        features of the same transformer.
+
+        Args:
+            output_dir (str, Path): Directory to write the shards to.
+            shard_max_size (int): Size in bytes after which a new shard is
+                started.
+            store_features (bool): Whether to store the transformed audio
+                (read from the feature cache if possible) instead of the
+                audio files.
+        """
+        writer = ShardWriter(
+            output_dir=output_dir,
+            shard_max_size=shard_max_size,
+            key=self._hash_shards(store_features=store_features),
+        )
+        if writer.is_complete:
+            logger.info(f"Shards in '{writer.output_dir}' already exist.")
+            return
+
+        feature_cache = self._get_feature_cache()
+        rows = self._data.sample(fraction=1.0, shuffle=True, seed=0)
+        for idx, (audio_path, audio_duration, text) in enumerate(
+            rows.iter_rows()
+        ):
+            key = f"{idx:09d}"
+            if not store_features:
+                writer.write(key, text, audio_duration, audio_path=audio_path)
+                continue
+
+            transform = (
+                feature_cache.get(audio_path)
+                if feature_cache is not None
+                else None
+            )
+            if transform is None:
+                with torch.inference_mode():
+                    transform = self.transformer(
+                        load_waveform(
+                            audio_path,
+                            sample_rate=self.audio_sample_rate,
+                        )
+                    )
+            writer.write(key, text, audio_duration, transform=transform)
+        writer.close()
+
     def finalize_data(self) -> None:
         """Finalize the dataset by validating, filtering, and sorting data."""
         self._validate_data()
         self._filter_data()
         self._sort_data()
 
+    def _hash_shards(self, *, store_features: bool) -> str:
+        digest = hashlib.sha256(
+            self._data.select("audio_path", "audio_duration", "text")
+            .write_csv()
+            .encode()
+        )
+        # Features depend on the transformer, unlike audio files
+        digest.update(
+            hash_transformer(self.transformer, self.audio_sample_rate).encode()
+            if store_features
+            else b"audio"
+        )
+        return digest.hexdigest()[:16]
+
+    def _get_feature_cache(self) -> FeatureCache | None:
+        if self.feature_cache_dir is not None and self._feature_cache is None:
+            self._feature_cache = FeatureCache(
+                cache_dir=self.feature_cache_dir,
+                transformer=self.transformer,
+                sample_rate=self.audio_sample_rate,
+            )
+        return self._feature_cache
+
     def _validate_data(self) -> None:
         """Validate the dataset to ensure it conforms to the schema."""
         ASRDataSchema.validate(self._data)
 
     def _filter_data(self) -> None:
-        """Filter the dataset based on text length and audio duration."""
-        filtered_data = self._data.clone()
+        """Filter the dataset based on text length and audio duration.
+
+        The filters are evaluated as boolean columns in a single pass over
+        the data, so that the share of records excluded by each of them is
+        reported without re-scanning or joining the data.
+        """
+        text_length = pl.col("text").str.len_chars()
+        audio_duration = pl.col("audio_duration")
+        chars_per_second = text_length / audio_duration
+
+        filters = {}
         if self.text_max_length is not None:
-            text_filtered = self._data.filter(
-                self._data.get_column("text")
-                .map_elements(len, return_dtype=pl.Int64)
-                .le(self.text_max_length)
+            filters[f"longer than {self.text_max_length} characters"] = (
+                text_length <= self.text_max_length
             )
-            percentage_filtered = 1 - len(text_filtered) / len(self._data)
-            logger.info(
-                f"{percentage_filtered:.2%} of valid records are longer than "
-                f"{self.text_max_length} characters."
+        if self.audio_max_duration is not None:
+            filters[f"longer than {self.audio_max_duration} seconds"] = (
+                audio_duration <= self.audio_max_duration
             )
-            filtered_data = filtered_data.join(
-                text_filtered,
-                on=["audio_path", "audio_duration", "text"],
-                how="inner",
+        if self.audio_min_duration is not None:
+            filters[f"shorter than {self.audio_min_duration} seconds"] = (
+                audio_duration >= self.audio_min_duration
             )
+        if self.text_min_chars_per_second is not None:
+            filters[
+                f"below {self.text_min_chars_per_second} characters per second"
+            ] = chars_per_second >= self.text_min_chars_per_second
+        if self.text_max_chars_per_second is not None:
+            filters[
+                f"above {self.text_max_chars_per_second} characters per second"
+            ] = chars_per_second <= self.text_max_chars_per_second
 
-        if self.audio_max_duration is not None:
-            audio_filtered = self._data.filter(
-                self._data.get_column("audio_duration").le(
-                    self.audio_max_duration
-                )
+        masks = [f"_filter_{i}" for i in range(len(filters))]
+        data = (
+            self._data.lazy()
+            .with_columns(
+                mask.alias(name)
+                for name, mask in zip(masks, filters.values(), strict=True)
             )
-            percentage_filtered = 1 - len(audio_filtered) / len(self._data)
+            .with_columns(_keep=pl.all_horizontal(pl.lit(value=True), *masks))
+            .collect()
+        )
+        stats = data.select(
+            pl.col(*masks, "_keep").not_().sum().truediv(max(len(data), 1))
+        ).row(0)
+
+        for description, percentage_filtered in zip(
+            filters, stats[:-1], strict=True
+        ):
             logger.info(
-                f"{percentage_filtered:.2%} of valid records are longer than "
-                f"{self.audio_max_duration} seconds."
+                f"{percentage_filtered:.2%} of valid records are "
+                f"{description}."
             )
-            filtered_data = filtered_data.join(
-                audio_filtered,
-                on=["audio_path", "audio_duration", "text"],
-                how="inner",
-            )
-
-        percentage_filtered = 1 - len(filtered_data) / len(self._data)
-        logger.info(
-            f"{percentage_filtered:.2%} of valid records are excluded."
-        )
-        self._data = filtered_data
+        logger.info(f"{stats[-1]:.2%} of valid records are excluded.")
+        self._data = data.filter("_keep").select(self._data.columns)
 
     def _sort_data(self) -> None:
         """Sort the dataset by audio duration."""
@@ -0,0 +1,220 @@
+"""Offline cache of audio features in memory-mapped shards."""
+
+import hashlib
+from collections.abc import Sequence
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+import torch
+from attrs import define, field
+from loguru import logger
+from torch.utils.data import DataLoader, Dataset
+
+from src.domains.audio.dsp.audio import load_waveform
+
+INDEX_FILENAME = "index.parquet"
+
+
+def hash_transformer(transformer: torch.nn.Module, sample_rate: int) -> str:
+    """Hash the configuration of an audio transformation.
+
+    The hash covers the public scalar attributes and the buffers (windows,
+    filterbanks, etc.) of the transformer and all of its submodules.
+
+    Args:
+        transformer: Audio transformation.
+        sample_rate: Sample rate the audio is resampled to.
+
+    Returns:
+        Hex digest of the configuration.
+    """
+    digest = hashlib.sha256(str(sample_rate).encode())
+    for name, module in transformer.named_modules():
+        config = {
+            key: value
+            for key, value in sorted(vars(module).items())
+            if not key.startswith("_")
+            and isinstance(value, bool | int | float | str | None)
+        }
+        digest.update(f"{name}:{type(module).__name__}:{config}".encode())
+    for name, buffer in transformer.state_dict().items():
+        digest.update(name.encode())
+        digest.update(buffer.detach().cpu().numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+@define(kw_only=True)
+class _FeatureExtractor(Dataset):
+    """Decode audio files and compute their features."""
+
+    audio_paths: Sequence[str] = field()
+    transformer: torch.nn.Module = field()
+    sample_rate: int = field()
+
+    def __getitem__(self, idx: int) -> tuple[str, torch.Tensor]:
+        waveform = load_waveform(
+            self.audio_paths[idx],
+            sample_rate=self.sample_rate,
+        )
+        with torch.inference_mode():
+            transform = self.transformer(waveform)
+        return self.audio_paths[idx], transform[0].T.contiguous()
+
+    def __len__(self) -> int:
+        return len(self.audio_paths)
+
+
+@define(kw_only=True)
+class FeatureCache:
+    """Memory-mapped cache of audio features.
+
+    Features are stored in .npy shards of shape (n_frames, n_features),
+    so that features of every audio file form a contiguous block which is
+    memory-mapped without a copy. The index maps an audio path to the shard,
+    the offset and the number of frames. Features of different transformers
+    are kept in different directories named after the transformer hash.
+
+    Attributes:
+        cache_dir (Path): Root directory of the cache.
+        transformer (Transformer): Audio transformation to cache.
+        sample_rate (int): Sample rate the audio is resampled to.
+        shard_frames (int): Minimum number of frames in a shard.
+    """
+
+    cache_dir: Path = field(converter=Path)
+    transformer: torch.nn.Module = field(repr=False)
+    sample_rate: int = field()
+    shard_frames: int = field(default=2**20)
+
+    _path: Path = field(init=False, repr=False)
+    _index: dict[str, tuple[int, int, int]] | None = field(
+        default=None,
+        init=False,
+        repr=False,
+    )
+    _shards: dict[int, np.ndarray] = field(
+        factory=dict,
+        init=False,
+        repr=False,
+    )
+
+    def __attrs_post_init__(self) -> None:
+        self._path = self.cache_dir.joinpath(
+            hash_transformer(self.transformer, self.sample_rate)
+        )
+
+    @property
+    def path(self) -> Path:
+        """Directory with the features of the current transformer.
+
+        Returns:
+            Path: Cache directory.
+        """
+        return self._path
+
+    def __contains__(self, audio_path: str) -> bool:
+        return audio_path in self._get_index()
+
+    def __len__(self) -> int:
+        return len(self._get_index())
+
+    def get(self, audio_path: str) -> torch.Tensor | None:
+        """Get the cached features of an audio file.
+
+        Args:
+            audio_path: Path to the audio file.
+
+        Returns:
+            Features of shape (1, n_features, n_frames) sharing memory with
+            the shard, or None if the audio file is not cached.
+        """
+        location = self._get_index().get(audio_path)
+        if location is None:
+            return None
+
+        shard_id, offset, length = location
+        if shard_id not in self._shards:
+            # Copy-on-write mapping gives writable arrays without reading
+            # the shard into memory
+            self._shards[shard_id] = np.load(
+                self._get_shard_path(shard_id),
+                mmap_mode="c",
+            )
+        features = self._shards[shard_id][offset : offset + length]
+        return torch.from_numpy(features).T.unsqueeze(0)
+
+    def build(self, audio_paths: Sequence[str], num_workers: int = 0) -> None:
+        """Compute and save features of the audio files that are not cached.
+
+        Args:
+            audio_paths: Paths to the audio files.
+            num_workers: Number of processes decoding the audio files.
+        """
+        index = self._read_index()
+        missing_paths = sorted(set(audio_paths) - set(index["audio_path"]))
+        if len(missing_paths) == 0:
+            logger.info(f"All {len(audio_paths)} features are cached.")
+            return
+
+        logger.info(
+            f"Caching features of {len(missing_paths)} audio files "
+            f"to '{self.path}'."
+        )
+        self.path.mkdir(parents=True, exist_ok=True)
+        shard_id = index["shard"].max() + 1 if len(index) > 0 else 0
+        loader = DataLoader(
+            _FeatureExtractor(
+                audio_paths=missing_paths,
+                transformer=self.transformer,
+                sample_rate=self.sample_rate,
+            ),
+            batch_size=None,
+            num_workers=num_workers,
+        )
+
+        rows, buffer, n_frames = [], [], 0
+        for audio_path, transform in loader:
+            features = transform.numpy()
+            rows.append((audio_path, shard_id, n_frames, len(features)))
+            buffer.append(features)
+            n_frames += len(features)
+            if n_frames >= self.shard_frames:
+                np.save(self._get_shard_path(shard_id), np.concatenate(buffer))
+                shard_id, buffer, n_frames = shard_id + 1, [], 0
+        if buffer:
+            np.save(self._get_shard_path(shard_id), np.concatenate(buffer))
+
+        index = pl.concat(
+            [index, pl.DataFrame(rows, schema=index.schema, orient="row")]
+        )
+        index_path = self.path.joinpath(INDEX_FILENAME)
+        index.write_parquet(index_path.with_suffix(".tmp"))
+        index_path.with_suffix(".tmp").replace(index_path)
+        self._index = None
+
+    def _get_index(self) -> dict[str, tuple[int, int, int]]:
+        if self._index is None:
+            self._index = {
+                audio_path: (shard_id, offset, length)
+                for audio_path, shard_id, offset, length in (
+                    self._read_index().iter_rows()
+                )
+            }
+        return self._index
+
+    def _read_index(self) -> pl.DataFrame:
+        index_path = self.path.joinpath(INDEX_FILENAME)
+        if index_path.exists():
+            return pl.read_parquet(index_path)
+        return pl.DataFrame(
+            schema={
+                "audio_path": pl.String,
+                "shard": pl.Int64,
+                "offset": pl.Int64,
+                "length": pl.Int64,
+            }
+        )
+
+    def _get_shard_path(self, shard_id: int) -> Path:
+        return self.path.joinpath(f"shard_{shard_id:05d}.npy")
@@ -1,15 +1,17 @@
 """Module for LibriSpeech dataset."""
 
+import os
 import tarfile
 import urllib.request
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import polars as pl
-import torchaudio
 from attrs import define, field
 from loguru import logger
 
 from src.domains.audio.asr.datasets.base import ASRDataset
+from src.domains.audio.dsp.audio import get_audio_duration
 from src.domains.common.preprocessing.text import preprocess_text
 
 LIBRI_SPEECH_URL = "https://openslr.elda.org/resources/12"
@@ -22,6 +24,37 @@ STAGES = [
     "train-clean-360",
     "train-other-500",
 ]
+MANIFEST_SCHEMA = {
+    "audio_path": pl.String,
+    "audio_duration": pl.Float64,
+    "text": pl.String,
+    "chapter_dir": pl.String,
+    "chapter_mtime": pl.Float64,
+}
+
+
+def _read_chapter(chapter_dir: str) -> list[tuple[str, float, str]]:
+    """Read transcriptions and audio durations of a LibriSpeech chapter.
+
+    Args:
+        chapter_dir (str): Directory of the chapter.
+
+    Returns:
+        list[tuple]: Audio path, audio duration and text of every utterance.
+    """
+    rows = []
+    for text_path in Path(chapter_dir).glob("*.txt"):
+        for line in text_path.read_text().splitlines():
+            audio_id, text = line.split(" ", maxsplit=1)
+            audio_path = text_path.parent.joinpath(f"{audio_id}.flac")
+            rows.append(
+                (
+                    str(audio_path),
+                    get_audio_duration(audio_path),
+                    preprocess_text(text),
+                )
+            )
+    return rows
 
 
 @define(kw_only=True)
@@ -37,32 +70,46 @@ class LibriSpeechDataset(ASRDataset):
         data_include_other (bool): Whether to include the 'other' quality data.
         data_part (str): Part of the dataset to use.
         data_proportions (list[float]): Proportions for train, val, test sets.
+        manifest_num_workers (int): Number of processes reading audio headers
+            when building manifests. Defaults to the number of CPUs.
         tokenizer (TextTokenizer): Tokenizer for text encoding.
         augmenter (AudioAugmenter): Augmenter for audio signals.
         transformer (Transformer): Audio transformation.
         text_max_length (int): Maximum length of text.
         audio_max_duration (int): Maximum duration of audio.
+        audio_min_duration (float): Minimum duration of audio.
+        text_min_chars_per_second (float): Minimum ratio of text length to
+            audio duration.
+        text_max_chars_per_second (float): Maximum ratio of text length to
+            audio duration.
         audio_sample_rate (int): Sample rate in Hz.
         audio_aug_prob (float): Probability of audio augmentation.
+        feature_cache_dir (str, Path): Directory to cache the transformed
+            audio in.
+        transform_on_device (bool): Whether to leave the audio
+            transformation to the model.
     """
 
     data_dir: Path = field(converter=Path)
     data_include_other: bool = field(default=False)
     data_part: str = field(default="train")
     data_proportions: list[float] = field(default=[0.7, 0.15, 0.15])
+    manifest_num_workers: int | None = field(default=None)
 
     def __attrs_post_init__(self) -> None:
         self.data_dir.mkdir(parents=True, exist_ok=True)
         self.extracted_dir = self.data_dir.joinpath("LibriSpeech")
+        self.manifests_dir = self.data_dir.joinpath("manifests")
 
     def download(self) -> None:
-        """Download the LibriSpeech dataset."""
+        """Download the LibriSpeech dataset and build its manifests."""
         for stage in STAGES:
             if self.extracted_dir.joinpath(stage).exists():
                 logger.info(
                     f"Libri speech {stage} stage already exists. "
                     "Skipping download."
                 )
+                self._load_manifest(self.extracted_dir.joinpath(stage))
                 continue
 
             if "other" in stage and not self.data_include_other:
@@ -81,6 +128,7 @@ class LibriSpeechDataset(ASRDataset):
                 tar.extractall(path=self.data_dir, filter="data")
 
             tar_path.unlink()
+            self._load_manifest(self.extracted_dir.joinpath(stage))
 
     def remove(self) -> None:
         """Remove the LibriSpeech dataset."""
@@ -97,26 +145,89 @@ class LibriSpeechDataset(ASRDataset):
         """
         stage = "dev" if stage == "val" else stage
 
-        data = []
-        for path in self.extracted_dir.glob("*"):
-            if path.is_dir() and stage in path.name:
-                for text_path in path.glob("**/*.txt"):
-                    text_lines = text_path.read_text().splitlines()
-                    for line in text_lines:
-                        audio_id, text = line.split(" ", maxsplit=1)
-                        audio_path = text_path.parent.joinpath(
-                            f"{audio_id}.flac"
-                        )
-                        audio_info = torchaudio.info(audio_path)
-                        data.append(
-                            {
-                                "audio_path": str(audio_path),
-                                "audio_duration": audio_info.num_frames
-                                / audio_info.sample_rate,
-                                "text": preprocess_text(text),
-                            }
-                        )
-
-        self._data = pl.DataFrame(data)
+        manifests = [
+            self._load_manifest(path)
+            for path in sorted(self.extracted_dir.glob("*"))
+            if path.is_dir() and stage in path.name
+        ]
+        self._data = pl.concat(
+            [pl.DataFrame(schema=MANIFEST_SCHEMA), *manifests]
+        ).select("audio_path", "audio_duration", "text")
         self.finalize_data()
         return self
+
+    def _load_manifest(self, stage_dir: Path) -> pl.DataFrame:
+        """Load the manifest of a stage and update its outdated chapters.
+
+        The manifest is stored as a Parquet file along with the modification
+        time of every chapter directory, so only new or modified chapters are
+        scanned again. Scanning is spread across a process pool.
+
+        Args:
+            stage_dir (Path): Directory of the stage, e.g. train-clean-100.
+
+        Returns:
+            DataFrame: Manifest of the stage.
+        """
+        manifest_path = self.manifests_dir.joinpath(
+            f"{stage_dir.name}.parquet"
+        )
+        manifest = (
+            pl.read_parquet(manifest_path)
+            if manifest_path.exists()
+            else pl.DataFrame(schema=MANIFEST_SCHEMA)
+        )
+
+        chapters = pl.DataFrame(
+            [
+                (str(path), path.stat().st_mtime)
+                for path in stage_dir.glob("*/*")
+                if path.is_dir()
+            ],
+            schema={"chapter_dir": pl.String, "chapter_mtime": pl.Float64},
+            orient="row",
+        )
+        up_to_date = manifest.join(
+            chapters,
+            on=["chapter_dir", "chapter_mtime"],
+            how="semi",
+        )
+        outdated_chapters = chapters.join(
+            up_to_date,
+            on="chapter_dir",
+            how="anti",
+        )
+        if len(outdated_chapters) == 0 and len(up_to_date) == len(manifest):
+            return manifest
+
+        logger.info(
+            f"Scanning {len(outdated_chapters)} of {len(chapters)} chapters "
+            f"of LibriSpeech {stage_dir.name}."
+        )
+        with ProcessPoolExecutor(self.manifest_num_workers) as executor:
+            chapters_rows = executor.map(
+                _read_chapter,
+                outdated_chapters.get_column("chapter_dir").to_list(),
+                chunksize=16,
+            )
+            scanned = pl.DataFrame(
+                [
+                    (*row, chapter_dir, chapter_mtime)
+                    for (chapter_dir, chapter_mtime), rows in zip(
+                        outdated_chapters.iter_rows(),
+                        chapters_rows,
+                        strict=True,
+                    )
+                    for row in rows
+                ],
+                schema=MANIFEST_SCHEMA,
+                orient="row",
+            )
+
+        manifest = pl.concat([up_to_date, scanned]).sort("audio_path")
+        self.manifests_dir.mkdir(parents=True, exist_ok=True)
+        # Every DDP rank may update the manifest, so write it atomically
+        tmp_path = manifest_path.with_suffix(f".{os.getpid()}.tmp")
+        manifest.write_parquet(tmp_path)
+        tmp_path.replace(manifest_path)
+        return manifest
@@ -1,21 +1,26 @@
 """Module for LJSpeech dataset."""
 
+import hashlib
 import math
+import os
 import tarfile
 import typing as tp
 import urllib.request
 from pathlib import Path
 
-import pandas as pd
 import polars as pl
-import torchaudio
 from attrs import define, field
 from loguru import logger
 
 from src.domains.audio.asr.datasets.base import ASRDataset
-from src.domains.common.preprocessing.text import preprocess_text
+from src.domains.audio.dsp.audio import get_audio_durations
+from src.domains.common.preprocessing.text import (
+    escape_char_class,
+    preprocess_text_expr,
+)
 
 LJ_SPEECH_URL = "https://data.keithito.com/data/speech/LJSpeech-1.1.tar.bz2"
+TEXT_PREPROCESSING = {"remove_punctuation": True, "remove_spaces": True}
 
 
 @define(kw_only=True)
@@ -29,17 +34,29 @@ class LJSpeechDataset(ASRDataset):
     Attributes:
         data_dir (str, Path): Directory to save the dataset.
         data_proportions (list[float]): Proportions for train, val, test sets.
+        manifest_num_workers (int): Number of processes reading audio headers
+            when building the manifest. Defaults to the number of CPUs.
         tokenizer (TextTokenizer): Tokenizer for text encoding.
         augmenter (AudioAugmenter): Augmenter for audio signals.
         transformer (Transformer): Audio transformation.
         text_max_length (int): Maximum length of text.
         audio_max_duration (int): Maximum duration of audio.
+        audio_min_duration (float): Minimum duration of audio.
+        text_min_chars_per_second (float): Minimum ratio of text length to
+            audio duration.
+        text_max_chars_per_second (float): Maximum ratio of text length to
+            audio duration.
         audio_sample_rate (int): Sample rate in Hz.
         audio_aug_prob (float): Probability of audio augmentation.
+        feature_cache_dir (str, Path): Directory to cache the transformed
+            audio in.
+        transform_on_device (bool): Whether to leave the audio
+            transformation to the model.
     """
 
     data_dir: Path = field(converter=Path)
     data_proportions: list[float] = field(default=[0.7, 0.15, 0.15])
+    manifest_num_workers: int | None = field(default=None)
 
     def __attrs_post_init__(self) -> None:
         self.data_dir.mkdir(parents=True, exist_ok=True)
@@ -47,11 +64,13 @@ class LJSpeechDataset(ASRDataset):
         self.extracted_dir = self.data_dir.joinpath("LJSpeech-1.1")
         self.wavs_dir = self.extracted_dir.joinpath("wavs")
         self.meta_path = self.extracted_dir.joinpath("metadata.csv")
+        self.manifests_dir = self.data_dir.joinpath("manifests")
 
     def download(self) -> None:
-        """Download and extract the LJSpeech dataset."""
+        """Download and extract the LJSpeech dataset and build its manifest."""
         if self.extracted_dir.exists():
             logger.info("LJSpeech dataset already exists. Skipping download.")
+            self._load_manifest()
             return
 
         logger.info("Downloading LJSpeech tar archive.")
@@ -62,6 +81,7 @@ class LJSpeechDataset(ASRDataset):
             tar.extractall(path=self.data_dir, filter="data")
 
         self.tar_path.unlink()
+        self._load_manifest()
 
     def remove(self) -> None:
         """Remove the LJSpeech dataset."""
@@ -83,14 +103,10 @@ class LJSpeechDataset(ASRDataset):
             f"Setting up '{stage}' partition "
             f"of the '{LJSpeechDataset.__name__}' dataset."
         )
-        data = pd.read_csv(
-            self.meta_path,
-            sep="|",
-            header=None,
-            names=["audio_name", "text", "normalized_text"],
+        data = self._partition_data(self._load_manifest(), stage)
+        self._data = data.filter(pl.col("is_valid")).select(
+            "audio_path", "audio_duration", "text"
         )
-        data = pl.from_pandas(data).drop_nulls()
-        self._data = self._process_data(self._partition_data(data, stage))
         self.finalize_data()
         return self
 
@@ -136,32 +152,87 @@ class LJSpeechDataset(ASRDataset):
 
         return data[slices[stage]]
 
-    def _process_data(self, data: pl.DataFrame) -> pl.DataFrame:
-        """Process the data by adding audio paths and durations.
+    def _load_manifest(self) -> pl.DataFrame:
+        """Load the processed manifest of all LJSpeech records.
 
-        Args:
-            data (DataFrame): Data to process.
+        The manifest is computed once and stored as a Parquet file whose name
+        depends on the tokenizer alphabet and text preprocessing options,
+        so it is rebuilt when either of them changes. Records with characters
+        outside of the alphabet are kept with is_valid set to False, so that
+        the stages are partitioned the same way regardless of the alphabet.
 
         Returns:
-            DataFrame: Processed data.
+            DataFrame: Manifest of all records.
         """
-        full_data = []
-        for audio_name, _, normalized_text in data.iter_rows():
-            text = preprocess_text(normalized_text, remove_punctuation=True)
-            if not all(char in self.tokenizer.alphabet for char in text):
-                logger.warning(
-                    f"Skipping '{audio_name}' due to invalid text: '{text}'."
-                )
-                continue
-
-            audio_path = self.wavs_dir.joinpath(f"{audio_name}.wav").as_posix()
-            audio_info = torchaudio.info(audio_path)
-            full_data.append(
-                {
-                    "audio_path": audio_path,
-                    "audio_duration": audio_info.num_frames
-                    / audio_info.sample_rate,
-                    "text": text,
-                }
+        key = hashlib.sha256(
+            f"{sorted(self.tokenizer.alphabet)}:{TEXT_PREPROCESSING}".encode()
+        ).hexdigest()[:16]
+        manifest_path = self.manifests_dir.joinpath(f"ljspeech-{key}.parquet")
+        if manifest_path.exists():
+            return pl.read_parquet(manifest_path)
+
+        logger.info(f"Building LJSpeech manifest '{manifest_path}'.")
+        alphabet = escape_char_class("".join(self.tokenizer.alphabet))
+        manifest = (
+            pl.read_csv(
+                self.meta_path,
+                separator="|",
+                has_header=False,
+                quote_char=None,
+                new_columns=["audio_name", "text", "normalized_text"],
+            )
+            .drop_nulls()
+            .select(
+                audio_path=pl.format(
+                    "{}/{}.wav",
+                    pl.lit(self.wavs_dir.as_posix()),
+                    pl.col("audio_name"),
+                ),
+                text=preprocess_text_expr(
+                    pl.col("normalized_text"),
+                    **TEXT_PREPROCESSING,
+                ),
             )
-        return pl.DataFrame(full_data)
+            .with_columns(
+                is_valid=pl.col("text").str.contains(f"^[{alphabet}]*$"),
+            )
+        )
+
+        for audio_path, text in (
+            manifest.filter(~pl.col("is_valid"))
+            .select("audio_path", "text")
+            .iter_rows()
+        ):
+            logger.warning(
+                f"Skipping '{Path(audio_path).stem}' due to invalid text: "
+                f"'{text}'."
+            )
+
+        # Durations are read only for the valid records
+        valid_paths = (
+            manifest.filter(pl.col("is_valid"))
+            .get_column("audio_path")
+            .to_list()
+        )
+        durations = iter(
+            get_audio_durations(
+                valid_paths,
+                num_workers=self.manifest_num_workers,
+            )
+        )
+        manifest = manifest.with_columns(
+            audio_duration=pl.Series(
+                [
+                    next(durations) if is_valid else None
+                    for is_valid in manifest.get_column("is_valid")
+                ],
+                dtype=pl.Float64,
+            )
+        )
+
+        self.manifests_dir.mkdir(parents=True, exist_ok=True)
+        # Every DDP rank may build the manifest, so write it atomically
+        tmp_path = manifest_path.with_suffix(f".{os.getpid()}.tmp")
+        manifest.write_parquet(tmp_path)
+        tmp_path.replace(manifest_path)
+        return manifest
@@ -0,0 +1,191 @@
+"""Sequential tar shards of ASR samples."""
+
+import io
+import json
+import tarfile
+from collections.abc import Iterator
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+import torch
+from attrs import define, field
+from loguru import logger
+
+INDEX_FILENAME = "index.parquet"
+INDEX_SCHEMA = {
+    "shard": pl.String,
+    "num_samples": pl.Int64,
+    "audio_duration": pl.Float64,
+}
+
+
+@define(kw_only=True)
+class ShardWriter:
+    """Writer of samples into tar shards of about the same size.
+
+    Every sample is stored as consecutive tar members sharing a key: a JSON
+    file with the text and the audio duration, followed by either the
+    encoded audio file as is or the transformed audio as a .npy file. The
+    index lists the shards along with their number of samples, their total
+    duration and the key of the content they are written from. It is
+    written last, so that a directory with an index of the same key is
+    complete, and an outdated index is removed with the shards before the
+    first new shard is written.
+
+    Attributes:
+        output_dir (Path): Directory to write the shards to.
+        shard_max_size (int): Size in bytes after which a new shard is
+            started.
+        key (str): Key of the content of the shards, e.g. a hash of the
+            samples and of how they are stored.
+    """
+
+    output_dir: Path = field(converter=Path)
+    shard_max_size: int = field(default=2**28)
+    key: str = field(default="")
+
+    _tar: tarfile.TarFile | None = field(default=None, init=False)
+    _shard_size: int = field(default=0, init=False)
+    _rows: list[tuple[str, int, float]] = field(factory=list, init=False)
+
+    @property
+    def is_complete(self) -> bool:
+        """Whether the shards are already written.
+
+        Returns:
+            bool: True if the output directory has an index of the same key.
+        """
+        index_path = self.output_dir.joinpath(INDEX_FILENAME)
+        if not index_path.exists():
+            return False
+        index = pl.read_parquet(index_path)
+        return "key" in index.columns and index.get_column(
+            "key"
+        ).unique().to_list() == [self.key]
+
+    def write(
+        self,
+        key: str,
+        text: str,
+        audio_duration: float,
+        *,
+        audio_path: str | None = None,
+        transform: torch.Tensor | None = None,
+    ) -> None:
+        """Write a sample with either its audio file or its transform.
+
+        Args:
+            key: Unique key of the sample.
+            text: Transcription of the audio.
+            audio_duration: Duration of the audio in seconds.
+            audio_path: Path to the audio file to store.
+            transform: Transformed audio of shape (1, n_features, n_frames).
+
+        Raises:
+            ValueError: If neither or both audio and transform are given.
+        """
+        if (audio_path is None) == (transform is None):
+            msg = "Exactly one of audio_path and transform must be given."
+            raise ValueError(msg)
+
+        if transform is None:
+            name = f"{key}{Path(audio_path).suffix}"
+            payload = Path(audio_path).read_bytes()
+        else:
+            name = f"{key}.npy"
+            buffer = io.BytesIO()
+            np.save(buffer, transform[0].numpy())
+            payload = buffer.getvalue()
+        meta = json.dumps(
+            {"text": text, "audio_duration": audio_duration}
+        ).encode()
+
+        if self._tar is None or self._shard_size >= self.shard_max_size:
+            self._open_shard()
+        self._add_member(f"{key}.json", meta)
+        self._add_member(name, payload)
+        shard, num_samples, duration = self._rows[-1]
+        self._rows[-1] = (shard, num_samples + 1, duration + audio_duration)
+
+    def close(self) -> None:
+        """Close the last shard and write the index."""
+        if self._tar is not None:
+            self._tar.close()
+            self._tar = None
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        if not self._rows:
+            self._remove_shards()
+        pl.DataFrame(
+            self._rows, schema=INDEX_SCHEMA, orient="row"
+        ).with_columns(key=pl.lit(self.key)).write_parquet(
+            self.output_dir.joinpath(INDEX_FILENAME)
+        )
+        logger.info(f"Wrote {len(self._rows)} shards to '{self.output_dir}'.")
+
+    def _open_shard(self) -> None:
+        if self._tar is not None:
+            self._tar.close()
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        if not self._rows:
+            self._remove_shards()
+        shard = f"shard_{len(self._rows):05d}.tar"
+        # The shard stays open across writes and is closed on rollover
+        self._tar = tarfile.TarFile(self.output_dir.joinpath(shard), mode="w")
+        self._shard_size = 0
+        self._rows.append((shard, 0, 0.0))
+
+    def _remove_shards(self) -> None:
+        # The index goes first, so that no index points to missing shards
+        self.output_dir.joinpath(INDEX_FILENAME).unlink(missing_ok=True)
+        for shard_path in self.output_dir.glob("shard_*.tar"):
+            shard_path.unlink()
+
+    def _add_member(self, name: str, payload: bytes) -> None:
+        info = tarfile.TarInfo(name)
+        info.size = len(payload)
+        self._tar.addfile(info, io.BytesIO(payload))
+        self._shard_size += len(payload)
+
+
+def read_index(shards_dir: Path) -> pl.DataFrame:
+    """Read the index of the shards.
+
+    Args:
+        shards_dir: Directory with the shards.
+
+    Returns:
+        DataFrame: Shard file names, numbers of samples and durations.
+
+    Raises:
+        FileNotFoundError: If the directory has no index.
+    """
+    index_path = shards_dir.joinpath(INDEX_FILENAME)
+    if not index_path.exists():
+        msg = f"Shards index not found: {index_path}"
+        raise FileNotFoundError(msg)
+    return pl.read_parquet(index_path)
+
+
+def read_shard(shard_path: Path) -> Iterator[dict[str, bytes]]:
+    """Read the samples of a shard sequentially.
+
+    Args:
+        shard_path: Path to the tar shard.
+
+    Yields:
+        dict[str, bytes]: Members of a sample keyed by their extension,
+            e.g. {"json": ..., "flac": ...}.
+    """
+    # Stream mode reads the shard front to back without seeking
+    with tarfile.open(shard_path, mode="r|") as tar:
+        key, sample = None, {}
+        for member in tar:
+            member_key, extension = member.name.rsplit(".", maxsplit=1)
+            if member_key != key and sample:
+                yield sample
+                sample = {}
+            key = member_key
+            sample[extension] = tar.extractfile(member).read()
+        if sample:
+            yield sample
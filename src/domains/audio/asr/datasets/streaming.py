@@ -0,0 +1,243 @@
+"""Iterable ASR dataset streaming samples from tar shards."""
+
+import io
+import itertools
+import json
+import random
+import typing as tp
+from collections.abc import Iterator
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+import torch
+import torch.distributed as dist
+from attrs import define, field
+from torch.utils.data import DataLoader, IterableDataset, get_worker_info
+
+from src.domains.audio.asr.datasets.base import ASRDataset
+from src.domains.audio.asr.datasets.shards import read_index, read_shard
+from src.domains.audio.dsp.audio import load_waveform
+from src.utils.logger import logger
+
+
+@define(kw_only=True)
+class ASRStreamingDataset(IterableDataset):
+    """Dataset streaming the samples of a stage from sequential tar shards.
+
+    Shards are written with ASRDataset.write_shards and read front to back,
+    which replaces random reads of many small audio files with a few large
+    sequential ones. Every epoch the shards are shuffled and dealt to the
+    ranks and then to the dataloader workers, and samples are shuffled
+    within a buffer. With fewer shards than workers across the ranks, every
+    worker reads all the shards and keeps every n-th sample instead. Every
+    rank yields the same number of samples, so a rank whose shards hold
+    fewer samples starts over its shards.
+
+    The order of the samples is determined by the seed and the epoch, so
+    an epoch is resumed by skipping the samples the workers already
+    yielded, see StreamingDataLoader.
+
+    Attributes:
+        source (ASRDataset): Dataset set up for the stage of the shards.
+            Its tokenizer, augmenter and transformer process the samples.
+        shards_dir (str, Path): Directory with the shards of the stage.
+        shuffle (bool): Whether to shuffle the shards and the samples.
+        shuffle_buffer_size (int): Number of samples to shuffle in.
+        seed (int): Seed for shuffling.
+    """
+
+    source: ASRDataset = field(repr=False)
+    shards_dir: Path = field(converter=Path)
+    shuffle: bool = field(default=True)
+    shuffle_buffer_size: int = field(default=1000)
+    seed: int = field(default=0)
+
+    _index: pl.DataFrame = field(init=False, repr=False)
+    # Shared with the workers, so that persistent workers see new epochs
+    _epoch: torch.Tensor = field(
+        factory=lambda: torch.zeros((), dtype=torch.long).share_memory_(),
+        init=False,
+        repr=False,
+    )
+    _resume_epoch: int = field(default=-1, init=False, repr=False)
+    _resume_skips: list[int] = field(factory=list, init=False, repr=False)
+
+    def __attrs_post_init__(self) -> None:
+        self._index = read_index(self.shards_dir)
+
+    def set_epoch(self, epoch: int, skips: list[int] | None = None) -> None:
+        """Set the epoch and the samples of it that are already consumed.
+
+        Args:
+            epoch (int): Epoch number.
+            skips (list[int]): Number of samples of the epoch to skip in
+                every dataloader worker of the rank.
+        """
+        self._epoch.fill_(epoch)
+        if skips and any(skips):
+            self._resume_epoch, self._resume_skips = epoch, skips
+
+    def __len__(self) -> int:
+        """Get the number of samples yielded by every rank.
+
+        Returns:
+            int: The number of samples per rank.
+        """
+        world_size, _ = self._get_rank()
+        return int(self._index.get_column("num_samples").sum()) // world_size
+
+    def __iter__(self) -> Iterator[dict[str, tp.Any]]:
+        """Stream the samples of the shards of the rank and the worker.
+
+        Yields:
+            dict[str, tp.Any]: A dictionary containing the waveform (if the
+                shards store audio), transformed audio, and encoded text.
+        """
+        epoch = int(self._epoch)
+        world_size, rank = self._get_rank()
+        worker_info = get_worker_info()
+        num_workers = worker_info.num_workers if worker_info else 1
+        worker_id = worker_info.id if worker_info else 0
+
+        shards = self._index.get_column("shard").to_list()
+        if self.shuffle:
+            random.Random(self.seed + epoch).shuffle(shards)
+        # Shards are dealt to the ranks and then to the workers of a rank
+        num_readers = world_size * num_workers
+        reader_id = rank + world_size * worker_id
+        if len(shards) < num_readers and reader_id == 0:
+            logger.warning(
+                f"Number of shards ({len(shards)}) is less than the number "
+                f"of workers ({num_readers}), every worker reads all the "
+                "shards."
+            )
+
+        num_samples, remainder = divmod(len(self), num_workers)
+        num_samples += worker_id < remainder
+        skip = 0
+        if epoch == self._resume_epoch and worker_id < len(self._resume_skips):
+            skip = self._resume_skips[worker_id]
+
+        generator = random.Random(hash((self.seed, epoch, rank, worker_id)))
+        idx = 0
+        # Pass over the shards again if they hold fewer samples than needed
+        while idx < num_samples:
+            pass_start = idx
+            for sample in self._shuffle(
+                self._read(shards, reader_id, num_readers), generator
+            ):
+                if idx >= skip:
+                    yield self._decode(sample)
+                idx += 1
+                if idx == num_samples:
+                    return
+            # Readers without samples would otherwise pass forever
+            if idx == pass_start:
+                return
+
+    def _read(
+        self,
+        shards: list[str],
+        reader_id: int,
+        num_readers: int,
+    ) -> Iterator[dict[str, bytes]]:
+        if len(shards) >= num_readers:
+            for shard in shards[reader_id::num_readers]:
+                yield from read_shard(self.shards_dir.joinpath(shard))
+            return
+
+        # Too few shards to deal, so the samples are dealt instead
+        samples = itertools.chain.from_iterable(
+            read_shard(self.shards_dir.joinpath(shard)) for shard in shards
+        )
+        yield from itertools.islice(samples, reader_id, None, num_readers)
+
+    def _shuffle(
+        self,
+        samples: Iterator[dict[str, bytes]],
+        generator: random.Random,
+    ) -> Iterator[dict[str, bytes]]:
+        if not self.shuffle or self.shuffle_buffer_size <= 1:
+            yield from samples
+            return
+
+        buffer = []
+        for sample in samples:
+            if len(buffer) < self.shuffle_buffer_size:
+                buffer.append(sample)
+                continue
+            idx = generator.randrange(len(buffer))
+            yield buffer[idx]
+            buffer[idx] = sample
+        generator.shuffle(buffer)
+        yield from buffer
+
+    def _decode(self, sample: dict[str, bytes]) -> dict[str, tp.Any]:
+        meta = json.loads(sample.pop("json"))
+        tokens = self.source.tokenizer.encode(meta["text"])
+        if "npy" in sample:
+            transform = np.load(io.BytesIO(sample["npy"]))
+            return {
+                "transform": torch.from_numpy(transform).unsqueeze(0),
+                "tokens": tokens,
+            }
+
+        (audio,) = sample.values()
+        waveform = load_waveform(
+            io.BytesIO(audio),
+            sample_rate=self.source.audio_sample_rate,
+        )
+        return self.source.make_sample(
+            waveform,
+            tokens,
+            augment=random.random() < self.source.audio_aug_prob,
+        )
+
+    @staticmethod
+    def _get_rank() -> tuple[int, int]:
+        if dist.is_available() and dist.is_initialized():
+            return dist.get_world_size(), dist.get_rank()
+        return 1, 0
+
+
+class StreamingDataLoader(DataLoader):
+    """Data loader that advances the epoch of a streaming dataset.
+
+    Every iteration starts a new epoch of the dataset. The first epoch may
+    be resumed after a number of batches of the rank: the workers yield
+    whole batches in turn, so the number of samples every worker already
+    yielded follows from the number of batches. The remaining samples of
+    the epoch are the same, but the workers may take turns in another order.
+    """
+
+    def __init__(
+        self,
+        dataset: ASRStreamingDataset,
+        *,
+        epoch: int = 0,
+        num_batches: int = 0,
+        **kwargs: object,
+    ) -> None:
+        """Constructor.
+
+        Args:
+            dataset: Streaming dataset
+            epoch: Epoch to start from
+            num_batches: Number of batches of the epoch already consumed
+            kwargs: Keyword arguments of DataLoader
+        """
+        super().__init__(dataset, **kwargs)
+        self.epoch = epoch
+        self.num_batches = num_batches
+
+    def __iter__(self) -> Iterator[tp.Any]:
+        num_workers = max(self.num_workers, 1)
+        skips = [
+            -(-(self.num_batches - worker_id) // num_workers) * self.batch_size
+            for worker_id in range(num_workers)
+        ]
+        self.dataset.set_epoch(self.epoch, skips=skips)
+        self.epoch += 1
+        self.num_batches = 0
+        return super().__iter__()
@@ -0,0 +1,409 @@
+"""CTC prefix beam search decoding with an optional n-gram language model."""
+
+import math
+import typing as tp
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import attrs
+import numpy as np
+import torch
+from attrs import define, field
+
+from src.domains.common.preprocessing.tokenizers import CTCTextTokenizer
+
+LOG10 = math.log(10)
+# Log-probability of units missing from a language model without <unk>
+UNKNOWN_LOG_PROB = -100.0 * LOG10
+
+LMState = tp.Hashable
+
+
+@define(kw_only=True)
+class NGramLanguageModel:
+    """Back-off n-gram language model read from an ARPA file.
+
+    A word model scores a word once it is followed by a space or the end
+    of the text. A character model scores every character, with spaces
+    written as the space symbol in the ARPA file.
+
+    Attributes:
+        path (str, Path): Path to the ARPA file.
+        unit (str): Unit of the model, either "word" or "char".
+        space_symbol (str): Symbol of the space in a character model.
+    """
+
+    path: Path = field(converter=Path)
+    unit: tp.Literal["word", "char"] = field(
+        default="word",
+        validator=attrs.validators.in_(["word", "char"]),
+    )
+    space_symbol: str = field(default="<space>")
+
+    order: int = field(init=False)
+    _ngrams: dict[tuple[str, ...], tuple[float, float]] = field(
+        init=False,
+        repr=False,
+    )
+
+    def __attrs_post_init__(self) -> None:
+        self._ngrams = {}
+        order = 0
+        with self.path.open() as arpa:
+            for raw_line in arpa:
+                line = raw_line.strip()
+                if line.startswith("\\") and line.endswith("-grams:"):
+                    order = int(line[1:].split("-")[0])
+                elif line and order and not line.startswith("\\"):
+                    fields = line.split()
+                    log_prob = float(fields[0]) * LOG10
+                    backoff = (
+                        float(fields[order + 1]) * LOG10
+                        if len(fields) > order + 1
+                        else 0.0
+                    )
+                    self._ngrams[tuple(fields[1 : order + 1])] = (
+                        log_prob,
+                        backoff,
+                    )
+        if not self._ngrams:
+            msg = f"No n-grams found in {self.path}"
+            raise ValueError(msg)
+        self.order = max(len(ngram) for ngram in self._ngrams)
+
+    @property
+    def initial_state(self) -> LMState:
+        """State of the model at the start of a text.
+
+        Returns:
+            Context of the start symbol and an empty partial word.
+        """
+        return self._truncate(("<s>",)), ""
+
+    def score(self, context: tuple[str, ...], unit: str) -> float:
+        """Compute the log-probability of a unit with back-off.
+
+        Args:
+            context: Preceding units.
+            unit: Scored unit.
+
+        Returns:
+            Natural log-probability of the unit.
+        """
+        context = self._truncate(context)
+        backoff = 0.0
+        while True:
+            ngram = self._ngrams.get((*context, unit))
+            if ngram is not None:
+                return backoff + ngram[0]
+            if not context:
+                unknown = self._ngrams.get(("<unk>",))
+                return backoff + (unknown[0] if unknown else UNKNOWN_LOG_PROB)
+            backoff += self._ngrams.get(context, (0.0, 0.0))[1]
+            context = context[1:]
+
+    def advance(self, state: LMState, char: str) -> tuple[float, LMState]:
+        """Score the next character of a text.
+
+        Args:
+            state: State after the preceding characters.
+            char: Next character.
+
+        Returns:
+            Log-probability added by the character and the next state.
+        """
+        context, word = state
+        if self.unit == "char":
+            unit = self.space_symbol if char == " " else char
+            return self.score(context, unit), (
+                self._truncate((*context, unit)),
+                "",
+            )
+        if char != " ":
+            return 0.0, (context, word + char)
+        if not word:
+            return 0.0, state
+        return self.score(context, word), (
+            self._truncate((*context, word)),
+            "",
+        )
+
+    def finish(self, state: LMState) -> float:
+        """Score the end of a text.
+
+        Args:
+            state: State after the last character.
+
+        Returns:
+            Log-probability of the last word, if any, and the end symbol.
+        """
+        log_prob, (context, _) = self.advance(state, " ")
+        return log_prob + self.score(context, "</s>")
+
+    def _truncate(self, context: tuple[str, ...]) -> tuple[str, ...]:
+        # Only the last order - 1 units condition the next one
+        return context[max(len(context) - self.order + 1, 0) :]
+
+
+@define(kw_only=True)
+class CTCBeamSearchDecoder:
+    """CTC prefix beam search decoder.
+
+    Every prefix keeps the probabilities of ending with a blank and with
+    its last token, so that the alignments of a text are merged. At every
+    frame, only the tokens above the threshold among the most likely ones
+    extend the prefixes, and prefixes far below the best are dropped. The
+    score of a prefix adds the weighted language model log-probability and
+    a bonus per word to its acoustic log-probability.
+
+    Utterances of a batch are decoded in a pool of processes, which is
+    started on the first batch.
+
+    Attributes:
+        tokenizer (CTCTextTokenizer): Tokenizer the model is trained with.
+        beam_width (int): Number of prefixes kept at every frame.
+        token_min_log_prob (float): Log-probability below which tokens
+            do not extend prefixes.
+        beam_threshold (float): Score difference to the best prefix above
+            which prefixes are dropped.
+        lm (NGramLanguageModel, None): Language model.
+        lm_weight (float): Weight of the language model.
+        word_bonus (float): Bonus added to the score per word, which
+            offsets the penalty of the language model on every word.
+            Without a language model, it only favours inserted words.
+        num_workers (int): Number of processes decoding utterances.
+            If 0, utterances are decoded in the main process.
+    """
+
+    tokenizer: CTCTextTokenizer = field()
+    beam_width: int = field(default=16)
+    token_min_log_prob: float = field(default=-10.0)
+    beam_threshold: float = field(default=25.0)
+    lm: NGramLanguageModel | None = field(default=None)
+    lm_weight: float = field(default=0.5)
+    word_bonus: float = field(default=0.0)
+    num_workers: int = field(default=0)
+
+    chars: list[str] = field(init=False, repr=False)
+    _pool: ProcessPoolExecutor | None = field(
+        default=None,
+        init=False,
+        repr=False,
+    )
+
+    def __attrs_post_init__(self) -> None:
+        self.chars = [
+            self.tokenizer.decode(torch.tensor([token]))
+            for token in range(self.tokenizer.alphabet_size)
+        ]
+
+    def decode_batch(
+        self,
+        log_probs: torch.Tensor,
+        lengths: torch.Tensor | None = None,
+    ) -> list[str]:
+        """Decode a batch of log-probabilities.
+
+        Args:
+            log_probs: Tensor of shape (batch_size, n_tokens, n_frames).
+            lengths: Number of valid frames of every utterance.
+                If None, all frames are valid.
+
+        Returns:
+            Decoded texts.
+        """
+        log_probs_np = log_probs.detach().float().cpu().numpy()
+        lengths_np = (
+            lengths.cpu().numpy()
+            if lengths is not None
+            else [log_probs_np.shape[-1]] * len(log_probs_np)
+        )
+        utterances = [
+            np.ascontiguousarray(utterance[:, :length].T)
+            for utterance, length in zip(log_probs_np, lengths_np, strict=True)
+        ]
+        if self.num_workers == 0 or len(utterances) == 1:
+            return [self.decode(utterance) for utterance in utterances]
+
+        if self._pool is None:
+            # Workers get a copy without the pool
+            self._pool = ProcessPoolExecutor(
+                self.num_workers,
+                initializer=_init_worker,
+                initargs=(attrs.evolve(self),),
+            )
+        return list(self._pool.map(_decode_in_worker, utterances))
+
+    def decode(self, log_probs: np.ndarray) -> str:
+        """Decode the log-probabilities of an utterance.
+
+        Args:
+            log_probs: Array of shape (n_frames, n_tokens).
+
+        Returns:
+            Decoded text.
+        """
+        blank = self.tokenizer.blank_token
+        # Prefixes form a tree of nodes extended by a token
+        tree = _PrefixTree(self)
+        beams = {0: (0.0, -math.inf)}
+        n_candidates = min(self.beam_width, log_probs.shape[-1])
+        for frame in log_probs:
+            candidates = np.argpartition(-frame, n_candidates - 1)[
+                :n_candidates
+            ]
+            candidates = candidates[
+                (frame[candidates] >= self.token_min_log_prob)
+                & (candidates != blank)
+            ]
+            candidate_log_probs = frame[candidates]
+            # Python floats are faster than numpy scalars
+            blank_log_prob, frame_list = float(frame[blank]), frame.tolist()
+            next_beams: dict[int, list[float]] = {}
+            for node, (p_blank, p_token) in beams.items():
+                p_total = _logaddexp(p_blank, p_token)
+                _add(next_beams, node, p_total + blank_log_prob, -math.inf)
+                last_token = tree.tokens[node]
+                if last_token >= 0:
+                    # Repeated tokens without a blank collapse
+                    _add(
+                        next_beams,
+                        node,
+                        -math.inf,
+                        p_token + frame_list[last_token],
+                    )
+                p_extended = (
+                    np.where(candidates == last_token, p_blank, p_total)
+                    + candidate_log_probs
+                )
+                for token, p in zip(
+                    candidates.tolist(), p_extended.tolist(), strict=True
+                ):
+                    _add(next_beams, tree.extend(node, token), -math.inf, p)
+            beams = self._prune(next_beams, tree)
+
+        best_node = max(
+            beams,
+            key=lambda node: self._score(*beams[node], tree, node, final=True),
+        )
+        return tree.text(best_node)
+
+    def close(self) -> None:
+        """Shut down the pool of processes."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _prune(
+        self,
+        beams: dict[int, list[float]],
+        tree: "_PrefixTree",
+    ) -> dict[int, tuple[float, float]]:
+        scores = {
+            node: self._score(p_blank, p_token, tree, node)
+            for node, (p_blank, p_token) in beams.items()
+        }
+        best_nodes = sorted(scores, key=scores.get, reverse=True)[
+            : self.beam_width
+        ]
+        min_score = scores[best_nodes[0]] - self.beam_threshold
+        return {
+            node: tuple(beams[node])
+            for node in best_nodes
+            if scores[node] >= min_score
+        }
+
+    def _score(
+        self,
+        p_blank: float,
+        p_token: float,
+        tree: "_PrefixTree",
+        node: int,
+        *,
+        final: bool = False,
+    ) -> float:
+        lm_log_prob = tree.lm_log_probs[node]
+        if final and self.lm is not None:
+            lm_log_prob += self.lm.finish(tree.lm_states[node])
+        return (
+            _logaddexp(p_blank, p_token)
+            + self.lm_weight * lm_log_prob
+            + self.word_bonus * tree.n_words[node]
+        )
+
+
+class _PrefixTree:
+    """Prefixes of a beam search with their language model scores."""
+
+    def __init__(self, decoder: CTCBeamSearchDecoder) -> None:
+        self.decoder = decoder
+        self.parents = [-1]
+        self.tokens = [-1]
+        self.lm_log_probs = [0.0]
+        self.lm_states = [decoder.lm.initial_state if decoder.lm else None]
+        self.n_words = [0]
+        self._children: dict[tuple[int, int], int] = {}
+
+    def extend(self, node: int, token: int) -> int:
+        child = self._children.get((node, token))
+        if child is not None:
+            return child
+
+        child = self._children[node, token] = len(self.parents)
+        char = self.decoder.chars[token]
+        lm_log_prob, lm_state = (
+            self.decoder.lm.advance(self.lm_states[node], char)
+            if self.decoder.lm
+            else (0.0, None)
+        )
+        previous_char = self.decoder.chars[self.tokens[node]] if node else " "
+        self.parents.append(node)
+        self.tokens.append(token)
+        self.lm_log_probs.append(self.lm_log_probs[node] + lm_log_prob)
+        self.lm_states.append(lm_state)
+        self.n_words.append(
+            self.n_words[node] + (previous_char == " " and char != " ")
+        )
+        return child
+
+    def text(self, node: int) -> str:
+        chars = []
+        while node > 0:
+            chars.append(self.decoder.chars[self.tokens[node]])
+            node = self.parents[node]
+        return "".join(reversed(chars))
+
+
+def _add(
+    beams: dict[int, list[float]],
+    node: int,
+    p_blank: float,
+    p_token: float,
+) -> None:
+    if node not in beams:
+        beams[node] = [p_blank, p_token]
+        return
+    beam = beams[node]
+    beam[0] = _logaddexp(beam[0], p_blank)
+    beam[1] = _logaddexp(beam[1], p_token)
+
+
+def _logaddexp(a: float, b: float) -> float:
+    # Faster than numpy for scalars
+    if a < b:
+        a, b = b, a
+    if b == -math.inf:
+        return a
+    return a + math.log1p(math.exp(b - a))
+
+
+# Decoder of a worker process, set by its initializer
+_worker_state: dict[str, CTCBeamSearchDecoder] = {}
+
+
+def _init_worker(decoder: CTCBeamSearchDecoder) -> None:
+    _worker_state["decoder"] = decoder
+
+
+def _decode_in_worker(log_probs: np.ndarray) -> str:
+    return _worker_state["decoder"].decode(log_probs)
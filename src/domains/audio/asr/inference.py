@@ -0,0 +1,359 @@
+"""Inference and export of ASR models."""
+
+import copy
+import enum
+import importlib
+import json
+import typing as tp
+from pathlib import Path
+
+import hydra
+import torch
+import torchaudio.transforms as T
+from omegaconf import DictConfig
+from torch import nn
+
+from src.domains.audio.asr.model import ASRModel
+from src.domains.audio.dsp.features import ConvMelSpectrogram
+from src.domains.common.preprocessing.tokenizers import (
+    CTCTextTokenizer,
+    TextTokenizer,
+)
+from src.utils.logger import logger
+
+TOKENIZER_FILENAME = "tokenizer.json"
+
+
+class ExportFormat(str, enum.Enum):
+    """Format of an exported ASR model."""
+
+    TORCHSCRIPT = "torchscript"
+    ONNX = "onnx"
+
+
+class ASRInferenceModel(nn.Module):
+    """Self-contained ASR model from padded waveforms to log-probabilities.
+
+    The mel front end is computed for the whole batch, and the frames past
+    the length of every waveform are zeroed as in ASRModel, so that only
+    the forward pass of the acoustic model remains.
+    """
+
+    def __init__(
+        self,
+        frontend: ConvMelSpectrogram,
+        model: nn.Module,
+        downsize: int,
+    ) -> None:
+        """Constructor.
+
+        Args:
+            frontend: Mel front end
+            model: Acoustic model producing log-probabilities
+            downsize: Downsize factor of the model
+        """
+        super().__init__()
+        self.frontend = frontend
+        self.model = model
+        self.downsize = downsize
+
+    @classmethod
+    def from_asr_model(
+        cls,
+        asr_model: ASRModel,
+        transformer: T.MelSpectrogram,
+        downsize: int,
+    ) -> "ASRInferenceModel":
+        """Create an inference model from a copy of a trained ASR model.
+
+        Batch normalizations are folded into the preceding convolutions
+        and dropouts are removed.
+
+        Args:
+            asr_model: Trained ASR model
+            transformer: Audio transformation the model is trained on
+            downsize: Downsize factor of the model
+
+        Returns:
+            Inference model in eval mode.
+        """
+        model = copy.deepcopy(asr_model.model).cpu().eval()
+        model = model.fuse_for_inference()
+        _remove_dropouts(model)
+        return cls(
+            ConvMelSpectrogram.from_transformer(transformer),
+            model,
+            downsize,
+        ).eval()
+
+    def forward(
+        self,
+        waveforms: torch.Tensor,
+        waveforms_lengths: torch.Tensor,
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        """Compute the log-probabilities of the tokens.
+
+        Args:
+            waveforms: tensor of shape (batch_size, n_samples).
+            waveforms_lengths: tensor of shape (batch_size,).
+
+        Returns:
+            Log-probabilities of shape (batch_size, n_tokens, n_probs) and
+            the number of valid probabilities of every sample.
+        """
+        transforms = self.frontend(waveforms)
+        transforms_lengths = (
+            torch.div(
+                waveforms_lengths,
+                self.frontend.hop_length,
+                rounding_mode="floor",
+            )
+            + 1
+        )
+        frames = torch.arange(transforms.shape[-1], device=transforms.device)
+        mask = frames < transforms_lengths.unsqueeze(-1)
+        log_probs = self.model(transforms * mask.unsqueeze(1))
+        probs_lengths = torch.div(
+            transforms_lengths + self.downsize - 1,
+            self.downsize,
+            rounding_mode="floor",
+        )
+        return log_probs, probs_lengths
+
+
+def _remove_dropouts(module: nn.Module) -> None:
+    """Replace dropouts with identities in place.
+
+    Dropouts are no-ops in eval mode, but would still be traced into the
+    exported graphs.
+    """
+    for name, child in module.named_children():
+        if isinstance(child, nn.Dropout):
+            setattr(module, name, nn.Identity())
+        else:
+            _remove_dropouts(child)
+
+
+def load_asr_model(cfg: DictConfig, checkpoint_path: str | Path) -> ASRModel:
+    """Instantiate the ASR model of an experiment with trained weights.
+
+    Args:
+        cfg: Experiment configuration.
+        checkpoint_path: Path to the Lightning checkpoint.
+
+    Returns:
+        ASR model in eval mode.
+    """
+    logger.info(f"Instantiating model module <{cfg['models']['_target_']}>")
+    asr_model: ASRModel = hydra.utils.instantiate(cfg["models"])
+
+    logger.info(f"Loading weights from checkpoint <{checkpoint_path}>")
+    checkpoint = torch.load(
+        checkpoint_path, map_location="cpu", weights_only=False
+    )
+    # Weights of a compiled model are nested in _orig_mod
+    state_dict = {
+        key.removeprefix("model.").removeprefix("_orig_mod."): value
+        for key, value in checkpoint["state_dict"].items()
+        if key.startswith("model.")
+    }
+    asr_model.model.load_state_dict(state_dict)
+    return asr_model.eval()
+
+
+def export_asr_model(
+    asr_model: ASRModel,
+    transformer: T.MelSpectrogram,
+    *,
+    downsize: int,
+    output_dir: str | Path,
+    formats: list[ExportFormat],
+    atol: float = 1e-3,
+) -> dict[ExportFormat, Path]:
+    """Export an ASR model and check its outputs against the eager model.
+
+    The tokenizer is saved next to the artifacts and is also embedded into
+    the TorchScript archive. Checking the ONNX model requires onnxruntime.
+
+    Args:
+        asr_model: Trained ASR model
+        transformer: Audio transformation the model is trained on
+        downsize: Downsize factor of the model
+        output_dir: Directory to save the artifacts to
+        formats: Formats to export to
+        atol: Absolute tolerance of the parity check of log-probabilities
+
+    Returns:
+        Paths to the exported models.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    inference_model = ASRInferenceModel.from_asr_model(
+        asr_model,
+        transformer,
+        downsize,
+    )
+
+    sample_rate = asr_model.hparams["sample_rate"]
+    waveforms = torch.randn(2, 4 * sample_rate).clamp(-1, 1)
+    waveforms_lengths = torch.tensor([4 * sample_rate, 3 * sample_rate])
+    waveforms[1, 3 * sample_rate :] = 0
+    inputs = (waveforms, waveforms_lengths)
+    with torch.no_grad():
+        expected = _run_eager(asr_model, transformer, *inputs)
+    _check_parity("Folded", inference_model, inputs, expected, atol=atol)
+
+    tokenizer_json = json.dumps(
+        describe_tokenizer(asr_model.tokenizer, sample_rate),
+        ensure_ascii=False,
+    )
+    output_dir.joinpath(TOKENIZER_FILENAME).write_text(tokenizer_json)
+
+    paths = {}
+    if ExportFormat.TORCHSCRIPT in formats:
+        path = paths[ExportFormat.TORCHSCRIPT] = output_dir.joinpath(
+            "model.pt"
+        )
+        with torch.no_grad():
+            traced_model = torch.jit.trace(inference_model, inputs)
+        torch.jit.save(
+            traced_model,
+            path,
+            _extra_files={TOKENIZER_FILENAME: tokenizer_json},
+        )
+        _check_parity(
+            "TorchScript",
+            torch.jit.load(path),
+            inputs,
+            expected,
+            atol=atol,
+        )
+
+    if ExportFormat.ONNX in formats:
+        path = paths[ExportFormat.ONNX] = output_dir.joinpath("model.onnx")
+        torch.onnx.export(
+            inference_model,
+            inputs,
+            path,
+            input_names=["waveforms", "waveforms_lengths"],
+            output_names=["log_probs", "probs_lengths"],
+            dynamic_axes={
+                "waveforms": {0: "batch_size", 1: "n_samples"},
+                "waveforms_lengths": {0: "batch_size"},
+                "log_probs": {0: "batch_size", 2: "n_probs"},
+                "probs_lengths": {0: "batch_size"},
+            },
+            opset_version=17,
+            dynamo=False,
+        )
+        _check_onnx_parity(path, inputs, expected, atol=atol)
+
+    for export_format, path in paths.items():
+        logger.info(f"Exported {export_format.value} model to '{path}'.")
+    return paths
+
+
+def _run_eager(
+    asr_model: ASRModel,
+    transformer: T.MelSpectrogram,
+    waveforms: torch.Tensor,
+    waveforms_lengths: torch.Tensor,
+) -> tuple[torch.Tensor, torch.Tensor]:
+    transforms = transformer(waveforms)
+    transforms_lengths = (
+        torch.div(
+            waveforms_lengths,
+            transformer.spectrogram.hop_length,
+            rounding_mode="floor",
+        )
+        + 1
+    )
+    frames = torch.arange(transforms.shape[-1])
+    mask = frames < transforms_lengths.unsqueeze(-1)
+    return asr_model.model(transforms * mask.unsqueeze(1))
+
+
+def _check_parity(
+    name: str,
+    model: nn.Module,
+    inputs: tuple[torch.Tensor, torch.Tensor],
+    expected: torch.Tensor,
+    *,
+    atol: float,
+) -> None:
+    with torch.no_grad():
+        log_probs, _ = model(*inputs)
+    _compare(name, log_probs, expected, atol=atol)
+
+
+def _check_onnx_parity(
+    path: Path,
+    inputs: tuple[torch.Tensor, torch.Tensor],
+    expected: torch.Tensor,
+    *,
+    atol: float,
+) -> None:
+    try:
+        ort = importlib.import_module("onnxruntime")
+    except ImportError:
+        logger.warning("onnxruntime is not installed, skipping ONNX check.")
+        return
+
+    session = ort.InferenceSession(
+        path,
+        providers=["CPUExecutionProvider"],
+    )
+    log_probs, _ = session.run(
+        None,
+        {
+            "waveforms": inputs[0].numpy(),
+            "waveforms_lengths": inputs[1].numpy(),
+        },
+    )
+    _compare("ONNX", torch.from_numpy(log_probs), expected, atol=atol)
+
+
+def _compare(
+    name: str,
+    log_probs: torch.Tensor,
+    expected: torch.Tensor,
+    *,
+    atol: float,
+) -> None:
+    """Compare probabilities, as log-probabilities of unlikely tokens vary.
+
+    Raises:
+        ValueError: If the probabilities differ by more than the tolerance.
+    """
+    max_diff = (log_probs.exp() - expected.exp()).abs().max().item()
+    logger.info(f"{name} model max probability difference: {max_diff:.2e}")
+    if max_diff > atol:
+        msg = f"{name} model output differs from the eager model: {max_diff}"
+        raise ValueError(msg)
+
+
+def describe_tokenizer(
+    tokenizer: TextTokenizer,
+    sample_rate: int,
+) -> dict[str, tp.Any]:
+    """Describe a tokenizer for the consumers of an exported model.
+
+    Args:
+        tokenizer: Tokenizer the model is trained with
+        sample_rate: Sample rate the model is trained on
+
+    Returns:
+        Alphabet in the order of the tokens, blank token and sample rate.
+    """
+    return {
+        "alphabet": [
+            tokenizer.decode(torch.tensor([token]))
+            for token in range(tokenizer.alphabet_size)
+        ],
+        "blank_token": (
+            tokenizer.blank_token
+            if isinstance(tokenizer, CTCTextTokenizer)
+            else None
+        ),
+        "sample_rate": sample_rate,
+    }
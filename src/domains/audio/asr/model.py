@@ -7,6 +7,7 @@ import hydra
 import lightning as L
 import torch
 import torchaudio
+import torchaudio.transforms as T
 from lightning.pytorch.utilities.types import OptimizerLRScheduler
 from omegaconf import DictConfig
 from PIL import Image
@@ -36,8 +37,15 @@ class ASRModel(L.LightningModule):
         sample_rate: int,
         optimizer: DictConfig,
         scheduler: DictConfig | None = None,
+        transformer: DictConfig | None = None,
+        decoder: DictConfig | None = None,
+        augmenter: DictConfig | None = None,
+        spec_augmenter: DictConfig | None = None,
         *,
+        transform_on_device: bool = False,
+        downsize: int = 2,
         compile_model: bool = False,
+        compile_pad_multiple: int = 64,
         rank_zero_only: bool = env.LOGGING_ONLY_RANK_ZERO,
     ) -> None:
         """Constructor.
@@ -67,7 +75,21 @@ class ASRModel(L.LightningModule):
             sample_rate: Sample rate
             optimizer: Optimizer configuration
             scheduler: Scheduler configuration
+            transformer: Audio transformation configuration
+            decoder: Beam search decoder configuration used for testing
+                instead of greedy decoding
+            augmenter: Batch audio augmentation configuration applied to
+                the training waveforms on the device
+            spec_augmenter: Batch SpecAugment configuration applied to the
+                training transforms on the device, whether they are
+                computed on the device or read from the dataloader
+            transform_on_device: Whether to compute the audio transformation
+                of the batches on the device instead of the dataloader
+            downsize: Downsize factor of the model, used to recompute the
+                lengths of the augmented batches
             compile_model: Whether to compile the model
+            compile_pad_multiple: Multiple of frames the transforms are
+                padded to when the model is compiled
             rank_zero_only: Whether to log only on rank zero
         """
         super().__init__()
@@ -91,6 +113,33 @@ class ASRModel(L.LightningModule):
         else:
             self.loss = hydra.utils.instantiate(loss)
 
+        self.transformer = None
+        if transform_on_device:
+            logger.info(
+                f"Instantiating transformer: {transformer['_target_']}"
+            )
+            self.transformer = hydra.utils.instantiate(transformer)
+
+        self.augmenter = None
+        if transform_on_device and augmenter is not None:
+            logger.info(f"Instantiating augmenter: {augmenter['_target_']}")
+            self.augmenter = hydra.utils.instantiate(augmenter)
+
+        self.spec_augmenter = None
+        if spec_augmenter is not None:
+            logger.info(
+                f"Instantiating spec augmenter: {spec_augmenter['_target_']}"
+            )
+            self.spec_augmenter = hydra.utils.instantiate(spec_augmenter)
+
+        self.decoder = None
+        if decoder is not None:
+            logger.info(f"Instantiating decoder: {decoder['_target_']}")
+            # The tokenizer is not a config, so it is passed afterwards
+            self.decoder = hydra.utils.instantiate(decoder, _partial_=True)(
+                tokenizer=self.tokenizer,
+            )
+
         logger.info("Instantiating metrics")
         self.wer = WordErrorRate()
         self.cer = CharErrorRate()
@@ -99,6 +148,8 @@ class ASRModel(L.LightningModule):
             stype="power",
             top_db=80,
         )
+        # Graphs compiled in the process before the model is compiled
+        self._graphs_before_compile = 0
 
     def setup(
         self,
@@ -120,8 +171,90 @@ class ASRModel(L.LightningModule):
         Args:
             stage: Stage of the Lightning process.
         """
-        if self.hparams["compile_model"] and stage == "fit":
+        if self.hparams["compile_model"] and not isinstance(
+            self.model, torch._dynamo.eval_frame.OptimizedModule
+        ):
+            # Training and evaluation compile a graph each, and the stages
+            # share the compiled model
             self.model = torch.compile(self.model)
+            self._graphs_before_compile = torch._dynamo.utils.counters[
+                "stats"
+            ]["unique_graphs"]
+
+    def teardown(
+        self,
+        stage: tp.Literal["fit", "validate", "test", "predict"],
+    ) -> None:
+        """Lightning hook that is called at the end of each stage.
+
+        Shuts down the processes of the beam search decoder, which are
+        started again by the next decoded batch.
+
+        Args:
+            stage: Stage of the Lightning process.
+        """
+        if self.decoder is not None:
+            self.decoder.close()
+
+    def on_after_batch_transfer(
+        self,
+        batch: dict[str, torch.Tensor],
+        dataloader_idx: int,
+    ) -> dict[str, torch.Tensor]:
+        """Transform the padded waveforms of the batch on the device.
+
+        In training, the waveforms are first augmented by the augmenter,
+        and the lengths of the batch are recomputed as by the collator
+        since changing the tempo changes them.
+
+        The transformation runs once for the whole batch, and the frames
+        past the length of every transform are zeroed so that the batch
+        matches the one collated from the transforms of the dataloader.
+        Only the last frames, whose window reaches past the end of the
+        audio, differ since they see zero instead of reflection padding.
+
+        In training, the transforms are then augmented by the spec
+        augmenter within their lengths, including the transforms collated
+        by the dataloader from the feature cache.
+
+        When the model is compiled, the transforms are padded with zeros to
+        a multiple of compile_pad_multiple frames, and their batch and time
+        dimensions are marked as dynamic. Compiled graphs then handle every
+        batch instead of being recompiled for new lengths, and the lengths
+        stay in a few buckets for the kernels specialized on them.
+
+        Args:
+            batch: Batch of data on the device
+            dataloader_idx: Index of the dataloader
+
+        Returns:
+            Batch with the transforms.
+
+        Raises:
+            ValueError: If the batch has no transforms and the model has
+                no transformer.
+        """
+        if "transforms" not in batch:
+            if self.transformer is None:
+                msg = "Batch has no transforms and transform_on_device is off."
+                raise ValueError(msg)
+
+            with torch.autocast(device_type=self.device.type, enabled=False):
+                if self.augmenter is not None and self.training:
+                    batch.update(self._augment(batch))
+                transforms = self.transformer(batch["waveforms"].float())
+            frames = torch.arange(transforms.shape[-1], device=self.device)
+            mask = frames < batch["transforms_lengths"].unsqueeze(-1)
+            batch["transforms"] = transforms * mask.unsqueeze(1)
+
+        if self.spec_augmenter is not None and self.training:
+            batch["transforms"] = self.spec_augmenter(
+                batch["transforms"],
+                batch["transforms_lengths"],
+            )
+        if self.hparams["compile_model"]:
+            batch["transforms"] = self._pad_for_compile(batch["transforms"])
+        return batch
 
     def configure_optimizers(self) -> OptimizerLRScheduler:
         """Choose optimizers and lr schedulers to use in your optimization.
@@ -287,6 +420,7 @@ class ASRModel(L.LightningModule):
             batch,
             batch_idx,
             stage="test",
+            log_probs=log_probs if self.decoder is not None else None,
         )
 
         values = {"test_loss": loss, **metrics}
@@ -302,14 +436,111 @@ class ASRModel(L.LightningModule):
 
         return loss
 
+    def on_train_epoch_end(self) -> None:
+        """Log the compilation statistics after a training epoch."""
+        self._log_compile_stats(stage="train")
+
+    def on_validation_epoch_end(self) -> None:
+        """Log the compilation statistics after a validation epoch."""
+        self._log_compile_stats(stage="val")
+
+    def on_test_epoch_end(self) -> None:
+        """Log the compilation statistics after a test epoch."""
+        self._log_compile_stats(stage="test")
+
+    def _augment(
+        self,
+        batch: dict[str, torch.Tensor],
+    ) -> dict[str, torch.Tensor]:
+        waveforms, waveforms_lengths = self.augmenter(
+            batch["waveforms"].float(),
+            batch["waveforms_lengths"],
+        )
+        spectrogram = next(
+            module
+            for module in self.transformer.modules()
+            if isinstance(module, T.Spectrogram)
+        )
+        transforms_lengths = torch.div(
+            waveforms_lengths,
+            spectrogram.hop_length,
+            rounding_mode="floor",
+        ).add_(1)
+        downsize = self.hparams["downsize"]
+        return {
+            "waveforms": waveforms,
+            "waveforms_lengths": waveforms_lengths,
+            "transforms_lengths": transforms_lengths,
+            "probs_lengths": torch.div(
+                transforms_lengths + downsize - 1,
+                downsize,
+                rounding_mode="floor",
+            ),
+        }
+
+    def _pad_for_compile(self, transforms: torch.Tensor) -> torch.Tensor:
+        n_frames = transforms.shape[-1]
+        pad_multiple = self.hparams["compile_pad_multiple"]
+        transforms = torch.nn.functional.pad(
+            transforms,
+            (0, -n_frames % pad_multiple),
+        )
+        # Without marks, the first new length triggers a recompilation
+        torch._dynamo.mark_dynamic(transforms, 0)
+        torch._dynamo.mark_dynamic(transforms, 2)
+        return transforms
+
+    def _log_compile_stats(
+        self,
+        stage: tp.Literal["train", "val", "test"],
+    ) -> None:
+        if not isinstance(
+            self.model, torch._dynamo.eval_frame.OptimizedModule
+        ):
+            return
+        n_graphs = self._count_compiled_graphs()
+        # Compilation time of dynamo is global to the process
+        compile_time = sum(
+            torch._dynamo.utils.compilation_time_metrics.get(
+                "_compile.compile_inner", []
+            )
+        )
+        logger.info(
+            f"Compiled {n_graphs} graphs since the model is compiled by the "
+            f"end of the {stage} epoch, {compile_time:.1f}s of compilation "
+            "in total"
+        )
+        self.log_dict(
+            {
+                f"{stage}_compiled_graphs": float(n_graphs),
+                f"{stage}_compile_time": compile_time,
+            },
+            rank_zero_only=True,
+        )
+
+    def _count_compiled_graphs(self) -> int:
+        """Count the graphs compiled since the model is compiled.
+
+        Training and evaluation compile a graph each, so any other graph
+        is a recompilation, e.g. for a length not covered by the dynamic
+        dimensions. The counters of dynamo are global to the process, so
+        graphs of other modules compiled in the meantime are counted too.
+
+        Returns:
+            Number of graphs compiled by dynamo since the model is compiled.
+        """
+        n_graphs = torch._dynamo.utils.counters["stats"]["unique_graphs"]
+        return n_graphs - self._graphs_before_compile
+
     def _compute_loss(
         self,
         log_probs: torch.Tensor,
         batch: dict[str, torch.Tensor],
     ) -> torch.Tensor:
         if isinstance(self.loss, CTCLoss):
+            # CTC sums probabilities over long alignments, so it runs in fp32
             loss = self.loss(
-                log_probs=log_probs.permute(2, 0, 1),
+                log_probs=log_probs.float().permute(2, 0, 1),
                 targets=batch["tokens"],
                 input_lengths=batch["probs_lengths"],
                 target_lengths=batch["tokens_lengths"],
@@ -325,17 +556,37 @@ class ASRModel(L.LightningModule):
         batch: dict[str, torch.Tensor],
         batch_idx: int,
         stage: tp.Literal["train", "val", "test"] = "train",
+        log_probs: torch.Tensor | None = None,
     ) -> dict[str, torch.Tensor]:
         target_texts = [
-            self.tokenizer.decode(tokens).strip() for tokens in batch["tokens"]
+            text.strip()
+            for text in self.tokenizer.decode_batch(
+                batch["tokens"],
+                batch["tokens_lengths"],
+            )
         ]
         if isinstance(self.tokenizer, CTCTextTokenizer):
-            pred_texts = [
-                self.tokenizer.ctc_decode(tokens) for tokens in pred_tokens
-            ]
-            pred_raw_texts = [
-                self.tokenizer.decode(tokens) for tokens in pred_tokens
-            ]
+            # Log-probabilities are only given to decode with beam search
+            pred_texts = (
+                self.tokenizer.ctc_decode_batch(
+                    pred_tokens,
+                    batch["probs_lengths"],
+                )
+                if log_probs is None
+                else self.decoder.decode_batch(
+                    log_probs,
+                    batch["probs_lengths"],
+                )
+            )
+            # Raw predictions are only needed for logging
+            pred_raw_texts = (
+                self.tokenizer.decode_batch(
+                    pred_tokens,
+                    batch["probs_lengths"],
+                )
+                if batch_idx % self.trainer.log_every_n_steps == 0
+                else None
+            )
 
         self._log_naive_predictions(
             batch_idx,
@@ -355,16 +606,23 @@ class ASRModel(L.LightningModule):
         batch_idx: int,
         stage: tp.Literal["train", "val", "test"],
     ) -> None:
-        if batch_idx % self.trainer.log_every_n_steps != 0:
+        if (
+            batch_idx % self.trainer.log_every_n_steps != 0
+            or "waveforms" not in batch
+        ):
             return
 
         idx = random.randint(0, len(batch["waveforms"]) - 1)
         waveform: torch.Tensor = batch["waveforms"][idx]
+        if "waveforms_lengths" in batch:
+            waveform = waveform[..., : batch["waveforms_lengths"][idx]]
 
         audio_name = " ".join(
             word.capitalize() for word in f"{stage} audio".split()
         )
-        audio_caption = self.tokenizer.decode(batch["tokens"][idx])
+        audio_caption = self.tokenizer.decode(
+            batch["tokens"][idx, : batch["tokens_lengths"][idx]]
+        )
         self.logger.experiment.log(
             {
                 audio_name: wandb.Audio(
@@ -376,6 +634,7 @@ class ASRModel(L.LightningModule):
         )
 
         transform = batch["transforms"][idx]
+        transform = transform[..., : batch["transforms_lengths"][idx]]
         transform_db = self.amplitude_to_db(transform)
         transform_image_buffer = plot_transform(
             transform_db,
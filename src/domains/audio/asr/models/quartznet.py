@@ -5,10 +5,15 @@ https://arxiv.org/abs/1904.03288 (Jasper)
 https://arxiv.org/abs/1910.10261 (QuartzNet)
 """
 
+import contextlib
+import functools
 from collections import OrderedDict
+from collections.abc import Generator
 
 import torch
 from torch import nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+from torch.utils.checkpoint import checkpoint
 
 
 class TCSConv(nn.Module):
@@ -120,6 +125,19 @@ class QuartzBlock(nn.Module):
             nn.BatchNorm1d(num_features=out_channels),
         )
 
+    def fuse_for_inference(self) -> None:
+        """Fold batch normalizations into the pointwise and skip convolutions.
+
+        The batch normalizations are replaced with identities.
+        """
+        for subblock in self.quartz_blocks:
+            subblock[0].pointwise_conv = _fuse_batch_norm(
+                subblock, subblock[0].pointwise_conv
+            )
+        self.skip_connection[0] = _fuse_batch_norm(
+            self.skip_connection, self.skip_connection[0]
+        )
+
     def forward(self, x: torch.Tensor) -> torch.Tensor:
         """Defines the QuartzNet's block structure.
 
@@ -135,7 +153,8 @@ class QuartzBlock(nn.Module):
                 if i == len(self.quartz_blocks) - 1 and isinstance(
                     module, nn.ReLU
                 ):
-                    x += residual
+                    # Out of place, as autograd may have saved x for backward
+                    x = residual + x
                 x = module(x)
         return x
 
@@ -159,6 +178,7 @@ class QuartzNet(nn.Module):
         block_channels: list[tuple[int, int]] | None = None,
         block_kernel_sizes: list[int] | None = None,
         dropout_rate: float = 0.25,
+        checkpoint_every: int = 0,
     ) -> None:
         """Constructor.
 
@@ -176,8 +196,18 @@ class QuartzNet(nn.Module):
             normalization_name: name of normalization layer (e.g. BatchNorm1d)
             activation_name: name of activation layer (e.g. ReLU)
             dropout_rate: dropout rate for all layers
+            checkpoint_every: number of consecutive blocks whose activations
+                are recomputed in backward instead of stored when training,
+                or 0 to store all activations
+
+        Raises:
+            ValueError: If checkpoint_every is negative.
         """
         super().__init__()
+        if checkpoint_every < 0:
+            msg = f"checkpoint_every must be non-negative: {checkpoint_every}"
+            raise ValueError(msg)
+        self.checkpoint_every = checkpoint_every
 
         # Layer C_1: Conv-BN-ReLU
         initial_channels = block_channels[0][0]
@@ -257,6 +287,48 @@ class QuartzNet(nn.Module):
             kernel_size=1,
         )
 
+    @property
+    def context_frames(self) -> int:
+        """Number of input frames on either side an output depends on.
+
+        Returns:
+            Half of the receptive field of the model in input frames.
+        """
+        context, stride = 0, 1
+        # Convolutions are registered in the order they are applied,
+        # except for the skip connections which are pointwise
+        for module in self.modules():
+            if isinstance(module, nn.Conv1d):
+                context += (
+                    stride * module.dilation[0] * (module.kernel_size[0] - 1)
+                ) // 2
+                stride *= module.stride[0]
+        return context
+
+    def fuse_for_inference(self) -> "QuartzNet":
+        """Fold batch normalizations into the preceding convolutions in place.
+
+        In eval mode a batch normalization is an affine transformation per
+        channel, so it is merged into the weights and biases of the
+        convolution before it, which saves a pass over every activation.
+        The model can not be trained afterwards.
+
+        Returns:
+            The fused model.
+
+        Raises:
+            ValueError: If the model is in training mode.
+        """
+        if self.training:
+            msg = "Batch normalizations can only be fused in eval mode."
+            raise ValueError(msg)
+
+        for layers in (self.C1, self.C2, self.C3):
+            layers[0] = _fuse_batch_norm(layers, layers[0])
+        for block in self.Bs:
+            block.fuse_for_inference()
+        return self
+
     def forward(self, x: torch.Tensor) -> torch.Tensor:
         """Defines the QuartzNet structure.
 
@@ -264,11 +336,107 @@ class QuartzNet(nn.Module):
             x: audio signal of shape (batch_size, n_channels, n_samples).
 
         Returns:
-            Log-softmax of the output.
+            Log-softmax of the output in fp32, even under autocast.
         """
         x = self.C1(x)
-        x = self.Bs(x)
+        if self.checkpoint_every and self.training and torch.is_grad_enabled():
+            x = self._checkpoint_blocks(x)
+        else:
+            x = self.Bs(x)
         x = self.C2(x)
         x = self.C3(x)
         x = self.C4(x)
-        return x.log_softmax(dim=1)
+        # Half precision underflows the probabilities of unlikely tokens
+        return x.float().log_softmax(dim=1)
+
+    def _checkpoint_blocks(self, x: torch.Tensor) -> torch.Tensor:
+        """Run the blocks keeping only the inputs of every segment.
+
+        Each segment of checkpoint_every blocks is run again in backward,
+        with the same dropout masks, and its batch normalizations do not
+        update the running statistics a second time.
+
+        Args:
+            x: tensor of shape (batch_size, in_channels, transform_length).
+
+        Returns:
+            Tensor of shape (batch_size, out_channels, transform_length).
+        """
+        blocks = list(self.Bs)
+        for start in range(0, len(blocks), self.checkpoint_every):
+            segment = nn.Sequential(
+                *blocks[start : start + self.checkpoint_every]
+            )
+            x = checkpoint(
+                segment,
+                x,
+                use_reentrant=False,
+                context_fn=functools.partial(_recompute_contexts, segment),
+            )
+        return x
+
+
+def _recompute_contexts(
+    module: nn.Module,
+) -> tuple[contextlib.AbstractContextManager, ...]:
+    """Contexts of the forward pass and the recomputation of a checkpoint.
+
+    Args:
+        module: checkpointed module
+
+    Returns:
+        No-op context for the forward pass and a context freezing
+        the running statistics of the batch normalizations for
+        the recomputation.
+    """
+    return contextlib.nullcontext(), _freeze_running_stats(module)
+
+
+@contextlib.contextmanager
+def _freeze_running_stats(module: nn.Module) -> Generator[None, None, None]:
+    """Keep the running statistics of the batch normalizations unchanged.
+
+    Args:
+        module: module containing the batch normalizations
+
+    Yields:
+        None.
+    """
+    batch_norms = [
+        m for m in module.modules() if isinstance(m, nn.BatchNorm1d)
+    ]
+    states = [
+        (batch_norm.momentum, batch_norm.num_batches_tracked.clone())
+        for batch_norm in batch_norms
+    ]
+    # A zero momentum keeps the running statistics as they are
+    for batch_norm in batch_norms:
+        batch_norm.momentum = 0.0
+    try:
+        yield
+    finally:
+        for batch_norm, (momentum, num_batches_tracked) in zip(
+            batch_norms, states, strict=True
+        ):
+            batch_norm.momentum = momentum
+            batch_norm.num_batches_tracked.copy_(num_batches_tracked)
+
+
+def _fuse_batch_norm(
+    layers: nn.Sequential | nn.ModuleList,
+    conv: nn.Conv1d,
+) -> nn.Conv1d:
+    """Fold the batch normalization of a layer into its convolution.
+
+    Args:
+        layers: layers with the batch normalization second
+        conv: convolution preceding the batch normalization
+
+    Returns:
+        Fused convolution, or the convolution itself if already fused.
+    """
+    if not isinstance(layers[1], nn.BatchNorm1d):
+        return conv
+    fused_conv = fuse_conv_bn_eval(conv, layers[1])
+    layers[1] = nn.Identity()
+    return fused_conv
@@ -0,0 +1,238 @@
+"""Static post-training int8 quantization of ASR models."""
+
+import copy
+import itertools
+import json
+import time
+import typing as tp
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+import torch
+from torch import nn
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+from torchmetrics.functional.text import char_error_rate, word_error_rate
+
+from src.domains.audio.asr.inference import (
+    TOKENIZER_FILENAME,
+    ASRInferenceModel,
+    describe_tokenizer,
+)
+from src.domains.audio.dsp.features import ConvMelSpectrogram
+from src.domains.common.preprocessing.tokenizers import CTCTextTokenizer
+from src.utils.logger import logger
+
+REPORT_FILENAME = "quantization_report.json"
+
+
+def quantize_model(
+    model: nn.Module,
+    calibration_transforms: Iterable[torch.Tensor],
+    *,
+    backend: str = "x86",
+) -> torch.fx.GraphModule:
+    """Quantize the weights and activations of a model to int8.
+
+    Batch normalizations and ReLUs are fused into the convolutions, and the
+    ranges of the activations are observed on the calibration transforms.
+    Depthwise convolutions stay in fp32, as int8 kernels for their long
+    kernel sizes are slower than the fp32 ones on CPU.
+
+    Args:
+        model: Acoustic model in eval mode with unfused batch normalizations
+        calibration_transforms: Batches of transforms of shape
+            (batch_size, n_features, n_frames)
+        backend: Quantized engine to run the model with
+
+    Returns:
+        Quantized copy of the model.
+
+    Raises:
+        ValueError: If there are no calibration transforms.
+    """
+    torch.backends.quantized.engine = backend
+    model = copy.deepcopy(model).cpu().eval()
+    qconfig_mapping = get_default_qconfig_mapping(backend)
+    for name, module in model.named_modules():
+        if isinstance(module, nn.Conv1d) and module.groups > 1:
+            qconfig_mapping.set_module_name(name, None)
+
+    calibration_transforms = iter(calibration_transforms)
+    example_transforms = next(calibration_transforms, None)
+    if example_transforms is None:
+        msg = "At least one batch is required for calibration."
+        raise ValueError(msg)
+
+    prepared_model = prepare_fx(
+        model,
+        qconfig_mapping,
+        example_inputs=(example_transforms,),
+    )
+    with torch.no_grad():
+        for transforms in itertools.chain(
+            [example_transforms], calibration_transforms
+        ):
+            prepared_model(transforms)
+    return convert_fx(prepared_model)
+
+
+def quantize_asr_model(
+    inference_model: ASRInferenceModel,
+    model: nn.Module,
+    tokenizer: CTCTextTokenizer,
+    loader: Iterable[dict[str, torch.Tensor]],
+    *,
+    sample_rate: int,
+    output_dir: str | Path,
+    num_calibration_batches: int = 16,
+    num_evaluation_batches: int = 16,
+    backend: str = "x86",
+) -> dict[str, tp.Any]:
+    """Quantize an ASR model, evaluate it against fp32 and save it.
+
+    The first batches of the loader calibrate the quantized model and the
+    following ones evaluate both models. The quantized model is saved to
+    TorchScript along with the mel front end and the tokenizer, and the
+    report is saved next to it.
+
+    Args:
+        inference_model: Fused fp32 inference model
+        model: Acoustic model in eval mode with unfused batch normalizations
+        tokenizer: Tokenizer the model is trained with
+        loader: Validation loader of ASRData
+        sample_rate: Sample rate the model is trained on
+        output_dir: Directory to save the quantized model and the report to
+        num_calibration_batches: Number of batches to calibrate on
+        num_evaluation_batches: Number of batches to evaluate on
+        backend: Quantized engine to run the model with
+
+    Returns:
+        WER, CER and mean latency per batch of both models.
+
+    Raises:
+        ValueError: If the loader has no batches left for evaluation.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    batches = _iter_transforms(loader, inference_model.frontend, tokenizer)
+
+    logger.info(f"Calibrating on {num_calibration_batches} batches")
+    quantized_model = quantize_model(
+        model,
+        (
+            transforms
+            for transforms, *_ in itertools.islice(
+                batches, num_calibration_batches
+            )
+        ),
+        backend=backend,
+    )
+
+    logger.info(f"Evaluating on {num_evaluation_batches} batches")
+    evaluation_batches = list(
+        itertools.islice(batches, num_evaluation_batches)
+    )
+    if not evaluation_batches:
+        msg = "No batches are left for evaluation after calibration."
+        raise ValueError(msg)
+    report = _evaluate(
+        {"fp32": inference_model.model, "int8": quantized_model},
+        evaluation_batches,
+        tokenizer,
+    )
+    report["int8"]["speedup"] = (
+        report["fp32"]["latency"] / report["int8"]["latency"]
+    )
+
+    quantized_inference_model = ASRInferenceModel(
+        copy.deepcopy(inference_model.frontend).cpu(),
+        quantized_model,
+        inference_model.downsize,
+    ).eval()
+    example_inputs = (
+        torch.randn(2, sample_rate).clamp(-1, 1),
+        torch.tensor([sample_rate, sample_rate // 2]),
+    )
+    with torch.no_grad():
+        traced_model = torch.jit.trace(
+            quantized_inference_model, example_inputs
+        )
+    path = output_dir.joinpath("model_int8.pt")
+    torch.jit.save(
+        traced_model,
+        path,
+        _extra_files={
+            TOKENIZER_FILENAME: json.dumps(
+                describe_tokenizer(tokenizer, sample_rate),
+                ensure_ascii=False,
+            )
+        },
+    )
+    output_dir.joinpath(REPORT_FILENAME).write_text(
+        json.dumps(report, indent=2)
+    )
+    logger.info(
+        f"Exported int8 model to '{path}': "
+        + ", ".join(
+            f"{name} WER {metrics['wer']:.4f} CER {metrics['cer']:.4f} "
+            f"latency {metrics['latency'] * 1000:.1f}ms"
+            for name, metrics in report.items()
+        )
+        + f", speedup {report['int8']['speedup']:.2f}x"
+    )
+    return report
+
+
+def _iter_transforms(
+    loader: Iterable[dict[str, torch.Tensor]],
+    frontend: ConvMelSpectrogram,
+    tokenizer: CTCTextTokenizer,
+) -> Iterator[tuple[torch.Tensor, torch.Tensor, list[str]]]:
+    for batch in loader:
+        if "transforms" in batch:
+            transforms = batch["transforms"]
+        else:
+            # Waveforms are transformed on the device when training
+            with torch.no_grad():
+                transforms = frontend(batch["waveforms"])
+            frames = torch.arange(transforms.shape[-1])
+            mask = frames < batch["transforms_lengths"].unsqueeze(-1)
+            transforms *= mask.unsqueeze(1)
+        target_texts = [
+            text.strip()
+            for text in tokenizer.decode_batch(
+                batch["tokens"], batch["tokens_lengths"]
+            )
+        ]
+        yield transforms, batch["probs_lengths"], target_texts
+
+
+def _evaluate(
+    models: dict[str, nn.Module],
+    batches: list[tuple[torch.Tensor, torch.Tensor, list[str]]],
+    tokenizer: CTCTextTokenizer,
+) -> dict[str, dict[str, float]]:
+    target_texts = [text for *_, texts in batches for text in texts]
+    report = {}
+    for name, model in models.items():
+        pred_texts, elapsed_time = [], 0.0
+        with torch.no_grad():
+            # Warm up the kernels before timing
+            model(batches[0][0])
+            for transforms, probs_lengths, _ in batches:
+                start_time = time.perf_counter()
+                log_probs = model(transforms)
+                elapsed_time += time.perf_counter() - start_time
+                pred_texts.extend(
+                    text.strip()
+                    for text in tokenizer.ctc_decode_batch(
+                        log_probs.argmax(dim=1), probs_lengths
+                    )
+                )
+        report[name] = {
+            "wer": word_error_rate(pred_texts, target_texts).item(),
+            "cer": char_error_rate(pred_texts, target_texts).item(),
+            "latency": elapsed_time / max(len(batches), 1),
+        }
+    return report
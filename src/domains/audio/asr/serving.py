@@ -0,0 +1,388 @@
+"""Local HTTP inference server with dynamic batching of requests."""
+
+import asyncio
+import bisect
+import io
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import torch
+from attrs import define, field
+
+from src.domains.audio.asr.inference import ASRInferenceModel
+from src.domains.audio.dsp.audio import load_waveform
+from src.domains.common.preprocessing.tokenizers import CTCTextTokenizer
+from src.utils.logger import logger
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+@define(kw_only=True)
+class Histogram:
+    """Cumulative histogram in the Prometheus text format.
+
+    Attributes:
+        name (str): Name of the metric.
+        description (str): Description of the metric.
+        buckets (tuple[float, ...]): Sorted upper bounds of the buckets.
+    """
+
+    name: str = field()
+    description: str = field()
+    buckets: tuple[float, ...] = field()
+
+    _counts: list[int] = field(init=False)
+    _sum: float = field(default=0.0, init=False)
+
+    def __attrs_post_init__(self) -> None:
+        # The last bucket counts the values above every bound
+        self._counts = [0] * (len(self.buckets) + 1)
+
+    def observe(self, value: float) -> None:
+        """Add a value to the histogram.
+
+        Args:
+            value: Observed value.
+        """
+        self._counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sum += value
+
+    def render(self) -> str:
+        """Render the histogram in the Prometheus text format.
+
+        Returns:
+            Lines of the histogram.
+        """
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        count = 0
+        for bound, bucket_count in zip(
+            (*self.buckets, math.inf), self._counts, strict=True
+        ):
+            count += bucket_count
+            le = "+Inf" if bound == math.inf else f"{bound:g}"
+            lines.append(f'{self.name}_bucket{{le="{le}"}} {count}')
+        lines.extend(
+            [f"{self.name}_sum {self._sum:g}", f"{self.name}_count {count}"]
+        )
+        return "\n".join(lines) + "\n"
+
+
+@define(kw_only=True)
+class ASRServer:
+    """Asyncio HTTP server transcribing audio with dynamic batching.
+
+    Uploaded audio is decoded, resampled and transformed in a thread pool,
+    so that the event loop only moves bytes. Concurrent requests are put in
+    a queue and coalesced into a padded batch until the batch is full or
+    the oldest request has waited for the maximum latency. Batches run one
+    at a time in a dedicated thread.
+
+    Endpoints:
+        POST /transcribe: Audio file as the body, returns JSON with the text
+            and the audio duration.
+        GET /metrics: Latency and batch size histograms in the Prometheus
+            text format.
+        GET /health: Returns 200 once the server is up.
+
+    Attributes:
+        inference_model (ASRInferenceModel): Model with the mel front end.
+        tokenizer (CTCTextTokenizer): Tokenizer the model is trained with.
+        sample_rate (int): Sample rate the model is trained on.
+        max_batch_size (int): Maximum number of requests in a batch.
+        max_latency (float): Maximum time in seconds the oldest request
+            of a batch waits for other requests.
+        num_workers (int): Number of threads decoding and transforming
+            the audio.
+        max_body_size (int): Maximum size of an upload in bytes.
+        device (str, torch.device): Device to run the model on.
+    """
+
+    inference_model: ASRInferenceModel = field()
+    tokenizer: CTCTextTokenizer = field()
+    sample_rate: int = field()
+    max_batch_size: int = field(default=32)
+    max_latency: float = field(default=0.05)
+    num_workers: int = field(default=4)
+    max_body_size: int = field(default=2**26)
+    device: str | torch.device = field(default="cpu")
+
+    request_latency: Histogram = field(
+        factory=lambda: Histogram(
+            name="asr_request_latency_seconds",
+            description="Time from receiving an upload to responding.",
+            buckets=LATENCY_BUCKETS,
+        ),
+        init=False,
+    )
+    batch_latency: Histogram = field(
+        factory=lambda: Histogram(
+            name="asr_batch_latency_seconds",
+            description="Time to run the model on a batch.",
+            buckets=LATENCY_BUCKETS,
+        ),
+        init=False,
+    )
+    batch_size: Histogram = field(
+        factory=lambda: Histogram(
+            name="asr_batch_size",
+            description="Number of requests in a batch.",
+            buckets=BATCH_SIZE_BUCKETS,
+        ),
+        init=False,
+    )
+
+    _queue: asyncio.Queue | None = field(default=None, init=False)
+    _batching_task: asyncio.Task | None = field(default=None, init=False)
+    _transform_pool: ThreadPoolExecutor = field(init=False)
+    _model_pool: ThreadPoolExecutor = field(init=False)
+
+    def __attrs_post_init__(self) -> None:
+        self.inference_model = self.inference_model.to(self.device).eval()
+        self._transform_pool = ThreadPoolExecutor(
+            self.num_workers, thread_name_prefix="asr-transform"
+        )
+        self._model_pool = ThreadPoolExecutor(
+            1, thread_name_prefix="asr-model"
+        )
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8000) -> None:
+        """Serve requests until cancelled.
+
+        Args:
+            host: Host to bind to.
+            port: Port to bind to, or 0 for any free port.
+        """
+        server = await self.start(host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.stop()
+
+    def stop(self) -> None:
+        """Stop the batching loop and the thread pools."""
+        if self._batching_task is not None:
+            self._batching_task.cancel()
+            self._batching_task = None
+        self._transform_pool.shutdown(wait=False, cancel_futures=True)
+        self._model_pool.shutdown(wait=False, cancel_futures=True)
+
+    async def start(self, host: str, port: int) -> asyncio.Server:
+        """Start the batching loop and the HTTP server.
+
+        Args:
+            host: Host to bind to.
+            port: Port to bind to, or 0 for any free port.
+
+        Returns:
+            The running server.
+        """
+        self._queue = asyncio.Queue()
+        self._batching_task = asyncio.create_task(self._run_batches())
+        server = await asyncio.start_server(self._handle, host, port)
+        address = server.sockets[0].getsockname()
+        logger.info(f"Serving ASR model on http://{address[0]}:{address[1]}")
+        return server
+
+    async def transcribe(self, audio: bytes) -> dict[str, str | float]:
+        """Transcribe an audio file in the next batch.
+
+        Args:
+            audio: Contents of the audio file.
+
+        Returns:
+            Transcription and duration of the audio.
+        """
+        loop = asyncio.get_running_loop()
+        waveform, transform = await loop.run_in_executor(
+            self._transform_pool, self._transform, audio
+        )
+        future = loop.create_future()
+        await self._queue.put((transform, future))
+        return {
+            "text": await future,
+            "audio_duration": waveform.shape[-1] / self.sample_rate,
+        }
+
+    def _transform(self, audio: bytes) -> tuple[torch.Tensor, torch.Tensor]:
+        waveform = load_waveform(
+            io.BytesIO(audio),
+            sample_rate=self.sample_rate,
+        ).mean(dim=0)
+        with torch.inference_mode():
+            transform = self.inference_model.frontend(
+                waveform.to(self.device).unsqueeze(0)
+            )[0]
+        return waveform, transform
+
+    async def _run_batches(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_latency
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                try:
+                    batch.append(
+                        self._queue.get_nowait()
+                        if timeout <= 0
+                        else await asyncio.wait_for(self._queue.get(), timeout)
+                    )
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+
+            # Requests whose handlers were cancelled, e.g. on shutdown,
+            # are not waited for
+            batch = [(t, f) for t, f in batch if not f.cancelled()]
+            if not batch:
+                continue
+            self.batch_size.observe(len(batch))
+            start_time = time.perf_counter()
+            try:
+                texts = await loop.run_in_executor(
+                    self._model_pool,
+                    self._predict,
+                    [transform for transform, _ in batch],
+                )
+            except Exception as e:
+                # The loop serves every later request, so it keeps running
+                logger.exception(f"Failed to transcribe a batch: {e}")
+                for _, future in batch:
+                    if not future.cancelled():
+                        future.set_exception(e)
+                continue
+            self.batch_latency.observe(time.perf_counter() - start_time)
+            for (_, future), text in zip(batch, texts, strict=True):
+                if not future.cancelled():
+                    future.set_result(text)
+
+    def _predict(self, transforms: list[torch.Tensor]) -> list[str]:
+        transforms_lengths = torch.tensor(
+            [transform.shape[-1] for transform in transforms],
+            device=self.device,
+        )
+        batch = torch.zeros(
+            len(transforms),
+            transforms[0].shape[0],
+            int(transforms_lengths.max()),
+            device=self.device,
+        )
+        for i, transform in enumerate(transforms):
+            batch[i, :, : transform.shape[-1]] = transform
+        downsize = self.inference_model.downsize
+        with torch.inference_mode():
+            log_probs = self.inference_model.model(batch)
+            texts = self.tokenizer.ctc_decode_batch(
+                log_probs.argmax(dim=1),
+                torch.div(
+                    transforms_lengths + downsize - 1,
+                    downsize,
+                    rounding_mode="floor",
+                ),
+            )
+        return [text.strip() for text in texts]
+
+    async def _handle(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        start_time = time.perf_counter()
+        try:
+            try:
+                status, body = await self._route(reader)
+            except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+                status, body = (
+                    HTTPStatus.BAD_REQUEST,
+                    {"error": "Bad request"},
+                )
+            except Exception as e:
+                logger.exception(f"Failed to handle a request: {e}")
+                status, body = (
+                    HTTPStatus.INTERNAL_SERVER_ERROR,
+                    {"error": "Internal server error"},
+                )
+            self._respond(writer, status, body)
+            await writer.drain()
+        finally:
+            writer.close()
+        self.request_latency.observe(time.perf_counter() - start_time)
+
+    @staticmethod
+    def _respond(
+        writer: asyncio.StreamWriter,
+        status: HTTPStatus,
+        body: dict | str,
+    ) -> None:
+        payload = (
+            body.encode()
+            if isinstance(body, str)
+            else json.dumps(body, ensure_ascii=False).encode()
+        )
+        content_type = (
+            "text/plain; version=0.0.4"
+            if isinstance(body, str)
+            else "application/json"
+        )
+        writer.write(
+            (
+                f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                "Connection: close\r\n\r\n"
+            ).encode()
+            + payload
+        )
+
+    async def _route(
+        self,
+        reader: asyncio.StreamReader,
+    ) -> tuple[HTTPStatus, dict | str]:
+        # Unpacking a malformed request line raises a ValueError
+        method, path, _ = (await reader.readline()).decode("latin-1").split()
+        headers = {}
+        while (line := await reader.readline()) not in {b"\r\n", b"\n", b""}:
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if method == "GET" and path == "/health":
+            return HTTPStatus.OK, {"status": "ok"}
+        if method == "GET" and path == "/metrics":
+            return HTTPStatus.OK, "".join(
+                histogram.render()
+                for histogram in (
+                    self.request_latency,
+                    self.batch_latency,
+                    self.batch_size,
+                )
+            )
+        if path != "/transcribe":
+            return HTTPStatus.NOT_FOUND, {"error": "Not found"}
+        if method != "POST":
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "Use POST"}
+
+        return await self._transcribe_upload(reader, headers)
+
+    async def _transcribe_upload(
+        self,
+        reader: asyncio.StreamReader,
+        headers: dict[str, str],
+    ) -> tuple[HTTPStatus, dict]:
+        content_length = int(headers.get("content-length", 0))
+        if content_length > self.max_body_size:
+            return HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {
+                "error": f"Upload exceeds {self.max_body_size} bytes"
+            }
+        audio = await reader.readexactly(content_length)
+        try:
+            return HTTPStatus.OK, await self.transcribe(audio)
+        except RuntimeError as e:
+            logger.warning(f"Failed to transcribe an upload: {e}")
+            return HTTPStatus.UNPROCESSABLE_ENTITY, {"error": str(e)}
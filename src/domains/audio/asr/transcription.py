@@ -0,0 +1,463 @@
+"""Batch and chunked transcription of audio files."""
+
+import itertools
+import json
+import math
+import time
+from collections.abc import Iterable, Iterator, Sequence
+from pathlib import Path
+
+import torch
+from attrs import define, field
+from torch.utils.data import DataLoader, Dataset
+
+from src.domains.audio.asr.data import DurationBatchSampler
+from src.domains.audio.asr.decoding import CTCBeamSearchDecoder
+from src.domains.audio.asr.inference import ASRInferenceModel
+from src.domains.audio.dsp.audio import (
+    get_audio_duration,
+    load_waveform,
+    read_audio_blocks,
+)
+from src.domains.common.preprocessing.tokenizers import CTCTextTokenizer
+from src.utils.logger import logger
+
+AUDIO_EXTENSIONS = frozenset({".flac", ".mp3", ".ogg", ".opus", ".wav"})
+
+
+def find_audio_files(source: str | Path) -> list[str]:
+    """Find the audio files to transcribe.
+
+    Args:
+        source: Directory searched recursively for audio files, or
+            a manifest with a path per line relative to the manifest.
+
+    Returns:
+        Paths to the audio files.
+
+    Raises:
+        FileNotFoundError: If the source does not exist.
+    """
+    source = Path(source)
+    if source.is_dir():
+        return sorted(
+            str(path)
+            for path in source.rglob("*")
+            if path.suffix.lower() in AUDIO_EXTENSIONS
+        )
+    if source.is_file():
+        return [
+            str(source.parent.joinpath(line.strip()))
+            for line in source.read_text().splitlines()
+            if line.strip()
+        ]
+    msg = f"Audio source not found: {source}"
+    raise FileNotFoundError(msg)
+
+
+@define(kw_only=True)
+class _AudioDecoder(Dataset):
+    """Decode and resample audio files into mono waveforms."""
+
+    audio_paths: Sequence[str] = field()
+    sample_rate: int = field()
+
+    def __getitem__(self, idx: int) -> tuple[int, torch.Tensor]:
+        waveform = load_waveform(
+            self.audio_paths[idx],
+            sample_rate=self.sample_rate,
+        )
+        return idx, waveform.mean(dim=0)
+
+    def __len__(self) -> int:
+        return len(self.audio_paths)
+
+
+@define(kw_only=True)
+class _AudioInfoReader(Dataset):
+    """Read the durations of audio files from their headers."""
+
+    audio_paths: Sequence[str] = field()
+
+    def __getitem__(self, idx: int) -> float:
+        return get_audio_duration(self.audio_paths[idx])
+
+    def __len__(self) -> int:
+        return len(self.audio_paths)
+
+
+def _iter_duration_batches(
+    durations: Iterable[float],
+    read_durations: list[float],
+    *,
+    window_size: int,
+    max_duration: float,
+    max_batch_size: int | None,
+) -> Iterator[list[int]]:
+    # Files are sorted by duration within windows of consecutive files, so
+    # the first batches are ready once a window of durations is read
+    durations = iter(durations)
+    while window := list(itertools.islice(durations, window_size)):
+        window_start = len(read_durations)
+        read_durations.extend(window)
+        sampler = DurationBatchSampler(
+            window,
+            max_duration,
+            max_batch_size=max_batch_size,
+            shuffle=False,
+        )
+        for batch in sampler:
+            yield [window_start + idx for idx in batch]
+
+
+def _collate(
+    batch: list[tuple[int, torch.Tensor]],
+) -> tuple[list[int], torch.Tensor, torch.Tensor]:
+    indices = [idx for idx, _ in batch]
+    waveforms_lengths = torch.tensor(
+        [len(waveform) for _, waveform in batch],
+        dtype=torch.long,
+    )
+    waveforms = torch.zeros(len(batch), int(waveforms_lengths.max()))
+    for i, (_, waveform) in enumerate(batch):
+        waveforms[i, : len(waveform)] = waveform
+    return indices, waveforms, waveforms_lengths
+
+
+def transcribe_audio_files(
+    inference_model: ASRInferenceModel,
+    tokenizer: CTCTextTokenizer,
+    audio_paths: Sequence[str],
+    *,
+    output_path: str | Path,
+    sample_rate: int,
+    batch_max_duration: float = 600.0,
+    batch_size: int | None = None,
+    num_workers: int = 0,
+    sort_window_size: int = 4096,
+    device: str | torch.device = "cpu",
+    decoder: CTCBeamSearchDecoder | None = None,
+) -> None:
+    """Transcribe audio files with greedy or beam search CTC decoding.
+
+    The files are decoded and resampled in the dataloader workers while the
+    model runs, and batched by duration to limit padding. Durations are read
+    from the headers in the workers too, and files are only sorted within
+    windows of consecutive files, so transcription starts before all the
+    headers are read. Transcriptions are appended to a JSON Lines file as
+    soon as a batch is decoded, in the order of the batches rather than of
+    the files.
+
+    Args:
+        inference_model: Model from padded waveforms to log-probabilities
+        tokenizer: Tokenizer the model is trained with
+        audio_paths: Paths to the audio files
+        output_path: Path to the JSON Lines file to write
+        sample_rate: Sample rate the model is trained on
+        batch_max_duration: Maximum padded duration of a batch in seconds
+        batch_size: Maximum number of files in a batch
+        num_workers: Number of processes decoding the audio files
+        sort_window_size: Number of consecutive files sorted by duration
+            at a time
+        device: Device to run the model on
+        decoder: Beam search decoder, or None for greedy decoding
+    """
+    durations: list[float] = []
+    durations_loader = DataLoader(
+        _AudioInfoReader(audio_paths=audio_paths),
+        batch_size=None,
+        num_workers=num_workers,
+    )
+    loader = DataLoader(
+        _AudioDecoder(audio_paths=audio_paths, sample_rate=sample_rate),
+        batch_sampler=_iter_duration_batches(
+            durations_loader,
+            durations,
+            window_size=sort_window_size,
+            max_duration=batch_max_duration,
+            max_batch_size=batch_size,
+        ),
+        collate_fn=_collate,
+        num_workers=num_workers,
+        pin_memory=torch.device(device).type == "cuda",
+    )
+    inference_model = inference_model.to(device).eval()
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    logger.info(f"Transcribing {len(audio_paths)} audio files.")
+    start_time = time.perf_counter()
+    try:
+        with output_path.open("w") as output, torch.inference_mode():
+            for indices, waveforms, waveforms_lengths in loader:
+                log_probs, probs_lengths = inference_model(
+                    waveforms.to(device, non_blocking=True),
+                    waveforms_lengths.to(device, non_blocking=True),
+                )
+                texts = (
+                    tokenizer.ctc_decode_batch(
+                        log_probs.argmax(dim=1),
+                        probs_lengths,
+                    )
+                    if decoder is None
+                    else decoder.decode_batch(log_probs, probs_lengths)
+                )
+                for idx, text in zip(indices, texts, strict=True):
+                    record = {
+                        "audio_path": audio_paths[idx],
+                        "audio_duration": durations[idx],
+                        "text": text.strip(),
+                    }
+                    output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+    finally:
+        # The processes of the decoder are not needed after the files
+        if decoder is not None:
+            decoder.close()
+    _log_throughput(
+        sum(durations), time.perf_counter() - start_time, output_path
+    )
+
+
+def transcribe_long_audio_files(
+    transcriber: "ChunkedTranscriber",
+    audio_paths: Sequence[str],
+    *,
+    output_path: str | Path,
+) -> None:
+    """Transcribe long audio files one at a time in chunks.
+
+    Unlike transcribe_audio_files, memory does not grow with the duration
+    of the files.
+
+    Args:
+        transcriber: Chunked transcriber
+        audio_paths: Paths to the audio files
+        output_path: Path to the JSON Lines file to write
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    logger.info(f"Transcribing {len(audio_paths)} audio files in chunks.")
+    total_duration = 0.0
+    start_time = time.perf_counter()
+    with output_path.open("w") as output:
+        for audio_path in audio_paths:
+            # The duration is counted from the samples as they are read
+            blocks_lengths: list[int] = []
+            blocks = _record_lengths(
+                read_audio_blocks(
+                    audio_path,
+                    sample_rate=transcriber.sample_rate,
+                    block_duration=transcriber.chunk_duration,
+                ),
+                blocks_lengths,
+            )
+            text = "".join(transcriber.transcribe(blocks)).strip()
+            audio_duration = sum(blocks_lengths) / transcriber.sample_rate
+            record = {
+                "audio_path": audio_path,
+                "audio_duration": audio_duration,
+                "text": text,
+            }
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+            total_duration += audio_duration
+    _log_throughput(
+        total_duration, time.perf_counter() - start_time, output_path
+    )
+
+
+def _record_lengths(
+    blocks: Iterable[torch.Tensor],
+    lengths: list[int],
+) -> Iterator[torch.Tensor]:
+    for block in blocks:
+        lengths.append(len(block))
+        yield block
+
+
+def _log_throughput(
+    audio_duration: float,
+    elapsed_time: float,
+    output_path: Path,
+) -> None:
+    # Real-time factor is the processing time per second of audio
+    logger.info(
+        f"Transcribed {audio_duration:.1f}s of audio in {elapsed_time:.1f}s "
+        f"to '{output_path}', real-time factor: "
+        f"{elapsed_time / max(audio_duration, 1e-9):.4f}."
+    )
+
+
+@define(kw_only=True)
+class ChunkedTranscriber:
+    """Transcriber of long-form audio in chunks of bounded memory.
+
+    Audio is consumed block by block, and mel frames are computed as soon
+    as their samples arrive. The model runs on chunks of frames along with
+    enough frames of context on either side, and only the log-probabilities
+    of the chunk itself are kept. With the default context, the receptive
+    field of the model, they are the same as for the whole audio at once,
+    so chunks are stitched without seams. Memory depends on the chunk and
+    context durations only.
+
+    Attributes:
+        inference_model (ASRInferenceModel): Model with the mel front end.
+        tokenizer (CTCTextTokenizer): Tokenizer the model is trained with.
+        sample_rate (int): Sample rate the model is trained on.
+        chunk_duration (float): Duration of audio transcribed at a time in
+            seconds.
+        context_duration (float, None): Duration of audio on either side
+            of a chunk in seconds. Defaults to the receptive field of the
+            model; a shorter context is faster but alters the seams.
+        device (str, torch.device): Device to run the model on.
+    """
+
+    inference_model: ASRInferenceModel = field()
+    tokenizer: CTCTextTokenizer = field()
+    sample_rate: int = field()
+    chunk_duration: float = field(default=60.0)
+    context_duration: float | None = field(default=None)
+    device: str | torch.device = field(default="cpu")
+
+    def __attrs_post_init__(self) -> None:
+        self.inference_model = self.inference_model.to(self.device).eval()
+
+    def transcribe(
+        self, waveform_blocks: Iterable[torch.Tensor]
+    ) -> Iterator[str]:
+        """Transcribe audio with greedy CTC decoding chunk by chunk.
+
+        Args:
+            waveform_blocks: Consecutive blocks of the audio of shape
+                (n_samples,) at the sample rate of the model,
+                e.g. from read_audio_blocks.
+
+        Yields:
+            Text of every chunk, which add up to the transcript.
+        """
+        blank_token = self.tokenizer.blank_token
+        previous_token = torch.tensor([blank_token], device=self.device)
+        for log_probs in self.stream_log_probs(waveform_blocks):
+            # Continue the collapse of repeated tokens of the previous chunk
+            tokens = torch.cat([previous_token, log_probs.argmax(dim=-1)])
+            (text,) = self.tokenizer.ctc_decode_batch(tokens.unsqueeze(0))
+            yield text if previous_token.item() == blank_token else text[1:]
+            previous_token = tokens[-1:]
+
+    def transcribe_file(self, audio_path: str) -> Iterator[str]:
+        """Transcribe an audio file read block by block.
+
+        Args:
+            audio_path: Path to the audio file.
+
+        Yields:
+            Text of every chunk, which add up to the transcript.
+        """
+        yield from self.transcribe(
+            read_audio_blocks(
+                audio_path,
+                sample_rate=self.sample_rate,
+                block_duration=self.chunk_duration,
+            )
+        )
+
+    def stream_log_probs(
+        self,
+        waveform_blocks: Iterable[torch.Tensor],
+    ) -> Iterator[torch.Tensor]:
+        """Compute the log-probabilities of the tokens chunk by chunk.
+
+        Args:
+            waveform_blocks: Consecutive blocks of the audio of shape
+                (n_samples,) at the sample rate of the model.
+
+        Yields:
+            Log-probabilities of a chunk of shape (n_tokens, n_probs).
+        """
+        downsize = self.inference_model.downsize
+        hop_length = self.inference_model.frontend.hop_length
+        chunk_frames = _round_up(
+            self.chunk_duration * self.sample_rate / hop_length, downsize
+        )
+        context_frames = _round_up(
+            self.inference_model.model.context_frames
+            if self.context_duration is None
+            else self.context_duration * self.sample_rate / hop_length,
+            downsize,
+        )
+
+        buffer = None
+        buffer_start = chunk_start = 0
+        frames = self._stream_frames(waveform_blocks)
+        for new_frames in itertools.chain(frames, [None]):
+            if new_frames is not None:
+                buffer = (
+                    new_frames
+                    if buffer is None
+                    else torch.cat([buffer, new_frames], dim=-1)
+                )
+            if buffer is None:
+                return
+            buffer_end = buffer_start + buffer.shape[-1]
+            # Wait for the right context unless the audio has ended
+            while chunk_start < buffer_end and (
+                new_frames is None
+                or chunk_start + chunk_frames + context_frames <= buffer_end
+            ):
+                window_start = max(chunk_start - context_frames, 0)
+                window_end = min(
+                    chunk_start + chunk_frames + context_frames, buffer_end
+                )
+                with torch.inference_mode():
+                    log_probs = self.inference_model.model(
+                        buffer[
+                            None,
+                            :,
+                            window_start - buffer_start : window_end
+                            - buffer_start,
+                        ]
+                    )[0]
+                offset = (chunk_start - window_start) // downsize
+                n_probs = math.ceil(
+                    min(chunk_frames, buffer_end - chunk_start) / downsize
+                )
+                yield log_probs[:, offset : offset + n_probs].T
+                chunk_start += chunk_frames
+
+            # Drop the frames that are no longer in any context
+            n_dropped = max(chunk_start - context_frames - buffer_start, 0)
+            buffer = buffer[:, n_dropped:]
+            buffer_start += n_dropped
+
+    def _stream_frames(
+        self,
+        waveform_blocks: Iterable[torch.Tensor],
+    ) -> Iterator[torch.Tensor]:
+        frontend = self.inference_model.frontend
+        n_fft, hop_length = frontend.n_fft, frontend.hop_length
+        samples = torch.zeros(0, device=self.device)
+        is_left_padded = not frontend.center
+        for block in itertools.chain(waveform_blocks, [None]):
+            if block is not None:
+                samples = torch.cat([samples, block.to(self.device)])
+            # Reflection needs more samples than the padding
+            if not is_left_padded and (
+                block is None or len(samples) > n_fft // 2
+            ):
+                samples = frontend.pad(samples[None], right=False)[0]
+                is_left_padded = True
+            if block is None and frontend.center:
+                samples = frontend.pad(samples[None], left=False)[0]
+
+            n_frames = max((len(samples) - n_fft) // hop_length + 1, 0)
+            if is_left_padded and n_frames > 0:
+                with torch.inference_mode():
+                    yield frontend.transform_padded(
+                        samples[None, : (n_frames - 1) * hop_length + n_fft]
+                    )[0]
+                samples = samples[n_frames * hop_length :]
+
+
+def _round_up(value: float, multiple: int) -> int:
+    return math.ceil(value / multiple) * multiple
@@ -1,18 +1,24 @@
 """Functions for processing digital audio signals."""
 
+import typing as tp
+from collections.abc import Iterator, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import soundfile as sf
 import torch
 import torchaudio
 
 
 def load_waveform(
-    path: str,
+    path: str | tp.BinaryIO,
     *,
     sample_rate: int | None = None,
 ) -> torch.Tensor:
     """Load and optionally resample an audio file.
 
     Args:
-        path: Path to the audio file.
+        path: Path to the audio file or the file object.
         sample_rate: Sample rate to resample the audio to.
             If None, the original sample rate is used.
 
@@ -27,3 +33,74 @@ def load_waveform(
             new_freq=sample_rate,
         )
     return waveform
+
+
+def get_audio_duration(path: str | Path) -> float:
+    """Read the duration of an audio file from its header.
+
+    Args:
+        path: Path to the audio file.
+
+    Returns:
+        Duration in seconds.
+    """
+    audio_info = torchaudio.info(path)
+    return audio_info.num_frames / audio_info.sample_rate
+
+
+def get_audio_durations(
+    paths: Sequence[str | Path],
+    *,
+    num_workers: int | None = None,
+) -> list[float]:
+    """Read the durations of audio files from their headers in parallel.
+
+    Args:
+        paths: Paths to the audio files.
+        num_workers: Number of processes reading the headers.
+            Defaults to the number of CPUs.
+
+    Returns:
+        Durations in seconds in the order of the paths.
+    """
+    if not paths:
+        return []
+    with ProcessPoolExecutor(num_workers) as executor:
+        return list(executor.map(get_audio_duration, paths, chunksize=64))
+
+
+def read_audio_blocks(
+    path: str,
+    *,
+    sample_rate: int | None = None,
+    block_duration: float = 10.0,
+) -> Iterator[torch.Tensor]:
+    """Read an audio file sequentially in mono blocks.
+
+    Only a block of the file is in memory at a time. Blocks are resampled
+    independently, which slightly alters the samples next to their edges.
+
+    Args:
+        path: Path to the audio file.
+        sample_rate: Sample rate to resample the audio to.
+            If None, the original sample rate is used.
+        block_duration: Duration of a block in seconds.
+
+    Yields:
+        Blocks of the digital audio signal of shape (n_samples,).
+    """
+    orig_freq = sf.info(path).samplerate
+    for block in sf.blocks(
+        path,
+        blocksize=int(block_duration * orig_freq),
+        dtype="float32",
+        always_2d=True,
+    ):
+        waveform = torch.from_numpy(block).mean(dim=1)
+        if sample_rate and orig_freq != sample_rate:
+            waveform = torchaudio.functional.resample(
+                waveform,
+                orig_freq=orig_freq,
+                new_freq=sample_rate,
+            )
+        yield waveform
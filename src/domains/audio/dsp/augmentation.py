@@ -9,6 +9,7 @@ import torch
 import torchaudio
 import torchaudio.functional as F
 from attrs import define, field
+from torch import nn
 
 from src.domains.audio.dsp.audio import load_waveform
 from src.utils.logger import logger
@@ -21,6 +22,39 @@ NOISE_ASSET_URL = (
 )
 
 
+def load_rir(sample_rate: int) -> torch.Tensor:
+    """Load and process the Room Impulse Response (RIR).
+
+    Using RIR, we can make clean speech sound as though it has been uttered
+    in a conference room.
+
+    Taken from: https://pytorch.org/audio/master/tutorials/audio_data_augmentation_tutorial.html
+
+    Args:
+        sample_rate: Sample rate to load the RIR with.
+
+    Returns:
+        Room Impulse Response (RIR) of shape (1, n_length).
+    """
+    rir_path = torchaudio.utils.download_asset(RIR_ASSET_URL)
+    rir = load_waveform(rir_path, sample_rate=sample_rate)
+    rir = rir[:, int(sample_rate * 1.01) : int(sample_rate * 1.3)]
+    return rir / torch.linalg.vector_norm(rir, ord=2)
+
+
+def load_noise(sample_rate: int) -> torch.Tensor:
+    """Load the background noise.
+
+    Args:
+        sample_rate: Sample rate to load the noise with.
+
+    Returns:
+        Background noise of shape (1, n_length).
+    """
+    noise_path = torchaudio.utils.download_asset(NOISE_ASSET_URL)
+    return load_waveform(noise_path, sample_rate=sample_rate)
+
+
 @define(kw_only=True)
 class AudioAugmenter:
     """Augments digital audio signals.
@@ -51,21 +85,10 @@ class AudioAugmenter:
     def _load_rir(self) -> torch.Tensor:
         """Load and process the Room Impulse Response (RIR).
 
-        Using RIR, we can make clean speech sound as though it has been uttered
-        in a conference room.
-
-        Taken from: https://pytorch.org/audio/master/tutorials/audio_data_augmentation_tutorial.html
-
         Returns:
             Room Impulse Response (RIR).
         """
-        rir_path = torchaudio.utils.download_asset(RIR_ASSET_URL)
-        rir = load_waveform(rir_path, sample_rate=self.sample_rate)
-        rir = rir[
-            :,
-            int(self.sample_rate * 1.01) : int(self.sample_rate * 1.3),
-        ]
-        return rir / torch.linalg.vector_norm(rir, ord=2)
+        return load_rir(self.sample_rate)
 
     @_noise.default
     def _load_noise(self) -> torch.Tensor:
@@ -74,8 +97,7 @@ class AudioAugmenter:
         Returns:
             Background noise.
         """
-        noise_path = torchaudio.utils.download_asset(NOISE_ASSET_URL)
-        return load_waveform(noise_path, sample_rate=self.sample_rate)
+        return load_noise(self.sample_rate)
 
     @_augmentations.default
     def _setup_augmentations(self) -> dict[str, Callable]:
@@ -201,3 +223,507 @@ class AudioAugmenter:
         snr = 10 ** (snr_db / 20)
         snr_ratio = snr * noise_rms / waveform_rms
         return (snr_ratio * waveform + noise) / 2
+
+
+class BatchAudioAugmenter(nn.Module):
+    """Augments padded batches of digital audio signals on their device.
+
+    Every signal of a batch is augmented with probability prob by one of
+    the enabled augmentations, chosen at random, with its own random
+    parameters. Each augmentation runs once for all the signals it is
+    chosen for, and the samples past the length of every signal are zero.
+
+    Unlike AudioAugmenter, which runs SoX on one signal at a time, the
+    tempo is changed with a phase vocoder, and the pitch is shifted by
+    changing the tempo and resampling the signal back to its length.
+    The reverberation is cut at the length of the signal, so that only
+    the tempo changes the lengths.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        prob: float = 0.5,
+        *,
+        use_pitch_shift: bool = True,
+        max_pitch_shift: float = 50,
+        use_tempo_change: bool = True,
+        max_tempo_change: float = 0.3,
+        use_room_reverberation: bool = True,
+        use_background_noise: bool = True,
+        snr_dbs: tp.Sequence[float] = (20, 10),
+        n_fft: int = 512,
+        rir: torch.Tensor | None = None,
+        noise: torch.Tensor | None = None,
+    ) -> None:
+        """Constructor.
+
+        Args:
+            sample_rate: Sample rate
+            prob: Probability of augmenting a signal
+            use_pitch_shift: Whether to shift the pitch
+            max_pitch_shift: Maximum pitch shift in cents
+            use_tempo_change: Whether to change the tempo
+            max_tempo_change: Maximum relative tempo change
+            use_room_reverberation: Whether to use room reverberation
+            use_background_noise: Whether to use background noise
+            snr_dbs: Signal-to-noise ratios in dB to choose from
+            n_fft: Size of the FFT of the phase vocoder
+            rir: Room impulse response of shape (1, n_length),
+                loaded from the torchaudio assets if None
+            noise: Background noise of shape (1, n_length),
+                loaded from the torchaudio assets if None
+
+        Raises:
+            ValueError: If no augmentations are enabled.
+        """
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.prob = prob
+        self.max_pitch_shift = max_pitch_shift
+        self.max_tempo_change = max_tempo_change
+        self.n_fft = n_fft
+        self.hop_length = n_fft // 4
+
+        self._augmentations: dict[str, Callable] = {}
+        if use_pitch_shift:
+            logger.info("Enabling pitch shift.")
+            self._augmentations["pitch"] = self._shift_pitch
+        if use_tempo_change:
+            logger.info("Enabling tempo change.")
+            self._augmentations["tempo"] = self._change_tempo
+        if use_room_reverberation:
+            logger.info("Enabling room reverberation.")
+            self._augmentations["room_reverberation"] = self._reverberate
+            if rir is None:
+                rir = load_rir(sample_rate)
+        if use_background_noise:
+            logger.info("Enabling background noise.")
+            self._augmentations["noise"] = self._add_background_noise
+            if noise is None:
+                noise = load_noise(sample_rate)
+
+        if len(self._augmentations) == 0:
+            msg = (
+                "Invalid initialization: No augmentations selected. "
+                "At least one augmentation method should be enabled. "
+            )
+            raise ValueError(msg)
+
+        # Buffers follow the module to the device but stay out of checkpoints
+        self.register_buffer("rir", rir, persistent=False)
+        self.register_buffer("noise", noise, persistent=False)
+        self.register_buffer(
+            "snr_dbs",
+            torch.tensor(list(snr_dbs), dtype=torch.float),
+            persistent=False,
+        )
+        self.register_buffer(
+            "window",
+            torch.hann_window(n_fft),
+            persistent=False,
+        )
+
+    def forward(
+        self,
+        waveforms: torch.Tensor,
+        lengths: torch.Tensor,
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        """Augment a padded batch of digital signals.
+
+        Args:
+            waveforms: Audio signals of shape (batch_size, n_length).
+            lengths: Number of valid samples of every signal.
+
+        Returns:
+            Augmented signals padded to the longest one and their lengths.
+        """
+        batch_size, device = waveforms.shape[0], waveforms.device
+        augment = torch.rand(batch_size, device=device) < self.prob
+        choices = torch.randint(
+            len(self._augmentations),
+            (batch_size,),
+            device=device,
+        )
+        for choice, augmentation in enumerate(self._augmentations.values()):
+            indices = torch.nonzero(augment & (choices == choice)).squeeze(-1)
+            if indices.numel() == 0:
+                continue
+
+            augmented, augmented_lengths = augmentation(
+                waveforms[indices],
+                lengths[indices],
+            )
+            n_length = max(waveforms.shape[-1], augmented.shape[-1])
+            waveforms = self._pad(waveforms, n_length).index_copy(
+                0,
+                indices,
+                self._pad(augmented, n_length),
+            )
+            lengths = lengths.index_copy(0, indices, augmented_lengths)
+
+        return waveforms[:, : int(lengths.max())], lengths
+
+    def _shift_pitch(
+        self,
+        waveforms: torch.Tensor,
+        lengths: torch.Tensor,
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        cents = self.max_pitch_shift * self._uniform(waveforms)
+        factors = 2 ** (cents / 1200)
+        # Slowing down by the factor and speeding up by resampling
+        # keeps the duration
+        stretched, stretched_lengths = self._stretch(
+            waveforms,
+            lengths,
+            rates=1 / factors,
+        )
+        shifted, _ = self._resample(stretched, stretched_lengths, factors)
+        shifted = self._pad(shifted, waveforms.shape[-1])
+        return self._mask(shifted[:, : waveforms.shape[-1]], lengths), lengths
+
+    def _change_tempo(
+        self,
+        waveforms: torch.Tensor,
+        lengths: torch.Tensor,
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        rates = 1 + self.max_tempo_change * self._uniform(waveforms)
+        return self._stretch(waveforms, lengths, rates=rates)
+
+    def _reverberate(
+        self,
+        waveforms: torch.Tensor,
+        lengths: torch.Tensor,
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        reverberated = F.fftconvolve(waveforms, self.rir)
+        reverberated = reverberated[:, : waveforms.shape[-1]]
+        return self._mask(reverberated, lengths), lengths
+
+    def _add_background_noise(
+        self,
+        waveforms: torch.Tensor,
+        lengths: torch.Tensor,
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        batch_size, n_length = waveforms.shape
+        device = waveforms.device
+        # Noise is tiled from a random offset for every signal
+        offsets = torch.randint(
+            self.noise.shape[-1],
+            (batch_size, 1),
+            device=device,
+        )
+        samples = torch.arange(n_length, device=device)
+        noise = self._mask(
+            self.noise[0, (offsets + samples) % self.noise.shape[-1]],
+            lengths,
+        )
+        snr_dbs = self.snr_dbs[
+            torch.randint(len(self.snr_dbs), (batch_size,), device=device)
+        ]
+        # Both sums run over the valid samples, so their ratio is the ratio
+        # of the powers of the signal and the noise
+        waveform_energy = waveforms.square().sum(dim=-1)
+        noise_energy = noise.square().sum(dim=-1).clamp_min(1e-10)
+        scales = torch.sqrt(
+            waveform_energy / (noise_energy * 10 ** (snr_dbs / 10))
+        )
+        return waveforms + scales.unsqueeze(-1) * noise, lengths
+
+    def _stretch(
+        self,
+        waveforms: torch.Tensor,
+        lengths: torch.Tensor,
+        *,
+        rates: torch.Tensor,
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        """Change the tempo of the signals with a phase vocoder.
+
+        Same as torchaudio.functional.phase_vocoder, but with a rate for
+        every signal.
+
+        Args:
+            waveforms: Audio signals of shape (batch_size, n_length).
+            lengths: Number of valid samples of every signal.
+            rates: Speed-up of every signal.
+
+        Returns:
+            Stretched signals and their lengths.
+        """
+        specs = torch.stft(
+            waveforms,
+            self.n_fft,
+            self.hop_length,
+            window=self.window,
+            return_complex=True,
+        )
+        n_freqs, n_frames = specs.shape[-2:]
+        n_stretched = math.ceil(n_frames / rates.min().item())
+        # Frame of the input every frame of the output is interpolated at
+        steps = torch.arange(
+            n_stretched,
+            device=waveforms.device,
+        ) * rates.unsqueeze(-1)
+        alphas = (steps % 1).unsqueeze(1)
+        indices = (
+            steps.long()
+            .clamp(max=n_frames)
+            .unsqueeze(1)
+            .expand(-1, n_freqs, -1)
+        )
+        padded_specs = nn.functional.pad(specs, [0, 2])
+        specs_0 = padded_specs.gather(-1, indices)
+        specs_1 = padded_specs.gather(-1, indices + 1)
+
+        phase_advance = torch.linspace(
+            0,
+            math.pi * self.hop_length,
+            n_freqs,
+            device=waveforms.device,
+        ).unsqueeze(-1)
+        phases = specs_1.angle() - specs_0.angle() - phase_advance
+        phases -= 2 * math.pi * torch.round(phases / (2 * math.pi))
+        phases = torch.cat(
+            [specs[..., :1].angle(), (phases + phase_advance)[..., :-1]],
+            dim=-1,
+        )
+        magnitudes = alphas * specs_1.abs() + (1 - alphas) * specs_0.abs()
+
+        stretched_lengths = torch.round(lengths / rates).long()
+        stretched = torch.istft(
+            torch.polar(magnitudes, phases.cumsum(dim=-1)),
+            self.n_fft,
+            self.hop_length,
+            window=self.window,
+            length=int(stretched_lengths.max()),
+        )
+        return self._mask(stretched, stretched_lengths), stretched_lengths
+
+    @staticmethod
+    def _resample(
+        waveforms: torch.Tensor,
+        lengths: torch.Tensor,
+        factors: torch.Tensor,
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        # Linear interpolation, which only aliases little for the factors
+        # of pitch shifts within a semitone
+        resampled_lengths = torch.floor(lengths / factors).long()
+        positions = torch.arange(
+            int(resampled_lengths.max()),
+            device=waveforms.device,
+        ) * factors.unsqueeze(-1)
+        left = positions.floor()
+        weights = positions - left
+        left = left.long().clamp(max=waveforms.shape[-1] - 1)
+        right = (left + 1).clamp(max=waveforms.shape[-1] - 1)
+        resampled = torch.lerp(
+            waveforms.gather(-1, left),
+            waveforms.gather(-1, right),
+            weights,
+        )
+        return (
+            BatchAudioAugmenter._mask(resampled, resampled_lengths),
+            resampled_lengths,
+        )
+
+    @staticmethod
+    def _uniform(waveforms: torch.Tensor) -> torch.Tensor:
+        return 2 * torch.rand(len(waveforms), device=waveforms.device) - 1
+
+    @staticmethod
+    def _pad(waveforms: torch.Tensor, n_length: int) -> torch.Tensor:
+        return nn.functional.pad(
+            waveforms,
+            [0, max(n_length - waveforms.shape[-1], 0)],
+        )
+
+    @staticmethod
+    def _mask(waveforms: torch.Tensor, lengths: torch.Tensor) -> torch.Tensor:
+        samples = torch.arange(waveforms.shape[-1], device=waveforms.device)
+        return waveforms * (samples < lengths.unsqueeze(-1))
+
+
+class BatchSpecAugmenter(nn.Module):
+    """Augments padded batches of transformed audio signals on their device.
+
+    Applies SpecAugment (https://arxiv.org/abs/1904.08779) to every
+    transform of a batch with probability prob: the time axis is warped
+    around a random frame, and random bands of frequencies and frames are
+    masked with zeros. Warps and time masks stay within the valid frames
+    of every transform, and the frames past its length stay zero.
+
+    All random parameters are drawn for the whole batch at once, and
+    the transforms that are not augmented get empty masks and no warp,
+    so the augmentation runs without synchronizing with the host.
+    """
+
+    def __init__(
+        self,
+        prob: float = 1.0,
+        *,
+        max_time_warp: int = 80,
+        n_freq_masks: int = 2,
+        max_freq_mask: int = 27,
+        n_time_masks: int = 2,
+        max_time_mask: int = 100,
+        max_time_mask_ratio: float = 0.05,
+    ) -> None:
+        """Constructor.
+
+        Args:
+            prob: Probability of augmenting a transform
+            max_time_warp: Maximum number of frames a frame is moved by,
+                0 disables the time warp
+            n_freq_masks: Number of frequency masks
+            max_freq_mask: Maximum number of frequencies of a mask
+            n_time_masks: Number of time masks
+            max_time_mask: Maximum number of frames of a mask
+            max_time_mask_ratio: Maximum fraction of the valid frames
+                of a transform covered by a mask
+        """
+        super().__init__()
+        self.prob = prob
+        self.max_time_warp = max_time_warp
+        self.n_freq_masks = n_freq_masks
+        self.max_freq_mask = max_freq_mask
+        self.n_time_masks = n_time_masks
+        self.max_time_mask = max_time_mask
+        self.max_time_mask_ratio = max_time_mask_ratio
+
+    def forward(
+        self,
+        transforms: torch.Tensor,
+        lengths: torch.Tensor,
+    ) -> torch.Tensor:
+        """Augment a padded batch of transforms.
+
+        Args:
+            transforms: Transforms of shape (batch_size, n_freqs, n_frames).
+            lengths: Number of valid frames of every transform.
+
+        Returns:
+            Augmented transforms.
+        """
+        augment = (
+            torch.rand(len(transforms), device=transforms.device) < self.prob
+        )
+        if self.max_time_warp > 0:
+            transforms = self._warp_time(transforms, lengths, augment)
+
+        n_freqs, n_frames = transforms.shape[-2:]
+        freq_masks = self._get_masks(
+            n_freqs,
+            self.n_freq_masks,
+            max_widths=torch.full_like(lengths, self.max_freq_mask) * augment,
+            lengths=torch.full_like(lengths, n_freqs),
+        )
+        max_time_masks = torch.minimum(
+            torch.floor(lengths * self.max_time_mask_ratio).long(),
+            torch.full_like(lengths, self.max_time_mask),
+        )
+        time_masks = self._get_masks(
+            n_frames,
+            self.n_time_masks,
+            max_widths=max_time_masks * augment,
+            lengths=lengths,
+        )
+        return transforms.masked_fill(
+            freq_masks.unsqueeze(-1) | time_masks.unsqueeze(1),
+            0,
+        )
+
+    def _warp_time(
+        self,
+        transforms: torch.Tensor,
+        lengths: torch.Tensor,
+        augment: torch.Tensor,
+    ) -> torch.Tensor:
+        """Warp the time axis of the transforms.
+
+        A random frame is moved by a random number of frames, and the
+        frames before and after it are stretched linearly to fill the
+        valid frames, which keeps the length of every transform.
+
+        Args:
+            transforms: Transforms of shape (batch_size, n_freqs, n_frames).
+            lengths: Number of valid frames of every transform.
+            augment: Whether to warp every transform.
+
+        Returns:
+            Warped transforms.
+        """
+        device = transforms.device
+        n_frames = transforms.shape[-1]
+        # Short transforms are warped less, so that the frame is moved
+        # within the transform
+        max_warps = (
+            torch.clamp(
+                (lengths - 1) // 2,
+                min=0,
+                max=self.max_time_warp,
+            )
+            * augment
+        )
+        centers = max_warps + torch.rand(len(lengths), device=device) * (
+            lengths - 1 - 2 * max_warps
+        ).clamp_min(0)
+        warped_centers = centers + max_warps * (
+            2 * torch.rand(len(lengths), device=device) - 1
+        )
+
+        # Frame of the input every frame of the output is interpolated at
+        frames = torch.arange(n_frames, device=device).unsqueeze(0)
+        centers = centers.unsqueeze(-1)
+        warped_centers = warped_centers.unsqueeze(-1)
+        last_frames = (lengths - 1).unsqueeze(-1)
+        positions = torch.where(
+            frames < warped_centers,
+            frames * centers / warped_centers.clamp_min(1e-6),
+            centers
+            + (frames - warped_centers)
+            * (last_frames - centers)
+            / (last_frames - warped_centers).clamp_min(1e-6),
+        ).clamp(min=0)
+
+        left = positions.floor()
+        weights = (positions - left).unsqueeze(1)
+        left = left.long().clamp(max=n_frames - 1)
+        right = (left + 1).clamp(max=n_frames - 1)
+        n_freqs = transforms.shape[1]
+        warped = torch.lerp(
+            transforms.gather(-1, left.unsqueeze(1).expand(-1, n_freqs, -1)),
+            transforms.gather(-1, right.unsqueeze(1).expand(-1, n_freqs, -1)),
+            weights,
+        )
+        return warped * (frames < lengths.unsqueeze(-1)).unsqueeze(1)
+
+    @staticmethod
+    def _get_masks(
+        size: int,
+        n_masks: int,
+        *,
+        max_widths: torch.Tensor,
+        lengths: torch.Tensor,
+    ) -> torch.Tensor:
+        """Draw random bands within the valid part of an axis.
+
+        Args:
+            size: Size of the axis.
+            n_masks: Number of bands for every transform.
+            max_widths: Maximum width of the bands of every transform.
+            lengths: Valid size of the axis for every transform.
+
+        Returns:
+            Mask of shape (batch_size, size), True within the bands.
+        """
+        device = lengths.device
+        shape = (len(lengths), n_masks, 1)
+        widths = torch.floor(
+            torch.rand(shape, device=device) * (max_widths.view(-1, 1, 1) + 1)
+        )
+        starts = torch.floor(
+            torch.rand(shape, device=device)
+            * (lengths.view(-1, 1, 1) - widths + 1).clamp_min(0)
+        )
+        indices = torch.arange(size, device=device)
+        masks = (indices >= starts) & (indices < starts + widths)
+        return masks.any(dim=1)
@@ -0,0 +1,165 @@
+"""Exportable audio features."""
+
+import math
+
+import torch
+import torchaudio.transforms as T
+from torch import nn
+from torch.nn import functional as F
+
+
+class ConvMelSpectrogram(nn.Module):
+    """Mel spectrogram computed with a strided convolution.
+
+    The short-time Fourier transform is a convolution with windowed cosine
+    and sine kernels, which unlike torch.stft exports to TorchScript and
+    ONNX as plain convolution and matrix multiplication. The output matches
+    torchaudio.transforms.MelSpectrogram with the same parameters.
+    """
+
+    def __init__(
+        self,
+        *,
+        n_fft: int,
+        hop_length: int,
+        window: torch.Tensor,
+        mel_filterbank: torch.Tensor,
+        power: float = 2.0,
+        normalized: bool = False,
+        center: bool = True,
+        pad_mode: str = "reflect",
+    ) -> None:
+        """Constructor.
+
+        Args:
+            n_fft: size of FFT
+            hop_length: length of hop between STFT windows
+            window: window of length win_length <= n_fft
+            mel_filterbank: filterbank of shape (n_fft // 2 + 1, n_mels)
+            power: exponent for the magnitude spectrogram
+            normalized: whether to normalize the STFT by the window's L2 norm
+            center: whether to pad the waveform on both sides, so that
+                a frame is centered at its hop
+            pad_mode: padding method used when center is True
+        """
+        super().__init__()
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.power = power
+        self.center = center
+        self.pad_mode = pad_mode
+
+        # torch.stft centers a window that is shorter than n_fft
+        left = (n_fft - len(window)) // 2
+        window = F.pad(window, (left, n_fft - len(window) - left))
+        n_freqs = n_fft // 2 + 1
+        angles = (
+            2
+            * math.pi
+            * torch.arange(n_freqs, dtype=torch.float64).unsqueeze(1)
+            * torch.arange(n_fft, dtype=torch.float64)
+            / n_fft
+        )
+        kernels = torch.cat([angles.cos(), -angles.sin()]) * window.double()
+        if normalized:
+            kernels /= window.double().pow(2).sum().sqrt()
+        self.register_buffer("kernels", kernels.float().unsqueeze(1))
+        self.register_buffer("mel_filterbank", mel_filterbank.T.contiguous())
+
+    @classmethod
+    def from_transformer(
+        cls,
+        transformer: T.MelSpectrogram,
+    ) -> "ConvMelSpectrogram":
+        """Create the mel spectrogram equivalent to a torchaudio one.
+
+        Args:
+            transformer: torchaudio mel spectrogram
+
+        Returns:
+            Convolutional mel spectrogram.
+
+        Raises:
+            TypeError: If the transformer is not a mel spectrogram.
+            ValueError: If the parameters of the transformer are unsupported.
+        """
+        if not isinstance(transformer, T.MelSpectrogram):
+            msg = f"Unsupported transformer: {type(transformer).__name__}"
+            raise TypeError(msg)
+
+        spectrogram = transformer.spectrogram
+        if spectrogram.normalized not in {True, False, "window"}:
+            msg = f"Unsupported normalization: {spectrogram.normalized}"
+            raise ValueError(msg)
+        if spectrogram.pad != 0 or not spectrogram.onesided:
+            msg = "Padded and two-sided spectrograms are not supported."
+            raise ValueError(msg)
+
+        return cls(
+            n_fft=spectrogram.n_fft,
+            hop_length=spectrogram.hop_length,
+            window=spectrogram.window,
+            mel_filterbank=transformer.mel_scale.fb,
+            power=spectrogram.power,
+            normalized=bool(spectrogram.normalized),
+            center=spectrogram.center,
+            pad_mode=spectrogram.pad_mode,
+        )
+
+    def forward(self, waveforms: torch.Tensor) -> torch.Tensor:
+        """Compute the mel spectrogram.
+
+        Args:
+            waveforms: tensor of shape (batch_size, n_samples).
+
+        Returns:
+            Tensor of shape (batch_size, n_mels, n_frames).
+        """
+        if self.center:
+            waveforms = self.pad(waveforms)
+        return self.transform_padded(waveforms)
+
+    def pad(
+        self,
+        waveforms: torch.Tensor,
+        *,
+        left: bool = True,
+        right: bool = True,
+    ) -> torch.Tensor:
+        """Pad the waveforms to center the frames.
+
+        Args:
+            waveforms: tensor of shape (batch_size, n_samples).
+            left: whether to pad the start of the waveforms
+            right: whether to pad the end of the waveforms
+
+        Returns:
+            Tensor of shape (batch_size, n_padded_samples).
+        """
+        padding = (self.n_fft // 2 * left, self.n_fft // 2 * right)
+        return F.pad(
+            waveforms.unsqueeze(1),
+            padding,
+            mode=self.pad_mode,
+        ).squeeze(1)
+
+    def transform_padded(self, waveforms: torch.Tensor) -> torch.Tensor:
+        """Compute the mel spectrogram of padded waveforms.
+
+        Every frame covers n_fft samples starting at a multiple of the hop
+        length, so consecutive segments of a padded waveform that overlap
+        by n_fft - hop_length samples give consecutive frames.
+
+        Args:
+            waveforms: tensor of shape (batch_size, n_padded_samples).
+
+        Returns:
+            Tensor of shape (batch_size, n_mels, n_frames).
+        """
+        real, imag = F.conv1d(
+            waveforms.unsqueeze(1),
+            self.kernels,
+            stride=self.hop_length,
+        ).chunk(2, dim=1)
+        spectrogram = (real.pow(2) + imag.pow(2)).pow(self.power / 2)
+        return torch.matmul(self.mel_filterbank, spectrogram)
@@ -3,6 +3,10 @@
 import re
 import string
 
+import polars as pl
+
+ADDITIONAL_PUNCTUATION = "“”"
+
 
 def preprocess_text(
     text: str,
@@ -22,9 +26,50 @@ def preprocess_text(
     """
     text = text.lower()
     if remove_punctuation:
-        additional_punctuation = "“”"
-        punctuation = string.punctuation + additional_punctuation
+        punctuation = string.punctuation + ADDITIONAL_PUNCTUATION
         text = text.translate(str.maketrans("", "", punctuation))
     if remove_spaces:
         text = re.sub(r"\s+", " ", text)
     return text.strip()
+
+
+def preprocess_text_expr(
+    expr: pl.Expr,
+    *,
+    remove_punctuation: bool = True,
+    remove_spaces: bool = True,
+) -> pl.Expr:
+    """Vectorized counterpart of preprocess_text for polars string columns.
+
+    Args:
+        expr (Expr): Expression with the texts to preprocess.
+        remove_punctuation (bool, optional): Whether to remove punctuation.
+        remove_spaces (bool, optional): Whether to remove multiple spaces.
+
+    Returns:
+        Expression with the preprocessed texts.
+    """
+    expr = expr.str.to_lowercase()
+    if remove_punctuation:
+        punctuation = string.punctuation + ADDITIONAL_PUNCTUATION
+        expr = expr.str.replace_all(f"[{escape_char_class(punctuation)}]", "")
+    if remove_spaces:
+        expr = expr.str.replace_all(r"\s+", " ")
+    return expr.str.strip_chars()
+
+
+def escape_char_class(chars: str) -> str:
+    """Escape characters to put them into a regex character class.
+
+    Unlike re.escape, only the characters that are special inside a class
+    are escaped, which keeps the pattern valid for polars (Rust) regexes.
+
+    Args:
+        chars (str): Characters of the class.
+
+    Returns:
+        Escaped characters.
+    """
+    return "".join(
+        f"\\{char}" if char in "\\[]^-&~" else char for char in chars
+    )
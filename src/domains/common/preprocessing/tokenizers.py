@@ -2,6 +2,7 @@
 
 import string
 
+import numpy as np
 import torch
 from attrs import define, field
 
@@ -10,6 +11,10 @@ from attrs import define, field
 class TextTokenizer:
     """Base text tokenizer.
 
+    Characters are mapped to tokens and back with lookup tables indexed by
+    Unicode code points and tokens respectively, so texts are encoded and
+    decoded with NumPy indexing instead of per-character Python lookups.
+
     Attributes:
         alphabet (list[str]): List of characters in the alphabet.
     """
@@ -18,11 +23,32 @@ class TextTokenizer:
 
     _token2char: dict = field(init=False)
     _char2token: dict = field(init=False)
+    _codepoint2token: np.ndarray = field(init=False, repr=False)
+    _token2codepoint: np.ndarray = field(init=False, repr=False)
 
     def __attrs_post_init__(self):
+        if any(len(char) != 1 for char in self.alphabet):
+            msg = (
+                f"Alphabet must consist of single characters: {self.alphabet}"
+            )
+            raise ValueError(msg)
         self._token2char = dict(enumerate(sorted(self.alphabet)))
         self._char2token = {v: k for k, v in self._token2char.items()}
 
+        self._token2codepoint = np.array(
+            [ord(char) for char in self._token2char.values()],
+            dtype=np.uint32,
+        )
+        # Code points outside of the alphabet map to -1
+        self._codepoint2token = np.full(
+            self._token2codepoint.max() + 1,
+            fill_value=-1,
+            dtype=np.int64,
+        )
+        self._codepoint2token[self._token2codepoint] = np.arange(
+            len(self._token2codepoint)
+        )
+
     @property
     def alphabet_size(self) -> int:
         """Get the size of the alphabet.
@@ -41,9 +67,30 @@ class TextTokenizer:
         Returns:
             Encoded text as a tensor.
         """
-        return torch.tensor(
-            [self._char2token[char] for char in text]
-        ).unsqueeze(0)
+        return torch.from_numpy(self._encode(text)).unsqueeze(0)
+
+    def encode_batch(
+        self,
+        texts: list[str],
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        """Encode a batch of texts into zero-padded tokens.
+
+        Args:
+            texts (list[str]): Texts to encode.
+
+        Returns:
+            Tokens of shape (batch_size, max_length) and the lengths of
+            the texts.
+        """
+        lengths = torch.tensor([len(text) for text in texts], dtype=torch.long)
+        tokens = torch.zeros(
+            (len(texts), int(lengths.max()) if texts else 0),
+            dtype=torch.long,
+        )
+        tokens_np = tokens.numpy()
+        for i, text in enumerate(texts):
+            tokens_np[i, : len(text)] = self._encode(text)
+        return tokens, lengths
 
     def decode(self, tokens: torch.Tensor) -> str:
         """Decode tokens according to token2char mapping.
@@ -54,7 +101,48 @@ class TextTokenizer:
         Returns:
             Decoded text.
         """
-        return "".join([self._token2char[token.item()] for token in tokens])
+        return self._decode(tokens.cpu().numpy())
+
+    def decode_batch(
+        self,
+        tokens: torch.Tensor,
+        lengths: torch.Tensor | None = None,
+    ) -> list[str]:
+        """Decode a batch of padded tokens.
+
+        The tokens are moved to the host with a single transfer.
+
+        Args:
+            tokens (Tensor): Tokens of shape (batch_size, max_length).
+            lengths (Tensor): Number of valid tokens of every sequence.
+                If None, all tokens are valid.
+
+        Returns:
+            Decoded texts.
+        """
+        tokens_np = tokens.cpu().numpy()
+        lengths_np = (
+            lengths.cpu().numpy()
+            if lengths is not None
+            else [tokens_np.shape[-1]] * len(tokens_np)
+        )
+        return [
+            self._decode(row[:length])
+            for row, length in zip(tokens_np, lengths_np, strict=True)
+        ]
+
+    def _encode(self, text: str) -> np.ndarray:
+        codepoints = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+        tokens = self._codepoint2token[
+            np.minimum(codepoints, len(self._codepoint2token) - 1)
+        ]
+        unknown = (tokens < 0) | (codepoints >= len(self._codepoint2token))
+        if unknown.any():
+            raise KeyError(text[int(unknown.argmax())])
+        return tokens
+
+    def _decode(self, tokens: np.ndarray) -> str:
+        return self._token2codepoint[tokens].tobytes().decode("utf-32-le")
 
 
 @define(kw_only=True)
@@ -93,12 +181,32 @@ class CTCTextTokenizer(TextTokenizer):
         Returns:
             Decoded text without blank symbols.
         """
-        decoded_text = ""
-        for idx, current_token in enumerate(tokens):
-            token_value = current_token.item()
-            if token_value == self._blank_token:
-                continue
-            if idx > 0 and token_value == tokens[idx - 1].item():
-                continue
-            decoded_text += self._token2char[token_value]
-        return decoded_text
+        return self.ctc_decode_batch(tokens.unsqueeze(0))[0]
+
+    def ctc_decode_batch(
+        self,
+        tokens: torch.Tensor,
+        lengths: torch.Tensor | None = None,
+    ) -> list[str]:
+        """Decode a batch of tokens, e.g. argmax outputs of a CTC model.
+
+        Repeated tokens are collapsed and blank tokens are removed with
+        tensor operations on the device of the tokens, and the result is
+        moved to the host with a single transfer.
+
+        Args:
+            tokens (Tensor): Tokens of shape (batch_size, n_frames).
+            lengths (Tensor): Number of valid frames of every sequence.
+                If None, all frames are valid.
+
+        Returns:
+            Decoded texts without blank symbols.
+        """
+        keep = tokens != self._blank_token
+        keep[:, 1:] &= tokens[:, 1:] != tokens[:, :-1]
+        if lengths is not None:
+            frames = torch.arange(tokens.shape[-1], device=tokens.device)
+            keep &= frames < lengths.unsqueeze(-1)
+
+        kept_tokens = torch.where(keep, tokens, -1).cpu().numpy()
+        return [self._decode(row[row >= 0]) for row in kept_tokens]
@@ -0,0 +1,127 @@
+import lightning as L
+import pytest
+import torch
+from torch.utils.data import DataLoader
+
+from src.domains.audio.asr.data import (
+    ASRData,
+    ASRDataCollator,
+    DurationBatchSampler,
+)
+
+
+@pytest.fixture
+def batch() -> list[dict[str, torch.Tensor]]:
+    return [
+        {
+            "waveform": torch.randn(1, 256 * (n_frames - 1)),
+            "transform": torch.rand(1, 8, n_frames),
+            "tokens": torch.randint(0, 28, (1, n_tokens)),
+        }
+        for n_frames, n_tokens in [(5, 3), (12, 7), (9, 1)]
+    ]
+
+
+def test_asr_data_collator(batch: list[dict[str, torch.Tensor]]):
+    collated = ASRDataCollator(downsize=2)(batch)
+
+    assert collated["tokens"].shape == (3, 7)
+    assert collated["transforms"].shape == (3, 8, 12)
+    assert collated["tokens_lengths"].tolist() == [3, 7, 1]
+    assert collated["probs_lengths"].tolist() == [3, 6, 5]
+    assert collated["tokens_lengths"].dtype == torch.long
+    assert collated["probs_lengths"].dtype == torch.long
+    assert collated["transforms_lengths"].tolist() == [5, 12, 9]
+    assert len(collated["waveforms"]) == 3
+
+    for i, sample in enumerate(batch):
+        n_tokens = sample["tokens"].shape[-1]
+        n_frames = sample["transform"].shape[-1]
+        assert torch.equal(
+            collated["tokens"][i, :n_tokens], sample["tokens"][0]
+        )
+        assert not collated["tokens"][i, n_tokens:].any()
+        assert torch.equal(
+            collated["transforms"][i, :, :n_frames], sample["transform"][0]
+        )
+        assert not collated["transforms"][i, :, n_frames:].any()
+
+
+@pytest.fixture
+def durations() -> list[float]:
+    generator = torch.Generator().manual_seed(0)
+    return (torch.rand(500, generator=generator) * 19 + 1).tolist()
+
+
+def test_duration_batch_sampler_budget(durations: list[float]):
+    sampler = DurationBatchSampler(durations, max_duration=60.0)
+    batches = list(sampler)
+
+    assert len(batches) == len(sampler)
+    assert sorted(i for batch in batches for i in batch) == list(range(500))
+    for batch in batches:
+        padded_duration = len(batch) * max(durations[i] for i in batch)
+        assert padded_duration <= 60.0 or len(batch) == 1
+
+
+def test_duration_batch_sampler_determinism(durations: list[float]):
+    sampler = DurationBatchSampler(durations, max_duration=60.0, seed=1)
+    first_epoch = list(sampler)
+    # Iterating again does not move to the next epoch
+    assert list(sampler) == first_epoch
+    assert first_epoch == list(
+        DurationBatchSampler(durations, max_duration=60.0, seed=1)
+    )
+
+    # Lightning sets the epoch through the sampler of the batch sampler
+    loader = DataLoader(range(500), batch_sampler=sampler)
+    loader.batch_sampler.sampler.set_epoch(1)
+    second_epoch = list(sampler)
+    assert second_epoch != first_epoch
+    assert second_epoch == list(
+        DurationBatchSampler(durations, max_duration=60.0, seed=1, epoch=1)
+    )
+
+
+def test_duration_batch_sampler_replicas(durations: list[float]):
+    samplers = [
+        DurationBatchSampler(
+            durations,
+            max_duration=60.0,
+            num_replicas=3,
+            rank=rank,
+        )
+        for rank in range(3)
+    ]
+    batches = [list(sampler) for sampler in samplers]
+
+    assert len({len(rank_batches) for rank_batches in batches}) == 1
+    assert {
+        i for rank_batches in batches for b in rank_batches for i in b
+    } == (set(range(500)))
+
+
+def test_asr_data_collator_waveforms(batch: list[dict[str, torch.Tensor]]):
+    waveforms_batch = [
+        {"waveform": sample["waveform"], "tokens": sample["tokens"]}
+        for sample in batch
+    ]
+    collated = ASRDataCollator(downsize=2, hop_length=256)(waveforms_batch)
+
+    assert "transforms" not in collated
+    assert collated["waveforms"].shape == (3, 256 * 11)
+    assert collated["waveforms_lengths"].tolist() == [1024, 2816, 2048]
+    assert collated["transforms_lengths"].tolist() == [5, 12, 9]
+    assert collated["probs_lengths"].tolist() == [3, 6, 5]
+    with pytest.raises(ValueError, match="Hop length"):
+        ASRDataCollator(downsize=2)(waveforms_batch)
+
+
+def test_asr_data_duration_batching_distributed_sampler():
+    data = ASRData(dataset=None, batch_max_duration=60.0)
+    data.trainer = L.Trainer(
+        accelerator="cpu", devices=2, strategy="ddp_spawn"
+    )
+
+    with pytest.raises(ValueError, match="use_distributed_sampler=false"):
+        data.setup("fit")
@@ -0,0 +1,41 @@
+import polars as pl
+
+from src.domains.audio.asr.datasets.base import ASRDataset
+
+
+class _InMemoryDataset(ASRDataset):
+    def download(self) -> None:
+        pass
+
+    def remove(self) -> None:
+        pass
+
+    def setup(self, stage: str) -> "_InMemoryDataset":
+        return self
+
+
+def test_filter_data():
+    dataset = _InMemoryDataset(
+        tokenizer=None,
+        transformer=None,
+        augmenter=None,
+        text_max_length=20,
+        audio_max_duration=10.0,
+        audio_min_duration=0.5,
+        text_min_chars_per_second=2.0,
+        text_max_chars_per_second=10.0,
+    )
+    dataset._data = pl.DataFrame(
+        {
+            "audio_path": [f"{i}.wav" for i in range(6)],
+            "audio_duration": [1.0, 0.2, 12.0, 3.0, 1.0, 2.0],
+            "text": ["hello", "hi", "a" * 30, "a", "a" * 15, "ünïcödé"],
+        }
+    )
+    dataset.finalize_data()
+
+    assert dataset._data.columns == ["audio_path", "audio_duration", "text"]
+    assert dataset._data.get_column("audio_path").to_list() == [
+        "0.wav",
+        "5.wav",
+    ]
@@ -0,0 +1,34 @@
+from pathlib import Path
+
+import torch
+import torchaudio.transforms as T
+
+from src.domains.audio.asr.datasets.cache import FeatureCache
+from src.domains.audio.dsp.audio import load_waveform
+from src.utils.env import BASE_DIR
+
+AUDIO_PATH = BASE_DIR.joinpath("tests/data/test.wav").as_posix()
+
+
+def test_feature_cache(tmp_path: Path):
+    transformer = T.MelSpectrogram(sample_rate=16000, n_mels=64)
+    cache = FeatureCache(
+        cache_dir=tmp_path,
+        transformer=transformer,
+        sample_rate=16000,
+        shard_frames=1,
+    )
+    assert cache.get(AUDIO_PATH) is None
+
+    cache.build([AUDIO_PATH, AUDIO_PATH])
+    expected = transformer(load_waveform(AUDIO_PATH, sample_rate=16000))
+    assert len(cache) == 1
+    assert torch.allclose(cache.get(AUDIO_PATH), expected)
+
+    other_cache = FeatureCache(
+        cache_dir=tmp_path,
+        transformer=T.MelSpectrogram(sample_rate=16000, n_mels=80),
+        sample_rate=16000,
+    )
+    assert other_cache.path != cache.path
+    assert AUDIO_PATH not in other_cache
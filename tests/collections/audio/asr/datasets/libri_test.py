@@ -0,0 +1,61 @@
+import os
+from pathlib import Path
+
+import soundfile as sf
+import torch
+
+from src.domains.audio.asr.datasets.libri import LibriSpeechDataset
+
+
+def _write_chapter(chapter_dir: Path, texts: dict[str, str]) -> None:
+    chapter_dir.mkdir(parents=True, exist_ok=True)
+    for i, audio_id in enumerate(texts):
+        sf.write(
+            chapter_dir.joinpath(f"{audio_id}.flac"),
+            torch.randn(8000 * (i + 1)).clamp(-1, 1).numpy(),
+            8000,
+        )
+    chapter_dir.joinpath(f"{chapter_dir.parent.name}-trans.txt").write_text(
+        "".join(f"{audio_id} {text}\n" for audio_id, text in texts.items())
+    )
+
+
+def test_libri_speech_manifest(tmp_path: Path):
+    stage_dir = tmp_path.joinpath("LibriSpeech", "dev-clean")
+    first_chapter, second_chapter = (
+        stage_dir.joinpath("1", "10"),
+        stage_dir.joinpath("2", "20"),
+    )
+    _write_chapter(first_chapter, {"1-10-0": "HELLO", "1-10-1": "WORLD"})
+    _write_chapter(second_chapter, {"2-20-0": "GOOD MORNING"})
+    dataset = LibriSpeechDataset(
+        data_dir=tmp_path,
+        tokenizer=None,
+        transformer=None,
+        augmenter=None,
+        manifest_num_workers=2,
+    )
+
+    manifest = dataset._load_manifest(stage_dir)
+
+    assert manifest.select("audio_duration", "text").rows() == [
+        (1.0, "hello"),
+        (2.0, "world"),
+        (1.0, "good morning"),
+    ]
+    assert tmp_path.joinpath("manifests", "dev-clean.parquet").exists()
+
+    # Only the chapter whose modification time changed is scanned again
+    first_mtime = first_chapter.stat().st_mtime
+    _write_chapter(first_chapter, {"1-10-0": "HI", "1-10-1": "THERE"})
+    os.utime(first_chapter, (first_mtime, first_mtime))
+    _write_chapter(second_chapter, {"2-20-0": "GOOD EVENING"})
+    os.utime(second_chapter, (0, 0))
+
+    manifest = dataset._load_manifest(stage_dir)
+
+    assert manifest.get_column("text").to_list() == [
+        "hello",
+        "world",
+        "good evening",
+    ]
@@ -0,0 +1,54 @@
+import shutil
+from pathlib import Path
+
+import soundfile as sf
+import torch
+
+from src.domains.audio.asr.datasets.lj import LJSpeechDataset
+from src.domains.common.preprocessing.tokenizers import CTCTextTokenizer
+
+
+def _make_dataset(data_dir: Path, alphabet: str) -> LJSpeechDataset:
+    return LJSpeechDataset(
+        data_dir=data_dir,
+        tokenizer=CTCTextTokenizer(alphabet=list(alphabet)),
+        transformer=None,
+        augmenter=None,
+        manifest_num_workers=2,
+    )
+
+
+def test_lj_speech_manifest(tmp_path: Path):
+    extracted_dir = tmp_path.joinpath("LJSpeech-1.1")
+    extracted_dir.joinpath("wavs").mkdir(parents=True)
+    texts = {"LJ001-0001": "Hello there.", "LJ001-0002": "Zero, zebra!"}
+    for i, audio_name in enumerate(texts):
+        sf.write(
+            extracted_dir.joinpath("wavs", f"{audio_name}.wav"),
+            torch.randn(8000 * (i + 1)).clamp(-1, 1).numpy(),
+            8000,
+        )
+    extracted_dir.joinpath("metadata.csv").write_text(
+        "".join(f"{name}|{text}|{text}\n" for name, text in texts.items())
+    )
+
+    manifest = _make_dataset(tmp_path, " abcdefghijklmnopqrstuvwxyz")
+    manifest = manifest._load_manifest()
+    assert manifest.select("text", "audio_duration", "is_valid").rows() == [
+        ("hello there", 1.0, True),
+        ("zero zebra", 2.0, True),
+    ]
+
+    # Another alphabet changes the hash of the manifest, which is rebuilt
+    manifest = _make_dataset(tmp_path, " abcdefghijklmnopqrstuvwxy")
+    manifest = manifest._load_manifest()
+    assert manifest.select("audio_duration", "is_valid").rows() == [
+        (1.0, True),
+        (None, False),
+    ]
+    assert len(list(tmp_path.joinpath("manifests").glob("*.parquet"))) == 2
+
+    # Manifests of known alphabets are read without the audio files
+    shutil.rmtree(extracted_dir.joinpath("wavs"))
+    manifest = _make_dataset(tmp_path, " abcdefghijklmnopqrstuvwxyz")
+    assert manifest._load_manifest()["is_valid"].to_list() == [True, True]
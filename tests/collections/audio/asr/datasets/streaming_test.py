@@ -0,0 +1,199 @@
+from pathlib import Path
+
+import polars as pl
+import pytest
+import torch
+import torchaudio.transforms as T
+
+from src.domains.audio.asr.datasets.base import ASRDataset
+from src.domains.audio.asr.datasets.shards import INDEX_FILENAME, read_shard
+from src.domains.audio.asr.datasets.streaming import (
+    ASRStreamingDataset,
+    StreamingDataLoader,
+)
+from src.domains.audio.dsp.audio import load_waveform
+from src.domains.common.preprocessing.tokenizers import CTCTextTokenizer
+from src.utils.env import BASE_DIR
+
+AUDIO_PATH = BASE_DIR.joinpath("tests/data/test.wav").as_posix()
+TEXTS = [f"sample {chr(ord('a') + i)}" for i in range(10)]
+
+
+class _InMemoryDataset(ASRDataset):
+    def download(self) -> None:
+        pass
+
+    def remove(self) -> None:
+        pass
+
+    def setup(self, stage: str) -> "_InMemoryDataset":
+        self._data = pl.DataFrame(
+            {
+                "audio_path": [AUDIO_PATH] * len(TEXTS),
+                "audio_duration": [5.14] * len(TEXTS),
+                "text": TEXTS,
+            }
+        )
+        return self
+
+
+@pytest.fixture
+def source() -> ASRDataset:
+    return _InMemoryDataset(
+        tokenizer=CTCTextTokenizer(
+            alphabet=list("abcdefghijklmnopqrstuvwxyz ")
+        ),
+        transformer=T.MelSpectrogram(sample_rate=16000, n_mels=64),
+        augmenter=None,
+        audio_sample_rate=16000,
+        transform_on_device=True,
+    ).setup("train")
+
+
+def _texts(dataset: ASRStreamingDataset, samples: list[dict]) -> list[str]:
+    return [
+        dataset.source.tokenizer.decode(sample["tokens"][0])
+        for sample in samples
+    ]
+
+
+def test_streaming_dataset(tmp_path: Path, source: ASRDataset):
+    source.write_shards(tmp_path, shard_max_size=1)
+    dataset = ASRStreamingDataset(
+        source=source,
+        shards_dir=tmp_path,
+        shuffle_buffer_size=4,
+    )
+
+    first_epoch = list(dataset)
+    assert len(first_epoch) == len(dataset) == len(TEXTS)
+    assert sorted(_texts(dataset, first_epoch)) == TEXTS
+    assert torch.equal(
+        first_epoch[0]["waveform"],
+        load_waveform(AUDIO_PATH, sample_rate=16000),
+    )
+
+    dataset.set_epoch(1)
+    second_epoch = _texts(dataset, list(dataset))
+    assert second_epoch != _texts(dataset, first_epoch)
+    assert sorted(second_epoch) == TEXTS
+
+    dataset.set_epoch(1, skips=[4])
+    assert _texts(dataset, list(dataset)) == second_epoch[4:]
+
+
+def test_write_shards_invalidation(tmp_path: Path, source: ASRDataset):
+    index_path = tmp_path.joinpath(INDEX_FILENAME)
+
+    def write_shards(**kwargs: bool) -> list[set[str]]:
+        source.write_shards(tmp_path, shard_max_size=1, **kwargs)
+        return [
+            set(sample)
+            for shard_path in sorted(tmp_path.glob("shard_*.tar"))
+            for sample in read_shard(shard_path)
+        ]
+
+    assert write_shards() == [{"json", "wav"}] * len(TEXTS)
+    mtime = index_path.stat().st_mtime_ns
+    write_shards()
+    assert index_path.stat().st_mtime_ns == mtime
+
+    assert write_shards(store_features=True) == [{"json", "npy"}] * 10
+    transform = next(read_shard(next(tmp_path.glob("shard_*.tar"))))["npy"]
+
+    # Features of another transformer are written again
+    source.transformer = T.MelSpectrogram(sample_rate=16000, n_mels=32)
+    write_shards(store_features=True)
+    assert next(read_shard(tmp_path.joinpath("shard_00000.tar")))["npy"] != (
+        transform
+    )
+
+    # So are other samples, and shards of the old samples are removed
+    source._data = source._data.head(4)
+    assert write_shards(store_features=True) == [{"json", "npy"}] * 4
+
+
+# A single shard is too few to deal to the ranks, so samples are dealt
+@pytest.mark.parametrize("shard_max_size", [200_000, 2**30])
+def test_streaming_dataset_ranks(
+    tmp_path: Path,
+    source: ASRDataset,
+    monkeypatch: pytest.MonkeyPatch,
+    shard_max_size: int,
+):
+    source.write_shards(tmp_path, shard_max_size=shard_max_size)
+    texts = []
+    for rank in range(3):
+        monkeypatch.setattr(
+            ASRStreamingDataset,
+            "_get_rank",
+            staticmethod(lambda rank=rank: (3, rank)),
+        )
+        dataset = ASRStreamingDataset(source=source, shards_dir=tmp_path)
+        samples = list(dataset)
+        assert len(samples) == len(TEXTS) // 3
+        texts.extend(_texts(dataset, samples))
+
+    assert len(set(texts)) == len(texts)
+
+
+def test_streaming_data_loader_resume(tmp_path: Path, source: ASRDataset):
+    source.write_shards(tmp_path, shard_max_size=1)
+    dataset = ASRStreamingDataset(source=source, shards_dir=tmp_path)
+    loader = StreamingDataLoader(
+        dataset,
+        epoch=2,
+        batch_size=2,
+        collate_fn=lambda batch: _texts(dataset, batch),
+    )
+    epoch = [text for batch in loader for text in batch]
+
+    resumed_loader = StreamingDataLoader(
+        dataset,
+        epoch=2,
+        num_batches=3,
+        batch_size=2,
+        collate_fn=lambda batch: _texts(dataset, batch),
+    )
+    assert [text for batch in resumed_loader for text in batch] == epoch[6:]
+
+
+def test_streaming_data_loader_few_shards(tmp_path: Path, source: ASRDataset):
+    source.write_shards(tmp_path, shard_max_size=2**30)
+    dataset = ASRStreamingDataset(source=source, shards_dir=tmp_path)
+    loader = StreamingDataLoader(
+        dataset,
+        batch_size=2,
+        num_workers=2,
+        collate_fn=lambda batch: _texts(dataset, batch),
+    )
+
+    assert sorted(text for batch in loader for text in batch) == TEXTS
+
+
+def test_streaming_data_loader_more_workers_than_samples(
+    tmp_path: Path,
+    source: ASRDataset,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    source.write_shards(tmp_path, shard_max_size=2**30)
+    texts = []
+    # 12 readers across the ranks for 10 samples, so some read nothing
+    for rank in range(3):
+        monkeypatch.setattr(
+            ASRStreamingDataset,
+            "_get_rank",
+            staticmethod(lambda rank=rank: (3, rank)),
+        )
+        dataset = ASRStreamingDataset(source=source, shards_dir=tmp_path)
+        loader = StreamingDataLoader(
+            dataset,
+            batch_size=1,
+            num_workers=4,
+            collate_fn=lambda batch, dataset=dataset: _texts(dataset, batch),
+        )
+        rank_texts = [text for batch in loader for text in batch]
+        assert len(rank_texts) == len(TEXTS) // 3
+        texts.extend(rank_texts)
+
+    assert len(set(texts)) == len(texts)
@@ -0,0 +1,152 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+import torch
+
+from src.domains.audio.asr.decoding import (
+    CTCBeamSearchDecoder,
+    NGramLanguageModel,
+)
+from src.domains.common.preprocessing.tokenizers import CTCTextTokenizer
+
+ARPA = """\\data\\
+ngram 1=5
+ngram 2=2
+
+\\1-grams:
+-1.0 <s> -0.3
+-1.0 </s>
+-0.2 cab -0.3
+-3.0 cbb
+-2.0 <unk>
+
+\\2-grams:
+-0.1 <s> cab
+-0.1 cab </s>
+
+\\end\\
+"""
+
+
+@pytest.fixture
+def tokenizer() -> CTCTextTokenizer:
+    return CTCTextTokenizer(alphabet=list(" abc"))
+
+
+def _log_probs(
+    tokenizer: CTCTextTokenizer,
+    frames: list[dict[str, float]],
+) -> torch.Tensor:
+    # Log-probabilities of shape (1, n_tokens, n_frames)
+    probs = torch.full((len(frames), tokenizer.alphabet_size), 1e-3)
+    for i, frame in enumerate(frames):
+        for char, prob in frame.items():
+            token = (
+                tokenizer.blank_token
+                if char == tokenizer.blank_symbol
+                else int(tokenizer.encode(char)[0])
+            )
+            probs[i, token] = prob
+    return (probs / probs.sum(dim=-1, keepdim=True)).log().T.unsqueeze(0)
+
+
+def test_beam_search_matches_greedy_on_peaked_probs(
+    tokenizer: CTCTextTokenizer,
+):
+    generator = torch.Generator().manual_seed(0)
+    logits = 10 * torch.randn(
+        4, tokenizer.alphabet_size, 30, generator=generator
+    )
+    log_probs = logits.log_softmax(dim=1)
+    lengths = torch.tensor([30, 25, 17, 1])
+    decoder = CTCBeamSearchDecoder(tokenizer=tokenizer, word_bonus=0.0)
+
+    assert decoder.decode_batch(log_probs, lengths) == (
+        tokenizer.ctc_decode_batch(log_probs.argmax(dim=1), lengths)
+    )
+
+
+def test_beam_search_merges_alignments(tokenizer: CTCTextTokenizer):
+    # Greedy decoding picks the blank, but "a" is more likely over both
+    # alignments "a ϵ" and "ϵ a" and "a a"
+    log_probs = _log_probs(
+        tokenizer, [{"a": 0.4, "ϵ": 0.6}, {"a": 0.4, "ϵ": 0.6}]
+    )
+    decoder = CTCBeamSearchDecoder(tokenizer=tokenizer, word_bonus=0.0)
+
+    assert not tokenizer.ctc_decode(log_probs.argmax(dim=1)[0])
+    assert decoder.decode_batch(log_probs) == ["a"]
+
+
+@pytest.mark.parametrize("unit", ["word", "char"])
+def test_language_model_rescores_beams(
+    tmp_path: Path,
+    tokenizer: CTCTextTokenizer,
+    unit: str,
+):
+    arpa = ARPA
+    if unit == "char":
+        arpa = arpa.replace("cab", "a").replace("cbb", "b")
+    arpa_path = tmp_path.joinpath("lm.arpa")
+    arpa_path.write_text(arpa)
+    lm = NGramLanguageModel(path=arpa_path, unit=unit)
+    frames = [{"c": 0.9}, {"ϵ": 0.9}, {"a": 0.45, "b": 0.55}, {"b": 0.9}]
+    if unit == "char":
+        frames = frames[2:3]
+    log_probs = _log_probs(tokenizer, frames)
+    decoder = CTCBeamSearchDecoder(tokenizer=tokenizer, word_bonus=0.0)
+    lm_decoder = CTCBeamSearchDecoder(
+        tokenizer=tokenizer, lm=lm, lm_weight=1.0, word_bonus=0.0
+    )
+
+    expected = "cab" if unit == "word" else "a"
+    assert decoder.decode_batch(log_probs) != [expected]
+    assert lm_decoder.decode_batch(log_probs) == [expected]
+
+
+def test_language_model_backs_off(tmp_path: Path):
+    arpa_path = tmp_path.joinpath("lm.arpa")
+    arpa_path.write_text(ARPA)
+    lm = NGramLanguageModel(path=arpa_path)
+
+    assert lm.order == 2
+    assert lm.score(("<s>",), "cab") == pytest.approx(-0.1 * np.log(10))
+    assert lm.score(("cbb",), "cab") == pytest.approx(-0.2 * np.log(10))
+    assert lm.score(("<s>",), "cbb") == pytest.approx(-3.3 * np.log(10))
+    assert lm.score(("<s>",), "dog") == pytest.approx(-2.3 * np.log(10))
+
+
+def test_unigram_language_model(tmp_path: Path):
+    arpa_path = tmp_path.joinpath("lm.arpa")
+    unigrams = ARPA[: ARPA.index("\\2-grams:")].replace("ngram 2=2\n", "")
+    arpa_path.write_text(unigrams + "\\end\\\n")
+    lm = NGramLanguageModel(path=arpa_path)
+
+    assert lm.order == 1
+    state = lm.initial_state
+    log_prob = 0.0
+    for char in "cab cbb cab ":
+        char_log_prob, state = lm.advance(state, char)
+        log_prob += char_log_prob
+        # The state does not grow with the text
+        assert state[0] == ()
+    assert log_prob == pytest.approx(-3.4 * np.log(10))
+    assert lm.finish(state) == pytest.approx(-1.0 * np.log(10))
+
+
+def test_beam_search_in_processes(tokenizer: CTCTextTokenizer):
+    generator = torch.Generator().manual_seed(0)
+    log_probs = torch.randn(
+        6, tokenizer.alphabet_size, 20, generator=generator
+    ).log_softmax(dim=1)
+    lengths = torch.tensor([20, 19, 15, 10, 5, 2])
+    decoder = CTCBeamSearchDecoder(tokenizer=tokenizer, num_workers=2)
+    try:
+        texts = decoder.decode_batch(log_probs, lengths)
+    finally:
+        decoder.close()
+
+    assert texts == CTCBeamSearchDecoder(tokenizer=tokenizer).decode_batch(
+        log_probs, lengths
+    )
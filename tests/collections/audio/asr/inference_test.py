@@ -0,0 +1,133 @@
+import json
+from pathlib import Path
+
+import pytest
+import torch
+import torchaudio.transforms as T
+from omegaconf import OmegaConf
+from torch import nn
+
+from src.domains.audio.asr.inference import (
+    TOKENIZER_FILENAME,
+    ASRInferenceModel,
+    ExportFormat,
+    export_asr_model,
+)
+from src.domains.audio.asr.model import ASRModel
+from src.domains.audio.dsp.features import ConvMelSpectrogram
+
+
+@pytest.fixture
+def asr_model() -> ASRModel:
+    config = OmegaConf.create(
+        {
+            "tokenizer": {
+                "_target_": (
+                    "src.domains.common.preprocessing.tokenizers"
+                    ".CTCTextTokenizer"
+                ),
+                "alphabet": list(" abcdefghijklmnopqrstuvwxyz"),
+            },
+            "model": {
+                "_target_": (
+                    "src.domains.audio.asr.models.quartznet.QuartzNet"
+                ),
+                "in_channels": 16,
+                "n_blocks": 1,
+                "n_repeats": 1,
+                "n_subblocks": 1,
+                "block_channels": [[32, 32]],
+                "block_kernel_sizes": [5],
+            },
+            "loss": {"_target_": "torch.nn.CTCLoss"},
+            "optimizer": {"_target_": "torch.optim.SGD", "lr": 0.1},
+        }
+    )
+    return ASRModel(**config, sample_rate=8000).eval()
+
+
+@pytest.fixture
+def transformer() -> T.MelSpectrogram:
+    return T.MelSpectrogram(
+        sample_rate=8000, n_fft=256, hop_length=80, n_mels=16
+    )
+
+
+def test_asr_inference_model_from_asr_model(
+    asr_model: ASRModel,
+    transformer: T.MelSpectrogram,
+):
+    inference_model = ASRInferenceModel.from_asr_model(
+        asr_model, transformer, downsize=2
+    )
+
+    modules = list(inference_model.modules())
+    assert not any(isinstance(m, nn.Dropout) for m in modules)
+    assert not any(isinstance(m, nn.BatchNorm1d) for m in modules)
+    # The trained model is left untouched
+    assert any(isinstance(m, nn.Dropout) for m in asr_model.modules())
+
+    waveforms = torch.randn(2, 8000)
+    log_probs, probs_lengths = inference_model(
+        waveforms, torch.tensor([8000, 4000])
+    )
+    assert log_probs.shape[:2] == (2, asr_model.tokenizer.alphabet_size)
+    assert probs_lengths.tolist() == [51, 26]
+
+
+@pytest.mark.parametrize(
+    "export_format",
+    [ExportFormat.TORCHSCRIPT, ExportFormat.ONNX],
+)
+def test_export_asr_model(
+    asr_model: ASRModel,
+    transformer: T.MelSpectrogram,
+    tmp_path: Path,
+    export_format: ExportFormat,
+):
+    if export_format == ExportFormat.ONNX:
+        pytest.importorskip("onnx")
+    paths = export_asr_model(
+        asr_model,
+        transformer,
+        downsize=2,
+        output_dir=tmp_path,
+        formats=[export_format],
+    )
+
+    assert paths[export_format].exists()
+    tokenizer = json.loads(tmp_path.joinpath(TOKENIZER_FILENAME).read_text())
+    assert tokenizer["sample_rate"] == 8000
+    assert tokenizer["blank_token"] == asr_model.tokenizer.blank_token
+    if export_format == ExportFormat.TORCHSCRIPT:
+        extra_files = {TOKENIZER_FILENAME: ""}
+        torch.jit.load(paths[export_format], _extra_files=extra_files)
+        assert json.loads(extra_files[TOKENIZER_FILENAME]) == tokenizer
+
+
+def test_export_asr_model_mismatch(
+    asr_model: ASRModel,
+    transformer: T.MelSpectrogram,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    # Front end computed with other mel filterbanks than the model is
+    # trained on
+    other_transformer = T.MelSpectrogram(
+        sample_rate=8000, n_fft=256, hop_length=80, n_mels=16, f_max=2000
+    )
+    from_transformer = ConvMelSpectrogram.from_transformer
+    monkeypatch.setattr(
+        ConvMelSpectrogram,
+        "from_transformer",
+        lambda _: from_transformer(other_transformer),
+    )
+
+    with pytest.raises(ValueError, match="differs from the eager model"):
+        export_asr_model(
+            asr_model,
+            transformer,
+            downsize=2,
+            output_dir=tmp_path,
+            formats=[ExportFormat.TORCHSCRIPT],
+        )
@@ -0,0 +1,75 @@
+import pytest
+import torch
+from omegaconf import OmegaConf
+
+from src.domains.audio.asr.model import ASRModel
+
+
+@pytest.fixture
+def asr_model() -> ASRModel:
+    config = OmegaConf.create(
+        {
+            "tokenizer": {
+                "_target_": (
+                    "src.domains.common.preprocessing.tokenizers"
+                    ".CTCTextTokenizer"
+                ),
+                "alphabet": list(" abcdefghijklmnopqrstuvwxyz"),
+            },
+            "model": {
+                "_target_": (
+                    "src.domains.audio.asr.models.quartznet.QuartzNet"
+                ),
+                "in_channels": 16,
+                "n_blocks": 1,
+                "n_repeats": 1,
+                "n_subblocks": 1,
+                "block_channels": [[32, 32]],
+                "block_kernel_sizes": [5],
+            },
+            "loss": {"_target_": "torch.nn.CTCLoss"},
+            "optimizer": {"_target_": "torch.optim.SGD", "lr": 0.1},
+        }
+    )
+    return ASRModel(
+        **config,
+        sample_rate=16000,
+        compile_model=True,
+        compile_pad_multiple=64,
+    )
+
+
+def _make_batch(n_frames: int) -> dict[str, torch.Tensor]:
+    transforms_lengths = torch.tensor([n_frames, n_frames // 2])
+    return {
+        "transforms": torch.randn(2, 16, n_frames),
+        "transforms_lengths": transforms_lengths,
+        "probs_lengths": (transforms_lengths + 1) // 2,
+    }
+
+
+def test_asr_model_pad_for_compile(asr_model: ASRModel):
+    batch = _make_batch(100)
+    transforms = batch["transforms"].clone()
+    probs_lengths = batch["probs_lengths"].clone()
+
+    padded = asr_model.on_after_batch_transfer(batch, 0)
+
+    assert padded["transforms"].shape == (2, 16, 128)
+    assert torch.equal(padded["transforms"][..., :100], transforms)
+    assert not padded["transforms"][..., 100:].any()
+    # Only the frames are padded, the valid lengths stay the same
+    assert torch.equal(padded["probs_lengths"], probs_lengths)
+
+
+def test_asr_model_compile_without_recompilation(asr_model: ASRModel):
+    # Graphs cached for QuartzNet by other tests would be reused
+    torch._dynamo.reset()
+    asr_model.setup("fit")
+    asr_model.train()
+    for n_frames in [100, 150]:
+        batch = asr_model.on_after_batch_transfer(_make_batch(n_frames), 0)
+        asr_model.model(batch["transforms"])
+
+    # Both lengths are handled by the graph compiled for training
+    assert asr_model._count_compiled_graphs() == 1
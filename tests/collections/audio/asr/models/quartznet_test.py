@@ -0,0 +1,100 @@
+import copy
+
+import pytest
+import torch
+from torch import nn
+
+from src.domains.audio.asr.models.quartznet import QuartzNet
+
+
+@pytest.fixture
+def model() -> QuartzNet:
+    model = QuartzNet(
+        in_channels=16,
+        out_channels=28,
+        n_blocks=2,
+        n_repeats=2,
+        n_subblocks=2,
+        block_channels=[(32, 32), (32, 64)],
+        block_kernel_sizes=[5, 7],
+    )
+    # Make the batch normalizations far from the identity
+    for module in model.modules():
+        if isinstance(module, nn.BatchNorm1d):
+            module.running_mean.uniform_(-1, 1)
+            module.running_var.uniform_(0.5, 2)
+            nn.init.uniform_(module.weight, 0.5, 1.5)
+            nn.init.uniform_(module.bias, -0.5, 0.5)
+    return model.eval()
+
+
+def test_quartznet_fuse_for_inference(model: QuartzNet):
+    transforms = torch.randn(3, 16, 50)
+    with torch.no_grad():
+        expected = model(transforms)
+        actual = model.fuse_for_inference()(transforms)
+
+    assert not any(isinstance(m, nn.BatchNorm1d) for m in model.modules())
+    assert torch.allclose(actual, expected, atol=1e-5)
+
+    # Fusing again is a no-op
+    with torch.no_grad():
+        assert torch.equal(model.fuse_for_inference()(transforms), actual)
+
+
+def test_quartznet_fuse_for_inference_in_training(model: QuartzNet):
+    with pytest.raises(ValueError, match="eval mode"):
+        model.train().fuse_for_inference()
+
+
+def test_quartznet_autocast(model: QuartzNet):
+    transforms = torch.randn(3, 16, 50)
+    with torch.no_grad():
+        expected = model(transforms)
+        with torch.autocast("cpu", dtype=torch.bfloat16):
+            actual = model(transforms)
+
+    assert actual.dtype == torch.float32
+    assert torch.allclose(actual.exp(), expected.exp(), atol=0.05)
+
+    model.train()
+    with torch.autocast("cpu", dtype=torch.bfloat16):
+        loss = nn.functional.ctc_loss(
+            model(transforms).permute(2, 0, 1),
+            torch.randint(0, 27, (3, 10)),
+            input_lengths=torch.full((3,), 25),
+            target_lengths=torch.full((3,), 10),
+            blank=27,
+        )
+    loss.backward()
+
+    assert loss.dtype == torch.float32
+    assert all(
+        parameter.grad is not None and parameter.grad.isfinite().all()
+        for parameter in model.parameters()
+    )
+
+
+@pytest.mark.parametrize("checkpoint_every", [1, 3])
+def test_quartznet_checkpointing(model: QuartzNet, checkpoint_every: int):
+    checkpointed_model = copy.deepcopy(model)
+    checkpointed_model.checkpoint_every = checkpoint_every
+    transforms = torch.randn(3, 16, 50)
+
+    gradients = []
+    for m in (model, checkpointed_model):
+        m.train()
+        # Same dropout masks in both models
+        torch.manual_seed(0)
+        m(transforms).sum().backward()
+        gradients.append([p.grad for p in m.parameters()])
+
+    assert all(
+        torch.allclose(expected, actual, atol=1e-5)
+        for expected, actual in zip(*gradients, strict=True)
+    )
+    # Running statistics are not updated again by the recomputation
+    for expected, actual in zip(
+        model.buffers(), checkpointed_model.buffers(), strict=True
+    ):
+        assert torch.equal(expected, actual)
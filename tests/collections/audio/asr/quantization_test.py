@@ -0,0 +1,70 @@
+import copy
+import json
+from pathlib import Path
+
+import torch
+import torchaudio.transforms as T
+
+from src.domains.audio.asr.inference import ASRInferenceModel
+from src.domains.audio.asr.models.quartznet import QuartzNet
+from src.domains.audio.asr.quantization import quantize_asr_model
+from src.domains.audio.dsp.features import ConvMelSpectrogram
+from src.domains.common.preprocessing.tokenizers import CTCTextTokenizer
+
+
+def test_quantize_asr_model(tmp_path: Path):
+    tokenizer = CTCTextTokenizer(alphabet=list(" abcdefghijklmnopqrstuvwxyz"))
+    model = QuartzNet(
+        in_channels=16,
+        out_channels=28,
+        n_blocks=2,
+        n_repeats=1,
+        n_subblocks=2,
+        block_channels=[(32, 32), (32, 64)],
+        block_kernel_sizes=[5, 7],
+    ).eval()
+    frontend = ConvMelSpectrogram.from_transformer(
+        T.MelSpectrogram(sample_rate=8000, n_fft=256, hop_length=80, n_mels=16)
+    )
+    fused_model = ASRInferenceModel(
+        frontend, copy.deepcopy(model).fuse_for_inference(), downsize=2
+    )
+    tokens, tokens_lengths = tokenizer.encode_batch(["a cat", "dog"])
+    batches = [
+        {
+            "waveforms": torch.randn(2, 8000),
+            "transforms_lengths": torch.tensor([101, 76]),
+            "probs_lengths": torch.tensor([51, 38]),
+            "tokens": tokens,
+            "tokens_lengths": tokens_lengths,
+        }
+        for _ in range(4)
+    ]
+
+    report = quantize_asr_model(
+        fused_model,
+        model,
+        tokenizer,
+        batches,
+        sample_rate=8000,
+        output_dir=tmp_path,
+        num_calibration_batches=2,
+        num_evaluation_batches=2,
+    )
+
+    assert set(report) == {"fp32", "int8"}
+    assert report["int8"]["speedup"] > 0
+    assert json.loads(
+        tmp_path.joinpath("quantization_report.json").read_text()
+    )
+    quantized_model = torch.jit.load(tmp_path.joinpath("model_int8.pt"))
+    waveforms = torch.randn(2, 8000)
+    waveforms_lengths = torch.tensor([8000, 6000])
+    with torch.no_grad():
+        log_probs, probs_lengths = quantized_model(
+            waveforms, waveforms_lengths
+        )
+        expected, expected_lengths = fused_model(waveforms, waveforms_lengths)
+    assert torch.equal(probs_lengths, expected_lengths)
+    # Quantization error is small relative to the probabilities
+    assert (log_probs.exp() - expected.exp()).abs().max() < 0.1
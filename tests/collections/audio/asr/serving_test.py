@@ -0,0 +1,145 @@
+import asyncio
+import io
+import json
+
+import pytest
+import soundfile as sf
+import torch
+import torchaudio.transforms as T
+
+from src.domains.audio.asr.inference import ASRInferenceModel
+from src.domains.audio.asr.models.quartznet import QuartzNet
+from src.domains.audio.asr.serving import ASRServer, Histogram
+from src.domains.audio.dsp.features import ConvMelSpectrogram
+from src.domains.common.preprocessing.tokenizers import CTCTextTokenizer
+
+
+def test_histogram():
+    histogram = Histogram(name="size", description="Size.", buckets=(1, 4))
+    for value in [1, 2, 5]:
+        histogram.observe(value)
+
+    assert histogram.render().splitlines()[2:] == [
+        'size_bucket{le="1"} 1',
+        'size_bucket{le="4"} 2',
+        'size_bucket{le="+Inf"} 3',
+        "size_sum 8",
+        "size_count 3",
+    ]
+
+
+async def _request(
+    port: int,
+    method: str,
+    path: str,
+    body: bytes = b"",
+) -> tuple[int, str]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    head = f"{method} {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\n"
+    writer.write(f"{head}\r\n".encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), payload.decode()
+
+
+@pytest.fixture
+def server() -> ASRServer:
+    model = QuartzNet(
+        in_channels=16,
+        out_channels=28,
+        n_blocks=1,
+        n_repeats=1,
+        n_subblocks=1,
+        block_channels=[(32, 32)],
+        block_kernel_sizes=[5],
+    ).eval()
+    transformer = T.MelSpectrogram(
+        sample_rate=8000, n_fft=256, hop_length=80, n_mels=16
+    )
+    return ASRServer(
+        inference_model=ASRInferenceModel(
+            ConvMelSpectrogram.from_transformer(transformer), model, 2
+        ),
+        tokenizer=CTCTextTokenizer(
+            alphabet=list(" abcdefghijklmnopqrstuvwxyz")
+        ),
+        sample_rate=8000,
+        max_latency=1.0,
+        num_workers=2,
+    )
+
+
+def test_asr_server(server: ASRServer):
+    uploads = []
+    for n_samples in [4000, 8000, 6000]:
+        upload = io.BytesIO()
+        sf.write(upload, torch.randn(n_samples).numpy(), 8000, format="WAV")
+        uploads.append(upload.getvalue())
+
+    async def run() -> list[tuple[int, str]]:
+        http_server = await server.start("127.0.0.1", 0)
+        port = http_server.sockets[0].getsockname()[1]
+        try:
+            responses = await asyncio.gather(
+                *[_request(port, "POST", "/transcribe", u) for u in uploads],
+                _request(port, "POST", "/transcribe", b"not audio"),
+            )
+            responses.append(await _request(port, "GET", "/metrics"))
+        finally:
+            http_server.close()
+            server.stop()
+        return responses
+
+    *transcriptions, invalid, metrics = asyncio.run(run())
+
+    for (status, payload), n_samples in zip(
+        transcriptions, [4000, 8000, 6000], strict=True
+    ):
+        assert status == 200
+        assert json.loads(payload)["audio_duration"] == n_samples / 8000
+    assert invalid[0] == 422
+    # The valid uploads are coalesced into a single batch
+    assert metrics[0] == 200
+    assert "asr_batch_size_count 1" in metrics[1]
+    assert 'asr_batch_size_bucket{le="2"} 0' in metrics[1]
+
+
+def test_asr_server_unexpected_error(
+    server: ASRServer,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    upload = io.BytesIO()
+    sf.write(upload, torch.randn(4000).numpy(), 8000, format="WAV")
+    predict = ASRServer._predict
+    failures = iter([True])
+
+    def failing_predict(
+        self: ASRServer,
+        transforms: list[torch.Tensor],
+    ) -> list[str]:
+        if next(failures, False):
+            msg = "Unexpected"
+            raise TypeError(msg)
+        return predict(self, transforms)
+
+    monkeypatch.setattr(ASRServer, "_predict", failing_predict)
+
+    async def run() -> list[tuple[int, str]]:
+        http_server = await server.start("127.0.0.1", 0)
+        port = http_server.sockets[0].getsockname()[1]
+        try:
+            return [
+                await _request(port, "POST", "/transcribe", upload.getvalue())
+                for _ in range(2)
+            ]
+        finally:
+            http_server.close()
+            server.stop()
+
+    failed, transcribed = asyncio.run(run())
+
+    assert failed[0] == 500
+    # The batching loop keeps serving requests after the failure
+    assert transcribed[0] == 200
@@ -0,0 +1,146 @@
+import json
+from pathlib import Path
+
+import pytest
+import soundfile as sf
+import torch
+import torchaudio.transforms as T
+
+from src.domains.audio.asr.inference import ASRInferenceModel
+from src.domains.audio.asr.models.quartznet import QuartzNet
+from src.domains.audio.asr.transcription import (
+    ChunkedTranscriber,
+    find_audio_files,
+    transcribe_audio_files,
+    transcribe_long_audio_files,
+)
+from src.domains.audio.dsp.features import ConvMelSpectrogram
+from src.domains.common.preprocessing.tokenizers import CTCTextTokenizer
+
+
+def test_find_audio_files(tmp_path: Path):
+    for name in ["b/2.flac", "a/1.WAV", "a/notes.txt"]:
+        tmp_path.joinpath(name).parent.mkdir(exist_ok=True)
+        tmp_path.joinpath(name).touch()
+    manifest_path = tmp_path.joinpath("manifest.txt")
+    manifest_path.write_text("a/1.WAV\n\nb/2.flac\n")
+
+    expected = [str(tmp_path / "a/1.WAV"), str(tmp_path / "b/2.flac")]
+    assert find_audio_files(tmp_path) == expected
+    assert find_audio_files(manifest_path) == expected
+    with pytest.raises(FileNotFoundError):
+        find_audio_files(tmp_path / "missing")
+
+
+@pytest.fixture
+def tokenizer() -> CTCTextTokenizer:
+    return CTCTextTokenizer(alphabet=list(" abcdefghijklmnopqrstuvwxyz"))
+
+
+@pytest.fixture
+def inference_model() -> ASRInferenceModel:
+    model = QuartzNet(
+        in_channels=16,
+        out_channels=28,
+        n_blocks=2,
+        n_repeats=1,
+        n_subblocks=2,
+        block_channels=[(32, 32), (32, 64)],
+        block_kernel_sizes=[5, 7],
+    ).eval()
+    transformer = T.MelSpectrogram(
+        sample_rate=8000, n_fft=256, hop_length=80, n_mels=16
+    )
+    return ASRInferenceModel(
+        ConvMelSpectrogram.from_transformer(transformer), model, downsize=2
+    )
+
+
+@pytest.mark.parametrize(
+    ("chunk_duration", "block_size"),
+    [(0.5, 1000), (1.0, 37), (100.0, 8000)],
+)
+def test_chunked_transcriber(
+    inference_model: ASRInferenceModel,
+    tokenizer: CTCTextTokenizer,
+    chunk_duration: float,
+    block_size: int,
+):
+    transcriber = ChunkedTranscriber(
+        inference_model=inference_model,
+        tokenizer=tokenizer,
+        sample_rate=8000,
+        chunk_duration=chunk_duration,
+    )
+    waveform = torch.randn(8000 * 3 + 123)
+    blocks = waveform.split(block_size)
+
+    with torch.no_grad():
+        expected, probs_lengths = inference_model(
+            waveform.unsqueeze(0), torch.tensor([len(waveform)])
+        )
+    expected = expected[0, :, : probs_lengths[0]].T
+    log_probs = torch.cat(list(transcriber.stream_log_probs(blocks)))
+
+    assert torch.allclose(log_probs, expected, atol=1e-4)
+    assert "".join(transcriber.transcribe(blocks)) == tokenizer.ctc_decode(
+        expected.argmax(dim=-1)
+    )
+
+
+@pytest.mark.parametrize("num_workers", [0, 2])
+def test_transcribe_audio_files(
+    inference_model: ASRInferenceModel,
+    tokenizer: CTCTextTokenizer,
+    tmp_path: Path,
+    num_workers: int,
+):
+    durations = [0.5, 2.0, 1.0, 0.25, 1.5]
+    audio_paths = []
+    for i, duration in enumerate(durations):
+        audio_path = str(tmp_path.joinpath(f"{i}.wav"))
+        sf.write(audio_path, torch.rand(int(8000 * duration)).numpy(), 8000)
+        audio_paths.append(audio_path)
+    output_path = tmp_path.joinpath("transcripts.jsonl")
+
+    transcribe_audio_files(
+        inference_model,
+        tokenizer,
+        audio_paths,
+        output_path=output_path,
+        sample_rate=8000,
+        batch_max_duration=2.0,
+        num_workers=num_workers,
+        sort_window_size=2,
+    )
+
+    records = [
+        json.loads(line) for line in output_path.read_text().splitlines()
+    ]
+    # Files are only sorted by duration within windows of 2 files
+    assert [record["audio_path"] for record in records] == [
+        audio_paths[i] for i in [0, 1, 3, 2, 4]
+    ]
+    assert [record["audio_duration"] for record in records] == [
+        durations[i] for i in [0, 1, 3, 2, 4]
+    ]
+
+    long_output_path = tmp_path.joinpath("long_transcripts.jsonl")
+    transcribe_long_audio_files(
+        ChunkedTranscriber(
+            inference_model=inference_model,
+            tokenizer=tokenizer,
+            sample_rate=8000,
+            chunk_duration=0.5,
+        ),
+        audio_paths,
+        output_path=long_output_path,
+    )
+
+    long_records = [
+        json.loads(line) for line in long_output_path.read_text().splitlines()
+    ]
+    assert [record["audio_duration"] for record in long_records] == durations
+    assert [record["text"] for record in long_records] == [
+        records[[0, 1, 3, 2, 4].index(i)]["text"] for i in range(5)
+    ]
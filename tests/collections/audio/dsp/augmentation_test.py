@@ -1,8 +1,14 @@
+import math
+
 import pytest
 import torch
 
 from src.domains.audio.dsp.audio import load_waveform
-from src.domains.audio.dsp.augmentation import AudioAugmenter
+from src.domains.audio.dsp.augmentation import (
+    AudioAugmenter,
+    BatchAudioAugmenter,
+    BatchSpecAugmenter,
+)
 from src.utils.env import BASE_DIR
 
 
@@ -74,3 +80,164 @@ def test_audio_augmenter_with_background_noise(sample_waveform: torch.Tensor):
     assert isinstance(
         augmented_waveform, torch.Tensor
     ), "Returned augmented waveform is not a tensor"
+
+
+@pytest.fixture
+def batch_augmenter() -> BatchAudioAugmenter:
+    # Assets are passed so that nothing is downloaded
+    return BatchAudioAugmenter(
+        sample_rate=16000,
+        prob=1.0,
+        rir=torch.rand(1, 100),
+        noise=torch.randn(1, 4000),
+    )
+
+
+@pytest.fixture
+def sines() -> tuple[torch.Tensor, torch.Tensor]:
+    lengths = torch.tensor([16000, 8000])
+    times = torch.arange(16000) / 16000
+    waveforms = torch.stack(
+        [
+            torch.sin(2 * math.pi * 440 * times),
+            torch.sin(2 * math.pi * 300 * times),
+        ]
+    )
+    waveforms[1, 8000:] = 0
+    return waveforms, lengths
+
+
+def _peak_frequency(waveform: torch.Tensor) -> float:
+    return (
+        torch.fft.rfft(waveform).abs().argmax().item() * 16000 / len(waveform)
+    )
+
+
+def test_batch_augmenter_tempo_change(
+    batch_augmenter: BatchAudioAugmenter,
+    sines: tuple[torch.Tensor, torch.Tensor],
+):
+    waveforms, lengths = sines
+    stretched, stretched_lengths = batch_augmenter._stretch(
+        waveforms,
+        lengths,
+        rates=torch.tensor([1.25, 0.8]),
+    )
+
+    assert stretched_lengths.tolist() == [12800, 10000]
+    assert stretched.shape == (2, 12800)
+    assert stretched[1, 10000:].abs().max() == 0
+    # Only the duration changes
+    for waveform, length, frequency in zip(
+        stretched, stretched_lengths, [440, 300], strict=True
+    ):
+        assert _peak_frequency(waveform[:length]) == pytest.approx(
+            frequency, abs=2
+        )
+
+
+def test_batch_augmenter_pitch_shift(
+    batch_augmenter: BatchAudioAugmenter,
+    sines: tuple[torch.Tensor, torch.Tensor],
+):
+    waveforms, lengths = sines
+    batch_augmenter.max_pitch_shift = 100
+    shifted, shifted_lengths = batch_augmenter._shift_pitch(waveforms, lengths)
+
+    assert torch.equal(shifted_lengths, lengths)
+    assert shifted.shape == waveforms.shape
+    assert shifted[1, 8000:].abs().max() == 0
+    assert 400 < _peak_frequency(shifted[0]) < 480
+
+
+def test_batch_augmenter_background_noise(
+    batch_augmenter: BatchAudioAugmenter,
+    sines: tuple[torch.Tensor, torch.Tensor],
+):
+    waveforms, lengths = sines
+    noisy, _ = batch_augmenter._add_background_noise(waveforms, lengths)
+
+    noise = noisy - waveforms
+    for waveform, noise_waveform, length in zip(
+        waveforms, noise, lengths, strict=True
+    ):
+        snr_db = 10 * torch.log10(
+            waveform[:length].square().sum()
+            / noise_waveform[:length].square().sum()
+        )
+        assert snr_db.item() == pytest.approx(10, abs=1e-3) or (
+            snr_db.item() == pytest.approx(20, abs=1e-3)
+        )
+    assert noisy[1, 8000:].abs().max() == 0
+
+
+def test_batch_augmenter_masks_padding(
+    batch_augmenter: BatchAudioAugmenter,
+    sines: tuple[torch.Tensor, torch.Tensor],
+):
+    waveforms, lengths = sines
+    for _ in range(5):
+        augmented, augmented_lengths = batch_augmenter(waveforms, lengths)
+
+        assert augmented.shape == (2, augmented_lengths.max())
+        samples = torch.arange(augmented.shape[-1])
+        padding = samples >= augmented_lengths.unsqueeze(-1)
+        assert not augmented[padding].any()
+
+
+@pytest.fixture
+def transforms() -> tuple[torch.Tensor, torch.Tensor]:
+    lengths = torch.tensor([200, 60, 3])
+    frames = torch.arange(200)
+    transforms = torch.rand(3, 40, 200) + 1
+    transforms *= (frames < lengths.unsqueeze(-1)).unsqueeze(1)
+    return transforms, lengths
+
+
+def test_batch_spec_augmenter_masks(
+    transforms: tuple[torch.Tensor, torch.Tensor],
+):
+    transforms, lengths = transforms
+    augmenter = BatchSpecAugmenter(
+        prob=1.0,
+        max_time_warp=0,
+        max_freq_mask=10,
+        max_time_mask=20,
+        max_time_mask_ratio=0.2,
+    )
+    augmented = augmenter(transforms, lengths)
+
+    masked = augmented == 0
+    # Frames past the lengths of the shorter transforms stay zero
+    padding = torch.arange(200) >= lengths.unsqueeze(-1)
+    assert padding.sum() == 140 + 197
+    assert masked.transpose(1, 2)[padding].all()
+    for frame_masked, freq_masked, length in zip(
+        masked.all(dim=1), masked.all(dim=2), lengths, strict=True
+    ):
+        # Time masks stay within the valid frames
+        assert frame_masked[:length].sum() <= 2 * int(0.2 * length)
+        assert frame_masked[length:].all()
+        assert freq_masked.sum() <= 2 * 10
+    assert torch.equal(augmented[~masked], transforms[~masked])
+
+
+def test_batch_spec_augmenter_time_warp(
+    transforms: tuple[torch.Tensor, torch.Tensor],
+):
+    transforms, lengths = transforms
+    augmenter = BatchSpecAugmenter(
+        prob=1.0,
+        max_time_warp=20,
+        n_freq_masks=0,
+        n_time_masks=0,
+    )
+    warped = augmenter(transforms, lengths)
+
+    padding = torch.arange(200) >= lengths.unsqueeze(-1)
+    assert not warped.transpose(1, 2)[padding].any()
+    # Warped frames are interpolated from the valid frames
+    assert warped.transpose(1, 2)[~padding].min() >= 1
+
+    augmenter.prob = 0.0
+    assert torch.allclose(augmenter(transforms, lengths), transforms)
@@ -0,0 +1,26 @@
+import pytest
+import torch
+import torchaudio.transforms as T
+
+from src.domains.audio.dsp.features import ConvMelSpectrogram
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [{}, {"win_length": 400, "power": 1.0, "normalized": True}],
+)
+def test_conv_mel_spectrogram(kwargs: dict[str, float]):
+    transformer = T.MelSpectrogram(
+        sample_rate=16000,
+        n_fft=512,
+        hop_length=160,
+        n_mels=40,
+        **kwargs,
+    )
+    waveforms = torch.randn(2, 16000)
+
+    expected = transformer(waveforms)
+    actual = ConvMelSpectrogram.from_transformer(transformer)(waveforms)
+
+    assert actual.shape == expected.shape
+    assert torch.allclose(actual, expected, rtol=1e-4, atol=1e-4)
@@ -1,4 +1,7 @@
+import itertools
+
 import pytest
+import torch
 
 from src.domains.common.preprocessing.tokenizers import CTCTextTokenizer
 
@@ -23,3 +26,59 @@ def test_ctc_tokenizer_decode(input_text: str, expected_text: str):
     assert (
         decoded_text_raw == input_text
     ), f'Decoded text "{decoded_text_raw}" does not match "{input_text}"'
+
+
+def test_ctc_tokenizer_decode_batch():
+    tokenizer = CTCTextTokenizer(alphabet=list("abcdefghijklmnopqrstuvwxyz "))
+    texts = ["heϵϵϵllllϵϵϵϵllllϵo", "ϵwwϵorllϵd", "aaϵa"]
+    lengths = torch.tensor([len(text) for text in texts])
+    tokens = torch.full((3, int(lengths.max())), tokenizer.encode("z").item())
+    for i, text in enumerate(texts):
+        tokens[i, : len(text)] = tokenizer.encode(text)[0]
+
+    assert tokenizer.ctc_decode_batch(tokens, lengths) == [
+        "hello",
+        "world",
+        "aa",
+    ]
+    assert tokenizer.ctc_decode_batch(tokens)[2] == "aaz"
+
+
+def _reference_ctc_decode(
+    tokenizer: CTCTextTokenizer, tokens: list[int]
+) -> str:
+    # Collapse runs of a token, then drop the blanks, one sample at a time
+    return "".join(
+        tokenizer.decode(torch.tensor([token]))
+        for token, _ in itertools.groupby(tokens)
+        if token != tokenizer.blank_token
+    )
+
+
+def test_ctc_tokenizer_decode_batch_reference():
+    tokenizer = CTCTextTokenizer(alphabet=list("abc "))
+    generator = torch.Generator().manual_seed(0)
+    tokens = torch.randint(
+        0, tokenizer.alphabet_size, (16, 40), generator=generator
+    )
+    lengths = torch.randint(0, 41, (16,), generator=generator)
+
+    assert tokenizer.ctc_decode_batch(tokens, lengths) == [
+        _reference_ctc_decode(tokenizer, row[:length].tolist())
+        for row, length in zip(tokens, lengths, strict=True)
+    ]
+
+
+def test_tokenizer_encode_decode_batch():
+    tokenizer = CTCTextTokenizer(alphabet=list("abcdefghijklmnopqrstuvwxyz "))
+    texts = ["hello world", "", "ϵa"]
+    tokens, lengths = tokenizer.encode_batch(texts)
+
+    assert tokens.shape == (3, 11)
+    assert lengths.tolist() == [11, 0, 2]
+    assert torch.equal(tokens[0], tokenizer.encode(texts[0])[0])
+    assert not tokens[1].any()
+    assert tokenizer.decode_batch(tokens, lengths) == texts
+    assert tokenizer.decode_batch(tokens)[2] == "ϵa" + " " * 9
+    with pytest.raises(KeyError):
+        tokenizer.encode("Hello")
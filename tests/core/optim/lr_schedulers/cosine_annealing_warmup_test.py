@@ -0,0 +1,110 @@
+import math
+
+import pytest
+import torch
+from torch import nn
+
+from src.core.optim.lr_schedulers import CosineAnnealingWarmupLRScheduler
+
+MIN_LR, MAX_LR = 0.001, 0.05
+
+
+def _replay(
+    n_steps: int,
+    first_cycle_steps: int,
+    cycle_multiplier: float,
+    warmup_steps: int,
+    gamma: float,
+) -> list[float]:
+    # Learning rates after every step, advancing the cycles step by step
+    lrs, cycle, step_in_cycle, cycle_steps = [], 0, 0, first_cycle_steps
+    for _ in range(n_steps):
+        max_lr = MAX_LR * gamma**cycle
+        if step_in_cycle < warmup_steps:
+            progress = step_in_cycle / warmup_steps
+            lrs.append(MIN_LR + (max_lr - MIN_LR) * progress)
+        else:
+            progress = (step_in_cycle - warmup_steps) / (
+                cycle_steps - warmup_steps
+            )
+            lrs.append(
+                MIN_LR
+                + (max_lr - MIN_LR) * (1 + math.cos(math.pi * progress)) / 2
+            )
+        step_in_cycle += 1
+        if step_in_cycle >= cycle_steps:
+            cycle += 1
+            step_in_cycle -= cycle_steps
+            cycle_steps = (
+                int((cycle_steps - warmup_steps) * cycle_multiplier)
+                + warmup_steps
+            )
+    return lrs
+
+
+def _make_scheduler(
+    last_epoch: int = -1,
+    **kwargs: float,
+) -> CosineAnnealingWarmupLRScheduler:
+    optimizer = torch.optim.SGD([nn.Parameter(torch.zeros(1))], lr=MAX_LR)
+    if last_epoch != -1:
+        optimizer.param_groups[0]["initial_lr"] = MAX_LR
+    return CosineAnnealingWarmupLRScheduler(
+        optimizer,
+        min_lr=MIN_LR,
+        max_lr=MAX_LR,
+        last_epoch=last_epoch,
+        **kwargs,
+    )
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"first_cycle_steps": 10, "warmup_steps": 3},
+        {
+            "first_cycle_steps": 10,
+            "warmup_steps": 3,
+            "cycle_multiplier": 1.5,
+            "gamma": 0.5,
+        },
+        {"first_cycle_steps": 7, "cycle_multiplier": 2.0, "gamma": 0.9},
+        {"first_cycle_steps": 8, "warmup_steps": 2, "cycle_multiplier": 1.1},
+    ],
+)
+def test_cosine_annealing_warmup_lr_at(kwargs: dict):
+    scheduler = _make_scheduler(**kwargs)
+    expected = _replay(
+        200,
+        kwargs["first_cycle_steps"],
+        kwargs.get("cycle_multiplier", 1.0),
+        kwargs.get("warmup_steps", 0),
+        kwargs.get("gamma", 1.0),
+    )
+
+    lrs = []
+    for _ in range(200):
+        lrs.append(scheduler.optimizer.param_groups[0]["lr"])
+        scheduler.step()
+
+    assert torch.allclose(
+        scheduler.lr_at(torch.arange(200)),
+        torch.tensor(expected, dtype=torch.float64),
+    )
+    assert lrs == pytest.approx(expected)
+
+    # Resuming jumps to the learning rate of the step
+    resumed_scheduler = _make_scheduler(last_epoch=150, **kwargs)
+    assert resumed_scheduler.get_last_lr() == pytest.approx([expected[151]])
+
+
+def test_cosine_annealing_warmup_lr_at_long_schedule():
+    scheduler = _make_scheduler(
+        first_cycle_steps=2000, warmup_steps=1000, cycle_multiplier=1.2
+    )
+
+    lrs = scheduler.lr_at(torch.arange(1_000_000))
+
+    assert lrs.shape == (1_000_000,)
+    assert lrs.min() >= MIN_LR
+    assert lrs.max() <= MAX_LR
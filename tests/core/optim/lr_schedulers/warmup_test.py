@@ -0,0 +1,23 @@
+import pytest
+import torch
+from torch import nn
+
+from src.core.optim.lr_schedulers import WarmupLRScheduler
+
+
+def test_warmup_lr_scheduler():
+    optimizer = torch.optim.SGD([nn.Parameter(torch.zeros(1))], lr=0.1)
+    scheduler = WarmupLRScheduler(
+        optimizer, initial_lr=0.001, peak_lr=0.011, warmup_steps=10
+    )
+
+    lrs = [optimizer.param_groups[0]["lr"]]
+    for _ in range(14):
+        scheduler.step()
+        lrs.append(optimizer.param_groups[0]["lr"])
+
+    expected = [0.001 + 0.001 * min(step, 10) for step in range(15)]
+    assert lrs == pytest.approx(expected)
+    assert scheduler.lr_at(torch.arange(15)).tolist() == pytest.approx(
+        expected
+    )
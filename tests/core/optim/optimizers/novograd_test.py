@@ -0,0 +1,55 @@
+import copy
+
+import pytest
+import torch
+from torch import nn
+
+from src.core.optim.optimizers import Novograd
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {},
+        {"weight_decay": 0.001},
+        {"amsgrad": True, "grad_averaging": True},
+    ],
+)
+def test_novograd_foreach(kwargs: dict):
+    torch.manual_seed(0)
+    model = nn.Sequential(
+        nn.Conv1d(4, 8, kernel_size=3),
+        nn.BatchNorm1d(8),
+        nn.Conv1d(8, 2, kernel_size=1),
+    )
+    foreach_model = copy.deepcopy(model)
+    optimizer = Novograd(model.parameters(), lr=0.01, **kwargs)
+    foreach_optimizer = Novograd(
+        foreach_model.parameters(), lr=0.01, foreach=True, **kwargs
+    )
+
+    for step in range(5):
+        inputs = torch.randn(3, 4, 10)
+        for m, opt in ((model, optimizer), (foreach_model, foreach_optimizer)):
+            opt.zero_grad()
+            m(inputs).square().mean().backward()
+            if step == 1:
+                # Parameters without gradients are skipped
+                m[2].bias.grad = None
+            opt.step()
+
+    for expected, actual in zip(
+        model.parameters(), foreach_model.parameters(), strict=True
+    ):
+        assert torch.allclose(actual, expected, atol=1e-6)
+    for p, foreach_p in zip(
+        model.parameters(), foreach_model.parameters(), strict=True
+    ):
+        assert (
+            optimizer.state[p]["step"]
+            == foreach_optimizer.state[foreach_p]["step"]
+        )
+        assert torch.allclose(
+            optimizer.state[p]["exp_avg_sq"],
+            foreach_optimizer.state[foreach_p]["exp_avg_sq"],
+        )
@@ -0,0 +1,91 @@
+import copy
+import socket
+
+import pytest
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch import nn
+from torch.nn.parallel import DistributedDataParallel
+
+from src.core.optim.optimizers import Novograd, ShardedNovograd
+
+WORLD_SIZE = 2
+N_STEPS = 4
+
+
+def _make_model() -> nn.Module:
+    torch.manual_seed(0)
+    return nn.Sequential(
+        nn.Conv1d(4, 16, kernel_size=3),
+        nn.ReLU(),
+        nn.Conv1d(16, 16, kernel_size=3),
+        nn.ReLU(),
+        nn.Conv1d(16, 2, kernel_size=1),
+    )
+
+
+def _make_batches() -> list[torch.Tensor]:
+    generator = torch.Generator().manual_seed(1)
+    return [
+        torch.randn(2 * WORLD_SIZE, 4, 12, generator=generator)
+        for _ in range(N_STEPS)
+    ]
+
+
+def _train(rank: int, port: int, expected: list[torch.Tensor]) -> None:
+    dist.init_process_group(
+        "gloo",
+        init_method=f"tcp://127.0.0.1:{port}",
+        rank=rank,
+        world_size=WORLD_SIZE,
+    )
+    try:
+        # The model is freed before its process group is destroyed
+        _check_sharded_training(rank, expected)
+    finally:
+        dist.destroy_process_group()
+
+
+def _check_sharded_training(rank: int, expected: list[torch.Tensor]) -> None:
+    model = DistributedDataParallel(_make_model())
+    optimizer = ShardedNovograd(
+        model.parameters(), lr=0.01, weight_decay=0.001, foreach=True
+    )
+    for inputs in _make_batches():
+        optimizer.zero_grad()
+        model(inputs.chunk(WORLD_SIZE)[rank]).square().mean().backward()
+        optimizer.step()
+
+    # Every rank keeps the state of its own parameters only
+    n_local = torch.tensor(len(optimizer.local_state))
+    assert 0 < n_local < len(expected)
+    dist.all_reduce(n_local)
+    assert n_local == len(expected)
+    for actual, expected_param in zip(
+        model.parameters(), expected, strict=True
+    ):
+        assert torch.allclose(actual, expected_param, atol=1e-6)
+
+
+@pytest.mark.skipif(
+    not dist.is_available(), reason="torch.distributed is unavailable"
+)
+def test_sharded_novograd():
+    model = _make_model()
+    optimizer = Novograd(model.parameters(), lr=0.01, weight_decay=0.001)
+    for inputs in _make_batches():
+        optimizer.zero_grad()
+        model(inputs).square().mean().backward()
+        optimizer.step()
+    expected = [copy.deepcopy(p.detach()) for p in model.parameters()]
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    mp.spawn(_train, args=(port, expected), nprocs=WORLD_SIZE)
+
+
+def test_sharded_novograd_without_process_group():
+    with pytest.raises(RuntimeError, match="process group"):
+        ShardedNovograd(_make_model().parameters())